@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Simulated gcloud, ssh, nc and remmina for offline benchmarks.
+
+run_benchmarks.py puts wrappers named after the real tools on PATH; each one
+execs this file with the tool name as first argument. Behaviour is driven by
+environment variables:
+
+  BENCH_STATE_DIR             directory with fleet.json and the call log
+  BENCH_LATENCY_<TOOL>_MS     added latency per call, e.g. BENCH_LATENCY_GCLOUD_MS
+  BENCH_FAILURE_RATE          probability (0..1) that a call fails
+  BENCH_SEED                  seed for the failure dice
+"""
+import sys, os, json, random, time, fcntl
+
+STATE_DIR = os.environ["BENCH_STATE_DIR"]
+
+
+def log_call(tool, args):
+    with open(os.path.join(STATE_DIR, "calls.log"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps({'tool': tool, 'args': args, 'time': time.time()}) + "\n")
+
+
+def simulate(tool):
+    time.sleep(int(os.environ.get(f"BENCH_LATENCY_{tool.upper()}_MS", "0")) / 1000)
+    rate = float(os.environ.get("BENCH_FAILURE_RATE", "0"))
+    dice = random.Random(f"{os.environ.get('BENCH_SEED', '0')}-{os.getpid()}-{time.time()}")
+    return dice.random() >= rate
+
+
+def load_fleet():
+    with open(os.path.join(STATE_DIR, "fleet.json"), 'r') as f:
+        return json.load(f)
+
+
+def set_status(target, status):
+    """Persist a status change of one instance, safe against concurrent calls"""
+    with open(os.path.join(STATE_DIR, "fleet.json"), "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        fleet = json.load(f)
+        for vm in fleet:
+            if (vm['name'], vm['project'], vm['zone']) == (target['name'], target['project'], target['zone']):
+                vm['status'] = status
+        f.seek(0)
+        f.truncate()
+        json.dump(fleet, f)
+
+
+def option(args, name, default=None):
+    for arg in args:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def find_instance(args):
+    name = next(a for a in args[3:] if not a.startswith("-"))
+    project, zone = option(args, "project"), option(args, "zone")
+    for vm in load_fleet():
+        if (vm['name'], vm['project'], vm['zone']) == (name, project, zone):
+            return vm
+    return None
+
+
+def gcloud(args):
+    if args[:2] == ["auth", "print-access-token"]:
+        print("fake-token")
+        return 0
+    if args[:2] != ["compute", "instances"] or len(args) < 3:
+        print(f"ERROR: (gcloud) unsupported fake command: {' '.join(args)}", file=sys.stderr)
+        return 2
+
+    command = args[2]
+    if command == "list":
+        project = option(args, "project")
+        zones = set(option(args, "zones", "").split(",")) - {""}
+        name_filter = option(args, "filter", "")
+        names = set(name_filter[name_filter.find("(") + 1:name_filter.rfind(")")].split()) if "(" in name_filter else None
+        for vm in load_fleet():
+            if vm['project'] != project or (zones and vm['zone'] not in zones):
+                continue
+            if names is not None and vm['name'] not in names:
+                continue
+            print(f"{vm['name']}\t{vm['zone']}\t{vm['status']}\t{vm['ip']}")
+        return 0
+
+    vm = find_instance(args)
+    if vm is None:
+        print("ERROR: (gcloud.compute.instances) Could not fetch resource: was not found", file=sys.stderr)
+        return 1
+    if command == "describe":
+        fmt = option(args, "format", "")
+        if fmt.startswith("get("):
+            print(vm['ip'])
+        elif "natIP" in fmt:
+            print(f"{vm['status']}\t{vm['ip']}")
+        else:
+            print(vm['status'])
+        return 0
+    if command in ("start", "stop"):
+        set_status(vm, "RUNNING" if command == "start" else "TERMINATED")
+        print(f"Updated [https://compute.googleapis.com/compute/v1/projects/{vm['project']}/zones/{vm['zone']}/instances/{vm['name']}].", file=sys.stderr)
+        return 0
+    print(f"ERROR: (gcloud) unsupported fake command: {command}", file=sys.stderr)
+    return 2
+
+
+def vnc_flag(host):
+    return os.path.join(STATE_DIR, f"vnc-{host}")
+
+
+def read_vnc_flag(host):
+    """Geometry of the VNC server and whether it only accepts local connections"""
+    with open(vnc_flag(host)) as f:
+        lines = f.read().splitlines() or [""]
+    return lines[0].strip(), "localhost" in lines[1:]
+
+
+def ssh(args):
+    if "-O" in args:
+        master = os.path.join(STATE_DIR, "ssh-master")
+        if not os.path.exists(master):
+            return 255
+        if args[args.index("-O") + 1] == "exit":
+            os.remove(master)
+        return 0
+    if "-fN" in args:
+        open(os.path.join(STATE_DIR, "ssh-master"), "w").close()
+        return 0
+    target = next(a for a in reversed(args) if "@" in a)
+    host = target.split("@", 1)[1]
+    command = args[-1]
+    if "vncserver -kill" in command:
+        if os.path.exists(vnc_flag(host)):
+            os.remove(vnc_flag(host))
+        return 0
+    if command.startswith("head -c"):
+        # Link measurement download
+        sys.stdout.buffer.write(b"\0" * int(command.split()[2]))
+        return 0
+    if "/dev/tcp/127.0.0.1/" in command:
+        # Port probe on the VM itself, which also reaches a localhost-only server
+        return 0 if os.path.exists(vnc_flag(host)) else 1
+    if command.startswith("ps "):
+        # Running VNC server, with the geometry it was started with
+        if os.path.exists(vnc_flag(host)):
+            geometry = read_vnc_flag(host)[0]
+            print(f"/usr/bin/Xtigervnc :1 -desktop bench:1 (user) -geometry {geometry} -depth 24 -rfbport 5901")
+        return 0
+    if command.startswith("vncserver"):
+        with open(vnc_flag(host), "w") as f:
+            f.write(command.split("-geometry ", 1)[1].split()[0] if "-geometry " in command else "")
+            if "-localhost yes" in command:
+                f.write("\nlocalhost")
+        print(f"New 'bench:1 (user)' desktop at :1 on machine {host}")
+        return 0
+    return 0
+
+
+def nc(args):
+    host, port = args[-2], args[-1]
+    if port == "22":
+        return 0
+    return 0 if os.path.exists(vnc_flag(host)) and not read_vnc_flag(host)[1] else 1
+
+
+def main():
+    tool, args = sys.argv[1], sys.argv[2:]
+    log_call(tool, args)
+    if not simulate(tool):
+        if tool == "gcloud":
+            print("ERROR: (gcloud) Rate Limit Exceeded (simulated failure)", file=sys.stderr)
+        return 1
+    return {'gcloud': gcloud, 'ssh': ssh, 'nc': nc}.get(tool, lambda args: 0)(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
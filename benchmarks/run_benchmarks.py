@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for the status poller and the start flow.
+
+Fake gcloud, ssh, nc and remmina executables (see fake_tools.py) are put on
+PATH with configurable latency, failure rate and fleet size, then the
+benchmarks drive VMStatusWorker, GoogleVMWorker and google_vm_manager.sh
+headlessly. Results are printed, and written as JSON with --output so that
+runs can be compared with --compare.
+
+    python3 benchmarks/run_benchmarks.py --fleet-size 80 --projects 4 --output before.json
+    python3 benchmarks/run_benchmarks.py --fleet-size 80 --projects 4 --compare before.json
+"""
+import sys, os, json, time, argparse, tempfile, shutil, statistics, subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKE_TOOLS = ("gcloud", "ssh", "nc", "remmina")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fleet-size", type=int, default=80, help="number of simulated VMs")
+    parser.add_argument("--projects", type=int, default=4, help="projects the fleet is spread over")
+    parser.add_argument("--zones", type=int, default=2, help="zones per project")
+    parser.add_argument("--status-rounds", type=int, default=5, help="status refreshes to time")
+    parser.add_argument("--start-runs", type=int, default=3, help="VNC starts to time per driver")
+    parser.add_argument("--gcloud-latency", type=int, default=800, help="ms added to every gcloud call")
+    parser.add_argument("--ssh-latency", type=int, default=150, help="ms added to every ssh call")
+    parser.add_argument("--nc-latency", type=int, default=20, help="ms added to every nc call")
+    parser.add_argument("--remmina-latency", type=int, default=0, help="ms added to every remmina call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that a fake call fails")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--only", choices=("status", "worker", "script"), action="append",
+                        help="run only the given benchmark (repeatable)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="compare with the results of an earlier run")
+    return parser.parse_args(argv)
+
+
+def setup_sandbox(args):
+    """Create the fake tools, fleet and HOME, and point the environment at them"""
+    root = tempfile.mkdtemp(prefix="google-vm-bench-")
+    bin_dir, state_dir, home_dir = (os.path.join(root, d) for d in ("bin", "state", "home"))
+    for directory in (bin_dir, state_dir, os.path.join(home_dir, ".ssh")):
+        os.makedirs(directory)
+
+    for tool in FAKE_TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_tools.py")}" {tool} "$@"\n')
+        os.chmod(path, 0o755)
+
+    fleet = []
+    for i in range(args.fleet_size):
+        project = f"bench-project-{i % args.projects}"
+        zone = f"europe-west{(i // args.projects) % args.zones + 1}-b"
+        fleet.append({
+            'name': f"bench-vm-{i:04d}", 'project': project, 'zone': zone,
+            'status': "RUNNING" if i % 3 else "TERMINATED", 'ip': f"10.0.{i // 250}.{i % 250 + 1}",
+        })
+    with open(os.path.join(state_dir, "fleet.json"), "w") as f:
+        json.dump(fleet, f)
+
+    # Run a copy of the script so generated .remmina files stay in the sandbox
+    app_dir = os.path.join(root, "app")
+    os.makedirs(app_dir)
+    for name in ("google_vm_manager.sh", "google_vm_compute.py", "google_vm_metrics.py", "google_vm_runner.py"):
+        shutil.copy2(os.path.join(REPO_DIR, name), app_dir)
+
+    os.environ.update({
+        'PATH': f"{bin_dir}:{os.environ['PATH']}",
+        'HOME': home_dir,
+        'XDG_CACHE_HOME': os.path.join(root, "cache"),
+        'BENCH_STATE_DIR': state_dir,
+        'BENCH_APP_DIR': app_dir,
+        'BENCH_FAILURE_RATE': str(args.failure_rate),
+        'BENCH_SEED': args.seed,
+        'BENCH_LATENCY_GCLOUD_MS': str(args.gcloud_latency),
+        'BENCH_LATENCY_SSH_MS': str(args.ssh_latency),
+        'BENCH_LATENCY_NC_MS': str(args.nc_latency),
+        'BENCH_LATENCY_REMMINA_MS': str(args.remmina_latency),
+        'GOOGLE_VM_BACKEND': "gcloud",
+        'QT_QPA_PLATFORM': "offscreen",
+    })
+    vm_configs = [
+        {'name': vm['name'], 'zone': vm['zone'], 'project_id': vm['project'],
+         'ssh_key_path': os.path.join(home_dir, ".ssh", "bench_key"), 'ssh_username': "bench"}
+        for vm in fleet
+    ]
+    return root, state_dir, vm_configs
+
+
+class CallCounter:
+    """Count the fake tool invocations logged since the last reset"""
+
+    def __init__(self, state_dir):
+        self.path = os.path.join(state_dir, "calls.log")
+        self.offset = 0
+
+    def reset(self):
+        self.offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def counts(self):
+        counts = dict.fromkeys(FAKE_TOOLS, 0)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                f.seek(self.offset)
+                for line in f:
+                    tool = json.loads(line)['tool']
+                    counts[tool] = counts.get(tool, 0) + 1
+        counts['total'] = sum(counts.values())
+        return counts
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(statistics.mean(ordered), 1),
+        'p50_ms': round(ordered[len(ordered) // 2], 1),
+        'max_ms': round(ordered[-1], 1),
+    }
+
+
+def bench_status(args, vm_configs, counter):
+    """Time full-fleet refreshes through VMStatusWorker"""
+    from google_vm_gui import VMStatusWorker
+    from google_vm_status import FleetStatusService
+
+    service = FleetStatusService()
+    samples, calls, unknown = [], [], 0
+    for _ in range(args.status_rounds):
+        counter.reset()
+        worker = VMStatusWorker(service, vm_configs, force=True)
+        results = {}
+        worker.statuses_ready.connect(results.update)
+        started = time.perf_counter()
+        worker.run()
+        samples.append((time.perf_counter() - started) * 1000)
+        calls.append(counter.counts())
+        unknown += sum(1 for entry in results.values() if entry['status'] in ("UNKNOWN", "ERROR"))
+
+    result = summarize(samples)
+    result.update({
+        'vms': len(vm_configs),
+        'vms_per_second': round(len(vm_configs) / (result['mean_ms'] / 1000), 1),
+        'subprocesses_per_refresh': calls[-1]['total'],
+        'gcloud_calls_per_refresh': calls[-1]['gcloud'],
+        'unresolved_statuses': unknown,
+    })
+    return result
+
+
+def bench_worker(args, vm_configs, counter):
+    """Time VNC starts through GoogleVMWorker, as the GUI runs them"""
+    import google_vm_gui
+    from google_vm_gui import GoogleVMWorker
+
+    google_vm_gui.SCRIPT_PATH = os.path.join(os.environ['BENCH_APP_DIR'], "google_vm_manager.sh")
+    samples, desktop, failures, calls = [], [], 0, None
+    for run in range(args.start_runs):
+        counter.reset()
+        worker = GoogleVMWorker("start", vm_configs[run % len(vm_configs)], False, "1920x1080")
+        exit_codes = []
+        worker.finished.connect(exit_codes.append)
+        started = time.perf_counter()
+        worker.run()
+        samples.append((time.perf_counter() - started) * 1000)
+        failures += exit_codes != [0]
+        calls = counter.counts()
+        record = getattr(worker, "record", None) or {}
+        if record.get('time_to_desktop_ms') is not None:
+            desktop.append(record['time_to_desktop_ms'])
+
+    result = summarize(samples)
+    result.update({'failures': failures, 'subprocesses_per_start': calls})
+    if desktop:
+        result['time_to_desktop'] = summarize(desktop)
+    return result
+
+
+def bench_script(args, vm_configs, counter):
+    """Time VNC starts by running google_vm_manager.sh directly"""
+    script = os.path.join(os.environ['BENCH_APP_DIR'], "google_vm_manager.sh")
+    samples, failures, calls = [], 0, None
+    for run in range(args.start_runs):
+        vm = vm_configs[run % len(vm_configs)]
+        counter.reset()
+        started = time.perf_counter()
+        process = subprocess.run(
+            [script, "start", vm['name'], vm['zone'], vm['project_id'], "1920x1080",
+             vm['ssh_key_path'], vm['ssh_username']],
+            capture_output=True, text=True
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+        failures += process.returncode != 0
+        calls = counter.counts()
+
+    result = summarize(samples)
+    result.update({'failures': failures, 'subprocesses_per_start': calls})
+    return result
+
+
+def compare(previous, current):
+    """Print the change of every numeric metric against an earlier run"""
+    def walk(before, after, prefix=""):
+        for key, value in after.items():
+            old = before.get(key) if isinstance(before, dict) else None
+            name = f"{prefix}{key}"
+            if isinstance(value, dict):
+                walk(old or {}, value, name + ".")
+            elif isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+                print(f"  {name:55} {old:>10} -> {value:<10} {change}")
+    print("Compared with previous run:")
+    walk(previous.get('results', {}), current['results'])
+
+
+def main(argv):
+    args = parse_args(argv)
+    root, state_dir, vm_configs = setup_sandbox(args)
+    sys.path.insert(0, REPO_DIR)
+    from PyQt5.QtCore import QCoreApplication
+    app = QCoreApplication(sys.argv[:1])
+
+    counter = CallCounter(state_dir)
+    benchmarks = {'status': bench_status, 'worker': bench_worker, 'script': bench_script}
+    selected = args.only or list(benchmarks)
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'config': {k: v for k, v in vars(args).items() if k not in ("output", "compare", "only")},
+        },
+        'results': {},
+    }
+    try:
+        for name in selected:
+            print(f"Running {name} benchmark...", file=sys.stderr)
+            report['results'][name] = benchmarks[name](args, vm_configs, counter)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    del app
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
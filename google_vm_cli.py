@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""Headless command line for Google VM Manager, with JSON output.
+
+    google_vm_cli.py list [--filter TEXT]
+    google_vm_cli.py status [VM ...] [--force]
+    google_vm_cli.py start VM [--vnc] [--resolution WxH]
+    google_vm_cli.py stop VM
+    google_vm_cli.py discover PROJECT ... [--import] [--ssh-key PATH] [--ssh-user USER]
+    google_vm_cli.py daemon [--stop]
+
+VM is a configured VM name, or PROJECT/ZONE/NAME. Every command prints one
+JSON document and exits non-zero on failure.
+
+`daemon` keeps the status cache, the compute backend (with its connection
+pool and access token) and the settings warm and serves the same commands
+over a Unix socket. It also runs the pre-warm schedule of the VMs (see
+google_vm_prewarm.py) while it is up. The other commands use a running daemon automatically,
+so frequent status queries do not start gcloud or a new Python process
+stack each time; pass --no-daemon to run in-process instead. The socket
+speaks newline-delimited JSON: one request object per line, e.g.
+{"cmd": "status", "vms": ["my-vm"]}, answered by one response line;
+{"cmd": "metrics"} returns the metrics of google_vm_metrics.py as text.
+"""
+import sys, os, json, time, argparse, signal, socket, socketserver, subprocess, threading
+
+from google_vm_compute import CACHE_DIR
+from google_vm_prewarm import PrewarmPlanner
+from google_vm_metrics import registry, record_call_log, record_operation, serve_metrics
+from google_vm_runner import runner
+from google_vm_settings import VMSettingsStore
+from google_vm_discovery import FleetDiscovery, plan_import, apply_import, ADD, UPDATE, UNCHANGED, MISSING
+from google_vm_status import FleetStatusService, StatusCache, vm_key, status_from_phase
+from google_vm_timeline import OperationTimeline, TimelineHistory
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.join(SCRIPT_DIR, "google_vm_manager.sh")
+SETTINGS_FILE = os.path.join(SCRIPT_DIR, "vm_settings.json")
+
+SOCKET_PATH = os.environ.get("GOOGLE_VM_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or CACHE_DIR, "google-vm-manager.sock"
+)
+DEFAULT_RESOLUTION = "1920x1080"
+
+# Seconds a client waits for the daemon to answer a list or status request.
+# Operations and discovery are bounded by their own deadlines, so for them
+# the client waits as long as the daemon takes, as it would without daemon.
+SOCKET_TIMEOUT = 60
+UNBOUNDED_COMMANDS = ("start", "stop", "discover")
+
+# Seconds between two checks of the pre-warm schedule in the daemon
+PREWARM_CHECK_INTERVAL = 60
+
+
+class RequestError(ValueError):
+    pass
+
+
+class VMManager:
+    """Status queries and operations on the configured VMs, without a GUI"""
+
+    def __init__(self, settings_file=SETTINGS_FILE):
+        self.settings = VMSettingsStore(settings_file)
+        self.status_service = FleetStatusService(StatusCache())
+        self.status_service.cache.load_snapshot()
+        self.history = TimelineHistory()
+        self.prewarm_planner = PrewarmPlanner(self.history)
+        self.discovery = FleetDiscovery()
+        self.busy = {}  # vm_key -> action
+        self._busy_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def resolve(self, ref):
+        """Find the configuration of a VM given as NAME or PROJECT/ZONE/NAME"""
+        self.settings.reload()
+        if ref.count('/') == 2:
+            key = tuple(ref.split('/'))
+            project_id, zone, name = key
+            return self.settings.get(key) or {'name': name, 'zone': zone, 'project_id': project_id}
+        matches = [vm for vm in self.settings.all() if vm['name'] == ref]
+        if not matches:
+            raise RequestError(f"No configured VM named '{ref}'; use PROJECT/ZONE/NAME for others")
+        if len(matches) > 1:
+            raise RequestError(
+                f"VM name '{ref}' is ambiguous: "
+                + ", ".join("/".join(vm_key(vm)) for vm in matches)
+            )
+        return matches[0]
+
+    def list_vms(self, text=None):
+        self.settings.reload()
+        vms = self.settings.all()
+        if text:
+            text = text.lower()
+            vms = [vm for vm in vms if any(text in vm[field].lower() for field in ('name', 'zone', 'project_id'))]
+        return [
+            {'name': vm['name'], 'zone': vm['zone'], 'project_id': vm['project_id'],
+             'ssh_username': vm.get('ssh_username', '')}
+            for vm in vms
+        ]
+
+    def status(self, refs=None, force=False, warnings=None):
+        """Status of the given VMs, or of every configured VM
+
+        Retries of failed listings are reported in the warnings list, if given.
+        """
+        if refs:
+            vms = [self.resolve(ref) for ref in refs]
+        else:
+            self.settings.reload()
+            vms = self.settings.all()
+        started = time.time()
+        # Concurrent queries wait for one refresh instead of listing twice
+        with self._refresh_lock:
+            entries = self.status_service.refresh(
+                vms, force=force, on_retry=warnings.append if warnings is not None else None
+            )
+        if any(entry['updated'] >= started for entry in entries.values()):
+            self.status_service.cache.save_snapshot()
+        result = []
+        for vm in vms:
+            key = vm_key(vm)
+            entry = entries.get(key) or {}
+            result.append({
+                'name': vm['name'], 'zone': vm['zone'], 'project_id': vm['project_id'],
+                'status': entry.get('status', 'UNKNOWN'), 'ip': entry.get('ip', ''),
+                'updated': entry.get('updated'), 'changed': entry.get('changed'),
+                'busy': self.busy.get(key),
+            })
+        return result
+
+    def discover(self, project_ids, force=False, do_import=False, defaults=None, remove_missing=False):
+        """List all instances of the projects and compare them with the settings
+
+        With do_import, new instances are added and configured ones get the
+        default SSH settings they lack, in one atomic write of the settings
+        file; VMs that no longer exist are only removed with remove_missing.
+        """
+        if not project_ids:
+            raise RequestError("No projects given")
+        discovered = self.discovery.discover(project_ids, force=force)
+        self.settings.reload()
+        changes = plan_import(discovered, self.settings.all(), defaults)
+        applied = None
+        if do_import:
+            selected = [c for c in changes if c['action'] in (ADD, UPDATE) or (remove_missing and c['action'] == MISSING)]
+            applied = apply_import(self.settings, selected)
+            if any(applied.values()):
+                self.settings.save()
+        return {
+            'projects': {
+                project_id: {'instances': len(result['instances']), 'error': result['error']}
+                for project_id, result in discovered.items()
+            },
+            'summary': {action: sum(1 for c in changes if c['action'] == action)
+                        for action in (ADD, UPDATE, UNCHANGED, MISSING)},
+            'changes': [
+                {'action': c['action'], 'name': c['key'][2], 'zone': c['key'][1], 'project_id': c['key'][0],
+                 'status': c['status']}
+                for c in changes if c['action'] != UNCHANGED
+            ],
+            'imported': applied,
+        }
+
+    def run_operation(self, action, ref, vnc=False, resolution=DEFAULT_RESOLUTION, trigger="user"):
+        """Run google_vm_manager.sh for one VM and return its result and timeline"""
+        vm = self.resolve(ref)
+        key = vm_key(vm)
+        with self._busy_lock:
+            if key in self.busy:
+                raise RequestError(f"A {self.busy[key]} of {vm['name']} is already running")
+            self.busy[key] = action
+        try:
+            if trigger == "user":
+                self.prewarm_planner.note_use(key)
+            return self._run_script(action, vm, vnc, resolution, trigger)
+        finally:
+            with self._busy_lock:
+                self.busy.pop(key, None)
+
+    def _run_script(self, action, vm, vnc, resolution, trigger):
+        key = vm_key(vm)
+        cmd = [SCRIPT_PATH, action, vm['name'], vm['zone'], vm['project_id'], resolution,
+               vm.get('ssh_key_path', ''), vm.get('ssh_username', '')]
+        if not vnc:
+            cmd.append("--no-vnc")
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        metrics_log = os.path.join(CACHE_DIR, f"calls-{os.getpid()}-{threading.get_ident()}.metrics")
+        env = {'GOOGLE_VM_METRICS_LOG': metrics_log}
+        last_known = self.status_service.cache.get_stale(key)
+        if last_known and last_known['status'] == 'RUNNING':
+            env['GOOGLE_VM_EXPECT_RUNNING'] = "true"
+        timeline = OperationTimeline(action, not vnc, trigger)
+        output = []
+        process = runner.popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, bufsize=1, stdin=subprocess.DEVNULL)
+        for line in process.stdout:
+            line = line.strip()
+            event = timeline.feed(line)
+            if event is None:
+                output.append(line)
+                continue
+            kind, name, _, result = event
+            status = status_from_phase(action, kind, name, result)
+            if status:
+                last_known = self.status_service.cache.get_stale(key)
+                self.status_service.cache.put(key, status, last_known.get('ip', '') if last_known else '')
+        exit_code = process.wait()
+        record = timeline.finish(exit_code)
+        self.history.append(vm, record)
+        record_call_log(metrics_log, "/".join(key))
+        record_operation(action, trigger, exit_code, record['total_ms'] / 1000)
+        # The instance state is known to be out of date now
+        self.status_service.cache.invalidate(key)
+        return {
+            'name': vm['name'], 'zone': vm['zone'], 'project_id': vm['project_id'],
+            'action': action, 'trigger': trigger, 'ok': exit_code == 0, 'exit_code': exit_code,
+            'time_to_desktop_ms': record.get('time_to_desktop_ms'),
+            'phases': record.get('phases', []), 'output': output,
+        }
+
+
+def run_prewarm(manager, stop_event, interval=PREWARM_CHECK_INTERVAL):
+    """Start and stop VMs on their pre-warm schedule until stop_event is set"""
+    planner = manager.prewarm_planner
+
+    def status_of(vm):
+        entry = manager.status_service.refresh([vm]).get(vm_key(vm))
+        return entry['status'] if entry else None
+
+    def prewarm(action, vm, expected=None):
+        ref = "/".join(vm_key(vm))
+        try:
+            result = manager.run_operation(action, ref, trigger="prewarm")
+        except RequestError:
+            # Busy with an operation of the user, which took the VM over from
+            # the pre-warming: a refused stop is not handed back
+            return
+        if expected is not None:
+            planner.finish_start(vm, expected, result['exit_code'])
+
+    while not stop_event.wait(interval):
+        manager.settings.reload()
+        vms = [vm for vm in manager.settings.all() if vm.get('prewarm') and vm_key(vm) not in manager.busy]
+        if not vms:
+            continue
+        for vm, expected in planner.due_starts(vms, status_of):
+            threading.Thread(target=prewarm, args=("start", vm, expected), daemon=True).start()
+        for vm, _expected in planner.due_stops(vms):
+            threading.Thread(target=prewarm, args=("stop", vm), daemon=True).start()
+
+
+def handle_request(manager, request):
+    """Dispatch one request object to the manager, returning the response object"""
+    cmd = request.get('cmd')
+    warnings = []
+    try:
+        if cmd == "list":
+            result = manager.list_vms(request.get('filter'))
+        elif cmd == "status":
+            result = manager.status(request.get('vms'), bool(request.get('force')), warnings)
+        elif cmd in ("start", "stop"):
+            result = manager.run_operation(
+                cmd, request['vm'], bool(request.get('vnc')), request.get('resolution') or DEFAULT_RESOLUTION
+            )
+            if not result['ok']:
+                return {'ok': False, 'error': f"{cmd} of {result['name']} failed", 'result': result}
+        elif cmd == "discover":
+            result = manager.discover(
+                request.get('projects') or [], bool(request.get('force')), bool(request.get('import')),
+                {'ssh_key_path': request.get('ssh_key') or '', 'ssh_username': request.get('ssh_user') or ''},
+                bool(request.get('remove_missing')),
+            )
+        elif cmd == "metrics":
+            result = registry.render()
+        elif cmd == "ping":
+            result = {'pid': os.getpid()}
+        else:
+            return {'ok': False, 'error': f"Unknown command: {cmd}"}
+    except (RequestError, KeyError) as e:
+        return {'ok': False, 'error': str(e).strip("'")}
+    except Exception as e:
+        return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    if warnings:
+        return {'ok': True, 'result': result, 'warnings': warnings}
+    return {'ok': True, 'result': result}
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {'ok': False, 'error': "Invalid JSON request"}
+            else:
+                if request.get('cmd') == "shutdown":
+                    self.send({'ok': True, 'result': {'pid': os.getpid()}})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+                response = handle_request(self.server.manager, request)
+            self.send(response)
+
+    def send(self, response):
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, manager):
+        self.manager = manager
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            if daemon_request({'cmd': "ping"}, path, timeout=2) is not None:
+                raise OSError(f"A daemon is already listening on {path}")
+            os.unlink(path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, DaemonRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+
+def daemon_request(request, path=SOCKET_PATH, timeout=SOCKET_TIMEOUT):
+    """Send one request to the daemon; None if no daemon is listening"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+    if not line:
+        raise OSError("The daemon closed the connection without answering")
+    return json.loads(line)
+
+
+def run_daemon(path=SOCKET_PATH):
+    manager = VMManager()
+    server = DaemonServer(path, manager)
+    serve_metrics()
+    # shutdown() blocks until serve_forever returns, so it cannot run in the handler itself
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(json.dumps({'ok': True, 'result': {'socket': path, 'pid': os.getpid()}}), flush=True)
+    stop_prewarm = threading.Event()
+    threading.Thread(target=run_prewarm, args=(manager, stop_prewarm), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_prewarm.set()
+        server.server_close()
+        manager.status_service.cache.save_snapshot()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="google-vm-manager", description=__doc__.splitlines()[0])
+    parser.add_argument("--no-daemon", action="store_true", help="do not use a running daemon")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="daemon socket path")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+
+    list_parser = commands.add_parser("list", help="list the configured VMs")
+    list_parser.add_argument("--filter", help="only VMs whose name, zone or project contains this text")
+
+    status_parser = commands.add_parser("status", help="status of VMs (all configured VMs by default)")
+    status_parser.add_argument("vms", nargs="*", metavar="VM")
+    status_parser.add_argument("--force", action="store_true", help="bypass the status cache")
+
+    for action in ("start", "stop"):
+        action_parser = commands.add_parser(action, help=f"{action} a VM and wait until done")
+        action_parser.add_argument("vm", metavar="VM")
+        if action == "start":
+            action_parser.add_argument("--vnc", action="store_true", help="also start VNC and open the client")
+            action_parser.add_argument("--resolution", default=DEFAULT_RESOLUTION)
+
+    discover_parser = commands.add_parser("discover", help="list all instances of projects and compare with the settings")
+    discover_parser.add_argument("projects", nargs="+", metavar="PROJECT")
+    discover_parser.add_argument("--force", action="store_true", help="bypass the discovery cache")
+    discover_parser.add_argument("--import", dest="import", action="store_true",
+                                 help="add new instances and update configured ones in the settings")
+    discover_parser.add_argument("--remove-missing", action="store_true",
+                                 help="with --import, also remove configured VMs that no longer exist")
+    discover_parser.add_argument("--ssh-key", help="SSH key path for imported VMs")
+    discover_parser.add_argument("--ssh-user", help="SSH username for imported VMs")
+
+    daemon_parser = commands.add_parser("daemon", help="serve requests on the control socket")
+    daemon_parser.add_argument("--stop", action="store_true", help="stop the running daemon")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.cmd == "daemon":
+        if args.stop:
+            response = daemon_request({'cmd': "shutdown"}, args.socket) or {'ok': False, 'error': "No daemon running"}
+        else:
+            try:
+                return run_daemon(args.socket)
+            except OSError as e:
+                response = {'ok': False, 'error': str(e)}
+    else:
+        request = {k: v for k, v in vars(args).items() if k not in ("no_daemon", "socket")}
+        response = None
+        if not args.no_daemon:
+            try:
+                timeout = None if args.cmd in UNBOUNDED_COMMANDS else SOCKET_TIMEOUT
+                response = daemon_request(request, args.socket, timeout=timeout)
+            except (OSError, ValueError) as e:
+                response = {'ok': False, 'error': f"Daemon request failed: {e}"}
+        if response is None:
+            try:
+                manager = VMManager()
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            else:
+                response = handle_request(manager, request)
+
+    print(json.dumps(response, indent=2 if sys.stdout.isatty() else None))
+    return 0 if response.get('ok') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""Compute Engine backends used for status, start, stop and IP lookups.
+
+`GcloudBackend` shells out to the gcloud CLI. `RestBackend` talks to the
+Compute Engine REST API directly over a pool of keep-alive connections and
+caches the access token until it expires. Select the backend with
+GOOGLE_VM_BACKEND=gcloud|rest; GOOGLE_VM_COMPUTE_ENDPOINT points the REST
+backend at another endpoint, e.g. a local stub server.
+"""
+import sys, os, re, json, subprocess, threading, time, queue
+from urllib.parse import urlsplit, urlencode, quote
+
+from google_vm_metrics import timed_call
+from google_vm_runner import runner
+
+COMPUTE_ENDPOINT = "https://compute.googleapis.com/compute/v1"
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "google-vm-manager"
+)
+TOKEN_CACHE_FILE = os.path.join(CACHE_DIR, "access_token.json")
+
+# gcloud does not report the lifetime of printed tokens; they are valid for
+# an hour, so refresh well before that
+TOKEN_LIFETIME = 50 * 60
+TOKEN_EXPIRY_MARGIN = 60
+
+
+# Errors worth retrying, matched case-insensitively: rate limits (as the API
+# reports them, "rateLimitExceeded", and as gcloud prints them, "Rate Limit
+# Exceeded" or "Quota exceeded for quota metric ..."), exhausted zone
+# resources ("... does not have enough resources available ..." in gcloud's
+# words), server-side failures and dropped connections. google_vm_manager.sh
+# gets the pattern with "transient-pattern" and uses it as an extended regex.
+TRANSIENT_ERROR_PATTERN = "rate ?limit ?exceeded|quota exceeded|RESOURCE_EXHAUSTED|ZONE_RESOURCE_POOL_EXHAUSTED|does not have enough resources available|HTTP (429|50[0234])|UNAVAILABLE|backendError|internal error|connection reset|connection closed|broken pipe|timed out"
+TRANSIENT_ERRORS = re.compile(TRANSIENT_ERROR_PATTERN, re.IGNORECASE)
+
+
+class ComputeError(RuntimeError):
+    pass
+
+
+def is_transient(error):
+    """True if a failed backend call may well succeed when retried"""
+    if isinstance(error, (subprocess.TimeoutExpired, TimeoutError, ConnectionError)):
+        return True
+    return isinstance(error, ComputeError) and bool(TRANSIENT_ERRORS.search(str(error)))
+
+
+def call_with_retries(func, *args, attempts=3, backoff=1.0, on_retry=None):
+    """Call func(*args), retrying transient errors with exponential backoff
+
+    on_retry(attempt, error, delay) is called before every retry.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+
+
+def instance_target(vm_config):
+    """Metrics target of a call about one VM"""
+    return f"{vm_config['project_id']}/{vm_config['zone']}/{vm_config['name']}"
+
+
+def zone_basename(zone):
+    """Turn a zone URL into its short name"""
+    return zone.rsplit('/', 1)[-1] if zone else ''
+
+
+class GcloudBackend:
+    """Compute Engine access through the gcloud CLI"""
+
+    name = "gcloud"
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+
+    def _run(self, args, timeout=None, resource="instances", target=""):
+        with timed_call("gcloud", f"compute {resource} {args[0]}", target) as call:
+            result = runner.run(["gcloud", "compute", resource] + args, timeout=timeout or self.timeout)
+            call['ok'] = result.returncode == 0
+        if result.returncode != 0:
+            raise ComputeError(result.stderr.strip() or f"gcloud exited with {result.returncode}")
+        return result.stdout
+
+    def list_instances(self, project_id, zones, names):
+        """Return {(zone, name): (status, ip)} for the given instances of a project"""
+        output = self._run([
+            "list",
+            f"--project={project_id}",
+            f"--zones={','.join(sorted(zones))}",
+            f"--filter=name=({' '.join(sorted(names))})",
+            "--format=value(name,zone.basename(),status,networkInterfaces[0].accessConfigs[0].natIP)",
+        ], target=project_id)
+        instances = {}
+        for line in output.splitlines():
+            fields = line.split('\t')
+            if len(fields) < 3:
+                continue
+            name, zone, status = fields[:3]
+            ip = fields[3] if len(fields) > 3 else ''
+            instances[(zone, name)] = (status, ip)
+        return instances
+
+    def discover_instances(self, project_id):
+        """Return [(zone, name, status)] of every instance in a project"""
+        output = self._run([
+            "list",
+            f"--project={project_id}",
+            "--format=value(name,zone.basename(),status)",
+        ], timeout=max(self.timeout, 120), target=project_id)
+        instances = []
+        for line in output.splitlines():
+            fields = line.split('\t')
+            if len(fields) >= 3:
+                instances.append((fields[1], fields[0], fields[2]))
+        return instances
+
+    def list_zones(self, project_id):
+        """Return the names of the zones that are up for a project"""
+        output = self._run([
+            "list",
+            f"--project={project_id}",
+            "--filter=status=UP",
+            "--format=value(name)",
+        ], resource="zones", target=project_id)
+        return sorted(line.strip() for line in output.splitlines() if line.strip())
+
+    def _describe(self, vm_config, fmt):
+        return self._run([
+            "describe", vm_config['name'],
+            f"--zone={vm_config['zone']}",
+            f"--project={vm_config['project_id']}",
+            f"--format={fmt}",
+        ], target=instance_target(vm_config)).strip()
+
+    def get_status(self, vm_config):
+        return self._describe(vm_config, "value(status)")
+
+    def get_external_ip(self, vm_config):
+        return self._describe(vm_config, "get(networkInterfaces[0].accessConfigs[0].natIP)")
+
+    def describe(self, vm_config):
+        """Return (status, external IP) with a single call"""
+        fields = self._describe(vm_config, "value(status,networkInterfaces[0].accessConfigs[0].natIP)").split('\t')
+        return fields[0], fields[1] if len(fields) > 1 else ''
+
+    def _action(self, action, vm_config, wait):
+        args = [
+            action, vm_config['name'],
+            f"--zone={vm_config['zone']}",
+            f"--project={vm_config['project_id']}",
+            "--quiet",
+        ]
+        if not wait:
+            args.append("--async")
+        self._run(args, timeout=None if wait else self.timeout, target=instance_target(vm_config))
+
+    def start(self, vm_config, wait=True):
+        self._action("start", vm_config, wait)
+
+    def stop(self, vm_config, wait=True):
+        self._action("stop", vm_config, wait)
+
+
+class AccessTokenProvider:
+    """Hand out an OAuth access token, cached in memory and on disk until it expires"""
+
+    def __init__(self, cache_file=TOKEN_CACHE_FILE):
+        self.cache_file = cache_file
+        self._token = None
+        self._expiry = 0
+        self._lock = threading.Lock()
+
+    def token(self):
+        with self._lock:
+            if self._token and time.time() < self._expiry - TOKEN_EXPIRY_MARGIN:
+                return self._token
+            if not self._load_cached():
+                self._token, self._expiry = self._fetch()
+                self._store_cached()
+            return self._token
+
+    def invalidate(self):
+        with self._lock:
+            self._token, self._expiry = None, 0
+            try:
+                os.remove(self.cache_file)
+            except OSError:
+                pass
+
+    def _load_cached(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get('expiry', 0) - TOKEN_EXPIRY_MARGIN <= time.time():
+            return False
+        self._token, self._expiry = cached['token'], cached['expiry']
+        return True
+
+    def _store_cached(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            fd = os.open(self.cache_file + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'token': self._token, 'expiry': self._expiry}, f)
+            os.replace(self.cache_file + ".tmp", self.cache_file)
+        except OSError:
+            pass
+
+    def _fetch(self):
+        # A fixed token is handy for stub servers and CI
+        token = os.environ.get("GOOGLE_VM_ACCESS_TOKEN")
+        if token:
+            return token, time.time() + TOKEN_LIFETIME
+
+        try:
+            import google.auth
+            import google.auth.transport.requests
+            credentials, _ = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/compute"]
+            )
+            credentials.refresh(google.auth.transport.requests.Request())
+            expiry = credentials.expiry.timestamp() if credentials.expiry else time.time() + TOKEN_LIFETIME
+            return credentials.token, expiry
+        except Exception:
+            pass
+
+        with timed_call("gcloud", "auth print-access-token") as call:
+            result = runner.run(["gcloud", "auth", "print-access-token"], timeout=30)
+            call['ok'] = result.returncode == 0
+        if result.returncode != 0 or not result.stdout.strip():
+            raise ComputeError(result.stderr.strip() or "Could not obtain an access token")
+        return result.stdout.strip(), time.time() + TOKEN_LIFETIME
+
+
+class ConnectionPool:
+    """A small pool of persistent HTTP(S) connections to one endpoint"""
+
+    def __init__(self, endpoint, maxsize=8, timeout=30):
+        parts = urlsplit(endpoint)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize)
+
+    def _new_connection(self):
+        import http.client  # only the REST backend needs it; keeps startup light
+        if self.scheme == "http":
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request and return (status, body bytes)"""
+        from http.client import HTTPException
+        url = self.base_path + path
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request(method, url, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (HTTPException, OSError):
+                conn.close()
+                # An idle keep-alive connection may have been closed by the
+                # server; retry once on a fresh one
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RestBackend:
+    """Compute Engine access through the REST API over pooled connections"""
+
+    name = "rest"
+
+    def __init__(self, endpoint=None, token_provider=None, pool_size=8, timeout=30, operation_timeout=300):
+        self.endpoint = endpoint or os.environ.get("GOOGLE_VM_COMPUTE_ENDPOINT", COMPUTE_ENDPOINT)
+        self.pool = ConnectionPool(self.endpoint, maxsize=pool_size, timeout=timeout)
+        self.tokens = token_provider or AccessTokenProvider()
+        self.operation_timeout = operation_timeout
+
+    def _call(self, method, path, params=None, op="", target=""):
+        """Call the API; op names the API method and target its subject for the metrics"""
+        with timed_call("rest", op or method, target) as call:
+            status, data = self._request(method, path, params)
+            call['ok'] = status < 400
+
+        try:
+            payload = json.loads(data) if data else {}
+        except ValueError:
+            payload = {}
+        if status >= 400:
+            message = payload.get('error', {}).get('message') if isinstance(payload.get('error'), dict) else None
+            raise ComputeError(f"HTTP {status}: {message or data[:200].decode(errors='replace')}")
+        return payload
+
+    def _request(self, method, path, params):
+        if params:
+            path += "?" + urlencode(params)
+        for attempt in range(2):
+            headers = {
+                "Authorization": f"Bearer {self.tokens.token()}",
+                "Accept": "application/json",
+            }
+            if method == "POST":
+                headers["Content-Type"] = "application/json"
+            status, data = self.pool.request(method, path, body=b"" if method == "POST" else None, headers=headers)
+            if status == 401 and attempt == 0:
+                # Token revoked or expired early, fetch a new one and retry
+                self.tokens.invalidate()
+                continue
+            return status, data
+
+    def _instance_path(self, vm_config, suffix=""):
+        return (f"/projects/{quote(vm_config['project_id'])}/zones/{quote(vm_config['zone'])}"
+                f"/instances/{quote(vm_config['name'])}{suffix}")
+
+    def list_instances(self, project_id, zones, names):
+        """Return {(zone, name): (status, ip)} for the given instances of a project
+
+        The instances are picked out locally; a server-side filter naming
+        every instance would make the URL grow with the fleet.
+        """
+        params = {
+            "fields": "items/*/instances(name,zone,status,networkInterfaces/accessConfigs/natIP),nextPageToken",
+            "maxResults": "500",
+            "returnPartialSuccess": "true",
+        }
+        instances = {}
+        while True:
+            payload = self._call("GET", f"/projects/{quote(project_id)}/aggregated/instances", params,
+                                 op="instances.aggregatedList", target=project_id)
+            for scoped in payload.get('items', {}).values():
+                for instance in scoped.get('instances', []):
+                    zone = zone_basename(instance.get('zone'))
+                    if zone not in zones or instance.get('name') not in names:
+                        continue
+                    instances[(zone, instance['name'])] = (instance.get('status', 'UNKNOWN'), self._nat_ip(instance))
+            if not payload.get('nextPageToken'):
+                return instances
+            params['pageToken'] = payload['nextPageToken']
+
+    def discover_instances(self, project_id):
+        """Return [(zone, name, status)] of every instance in a project"""
+        params = {
+            "fields": "items/*/instances(name,zone,status),nextPageToken",
+            "returnPartialSuccess": "true",
+        }
+        instances = []
+        while True:
+            payload = self._call("GET", f"/projects/{quote(project_id)}/aggregated/instances", params,
+                                 op="instances.aggregatedList", target=project_id)
+            for scoped in payload.get('items', {}).values():
+                for instance in scoped.get('instances', []):
+                    instances.append((zone_basename(instance.get('zone')), instance['name'],
+                                      instance.get('status', 'UNKNOWN')))
+            if not payload.get('nextPageToken'):
+                return instances
+            params['pageToken'] = payload['nextPageToken']
+
+    def list_zones(self, project_id):
+        """Return the names of the zones that are up for a project"""
+        params = {"fields": "items(name,status),nextPageToken"}
+        zones = []
+        while True:
+            payload = self._call("GET", f"/projects/{quote(project_id)}/zones", params,
+                                 op="zones.list", target=project_id)
+            zones.extend(zone['name'] for zone in payload.get('items', []) if zone.get('status', 'UP') == 'UP')
+            if not payload.get('nextPageToken'):
+                return sorted(zones)
+            params['pageToken'] = payload['nextPageToken']
+
+    @staticmethod
+    def _nat_ip(instance):
+        try:
+            return instance['networkInterfaces'][0]['accessConfigs'][0].get('natIP', '')
+        except (KeyError, IndexError):
+            return ''
+
+    def get_instance(self, vm_config):
+        return self._call("GET", self._instance_path(vm_config), op="instances.get",
+                          target=instance_target(vm_config))
+
+    def get_status(self, vm_config):
+        return self.get_instance(vm_config).get('status', 'UNKNOWN')
+
+    def get_external_ip(self, vm_config):
+        return self._nat_ip(self.get_instance(vm_config))
+
+    def describe(self, vm_config):
+        """Return (status, external IP) with a single call"""
+        instance = self.get_instance(vm_config)
+        return instance.get('status', 'UNKNOWN'), self._nat_ip(instance)
+
+    def _wait_operation(self, vm_config, operation):
+        deadline = time.time() + self.operation_timeout
+        path = (f"/projects/{quote(vm_config['project_id'])}/zones/{quote(vm_config['zone'])}"
+                f"/operations/{quote(operation['name'])}/wait")
+        while operation.get('status') != 'DONE':
+            if time.time() > deadline:
+                raise ComputeError(f"Timed out waiting for operation {operation['name']}")
+            # The wait endpoint blocks server-side for up to two minutes
+            operation = self._call("POST", path, op="zoneOperations.wait", target=instance_target(vm_config))
+        errors = operation.get('error', {}).get('errors', [])
+        if errors:
+            raise ComputeError("; ".join(e.get('message', e.get('code', '')) for e in errors))
+        return operation
+
+    def _action(self, action, vm_config, wait):
+        operation = self._call("POST", self._instance_path(vm_config, f"/{action}"), op=f"instances.{action}",
+                               target=instance_target(vm_config))
+        if wait:
+            self._wait_operation(vm_config, operation)
+        return operation
+
+    def start(self, vm_config, wait=True):
+        self._action("start", vm_config, wait)
+
+    def stop(self, vm_config, wait=True):
+        self._action("stop", vm_config, wait)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """Return the shared backend instance, selected by name or GOOGLE_VM_BACKEND"""
+    name = name or os.environ.get("GOOGLE_VM_BACKEND", "gcloud")
+    with _backends_lock:
+        if name not in _backends:
+            if name == "rest":
+                _backends[name] = RestBackend()
+            elif name == "gcloud":
+                _backends[name] = GcloudBackend()
+            else:
+                raise ValueError(f"Unknown compute backend: {name}")
+        return _backends[name]
+
+
+ACTIONS = ("start", "stop", "status", "ip", "describe")
+
+
+def run_action(action, name, zone, project_id, out, err):
+    """Run one ACTION for google_vm_manager.sh, writing its output lines with out and err"""
+    vm_config = {'name': name, 'zone': zone, 'project_id': project_id}
+    backend = get_backend()
+    try:
+        if action == "start":
+            backend.start(vm_config)
+            out(f"Updated [{name}]. Start done.")
+        elif action == "stop":
+            backend.stop(vm_config)
+            out(f"Updated [{name}]. Stop done.")
+        elif action == "status":
+            out(backend.get_status(vm_config))
+        elif action == "describe":
+            status, ip = backend.describe(vm_config)
+            out(f"{status}\t{ip}")
+        else:
+            out(backend.get_external_ip(vm_config))
+    except (ComputeError, OSError, subprocess.TimeoutExpired) as e:
+        err(f"ERROR: {e}")
+        return 1
+    return 0
+
+
+def serve(requests=sys.stdin, responses=sys.stdout):
+    """Answer "ID ACTION VM_NAME ZONE PROJECT_ID" lines until end of input
+
+    google_vm_manager.sh keeps one such process per run with the REST
+    backend, so that all its calls share the keep-alive connections and the
+    access token. Requests run concurrently; every response line is
+    prefixed with the request ID: "ID O line" (output), "ID E line" (error
+    output) and finally "ID = EXIT_CODE".
+    """
+    lock = threading.Lock()
+
+    def handle(request_id, args):
+        lines = []
+        if len(args) == 4 and args[0] in ACTIONS:
+            code = run_action(*args, lambda line: lines.append(("O", line)), lambda line: lines.append(("E", line)))
+        else:
+            lines.append(("E", f"Invalid request: {' '.join(args)}"))
+            code = 2
+        with lock:
+            for kind, line in lines:
+                responses.write(f"{request_id} {kind} {line}\n")
+            responses.write(f"{request_id} = {code}\n")
+            responses.flush()
+
+    for line in requests:
+        fields = line.split()
+        if fields:
+            threading.Thread(target=handle, args=(fields[0], fields[1:]), daemon=True).start()
+    return 0
+
+
+def main(argv):
+    """Command line used by google_vm_manager.sh: ACTION VM_NAME ZONE PROJECT_ID, serve or transient-pattern"""
+    if argv == ["serve"]:
+        return serve()
+    if argv == ["transient-pattern"]:
+        print(TRANSIENT_ERROR_PATTERN)
+        return 0
+    if len(argv) != 4 or argv[0] not in ACTIONS:
+        print(f"Usage: {os.path.basename(sys.argv[0])} start|stop|status|ip|describe VM_NAME ZONE PROJECT_ID",
+              file=sys.stderr)
+        print(f"       {os.path.basename(sys.argv[0])} serve|transient-pattern", file=sys.stderr)
+        return 2
+    return run_action(*argv, print, lambda line: print(line, file=sys.stderr))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,172 @@
+"""Discover the instances of whole projects and import them as VM settings.
+
+FleetDiscovery lists every instance of the given projects, with at most
+DISCOVERY_PARALLEL projects listed at the same time, and keeps each
+project's list in CACHE_DIR/discovery.json for DISCOVERY_TTL seconds.
+plan_import() compares the result with the configured VMs, and
+apply_import() puts the chosen changes into a VMSettingsStore, which the
+caller saves in one atomic write.
+"""
+import os, json, subprocess, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from google_vm_compute import CACHE_DIR, ComputeError, get_backend, call_with_retries
+from google_vm_status import vm_key, normalize_status, STATUS_ATTEMPTS, STATUS_RETRY_BACKOFF
+
+DISCOVERY_CACHE_FILE = os.path.join(CACHE_DIR, "discovery.json")
+
+# Instances come and go, so a project is listed again after ten minutes
+DISCOVERY_TTL = 10 * 60
+
+# Projects listed at the same time
+DISCOVERY_PARALLEL = int(os.environ.get("GOOGLE_VM_DISCOVERY_PARALLEL", "4"))
+
+# Settings that imported VMs get unless they already have a value
+DEFAULT_FIELDS = ('ssh_key_path', 'ssh_username')
+
+# Kinds of change in an import plan
+ADD, UPDATE, UNCHANGED, MISSING = "add", "update", "unchanged", "missing"
+
+
+class FleetDiscovery:
+    """Thread-safe, cached listing of all instances of projects"""
+
+    def __init__(self, path=DISCOVERY_CACHE_FILE, ttl=DISCOVERY_TTL, backend=None,
+                 max_parallel=DISCOVERY_PARALLEL):
+        self.path = path
+        self.ttl = ttl
+        self.backend = backend
+        self.max_parallel = max_parallel
+        self._projects = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        projects = {}
+        for project_id, entry in data.get('projects', {}).items():
+            if isinstance(entry, dict) and isinstance(entry.get('instances'), list):
+                projects[project_id] = {'instances': entry['instances'], 'updated': entry.get('updated', 0)}
+        with self._lock:
+            self._projects = projects
+
+    def _save(self):
+        with self._lock:
+            data = {'projects': dict(self._projects)}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _cached(self, project_id):
+        with self._lock:
+            entry = self._projects.get(project_id)
+        if entry and time.time() - entry['updated'] <= self.ttl:
+            return entry
+        return None
+
+    def _list_project(self, project_id, force):
+        """Return (instances, updated, error) for one project"""
+        entry = None if force else self._cached(project_id)
+        if entry:
+            return entry['instances'], entry['updated'], None
+        backend = self.backend or get_backend()
+        try:
+            found = call_with_retries(backend.discover_instances, project_id,
+                                      attempts=STATUS_ATTEMPTS, backoff=STATUS_RETRY_BACKOFF)
+        except (ComputeError, OSError, subprocess.TimeoutExpired) as e:
+            return [], None, str(e) or type(e).__name__
+        instances = sorted(
+            ({'name': name, 'zone': zone, 'project_id': project_id, 'status': normalize_status(status)}
+             for zone, name, status in found),
+            key=lambda vm: (vm['zone'], vm['name'])
+        )
+        updated = time.time()
+        with self._lock:
+            self._projects[project_id] = {'instances': instances, 'updated': updated}
+        return instances, updated, None
+
+    def discover(self, project_ids, force=False, on_project=None):
+        """List the instances of every project, in parallel
+
+        Returns {project_id: {'instances': [...], 'updated': time, 'error': message or None}}.
+        on_project(project_id, result) is called as each project completes,
+        on the thread that listed it.
+        """
+        results = {}
+
+        def list_one(project_id):
+            instances, updated, error = self._list_project(project_id, force)
+            result = {'instances': instances, 'updated': updated, 'error': error}
+            results[project_id] = result
+            if on_project:
+                on_project(project_id, result)
+
+        project_ids = list(dict.fromkeys(project_ids))
+        with ThreadPoolExecutor(max_workers=max(1, self.max_parallel)) as pool:
+            list(pool.map(list_one, project_ids))
+        self._save()
+        return {project_id: results[project_id] for project_id in project_ids}
+
+
+def plan_import(discovered, configs, defaults=None):
+    """Compare discovered instances with the configured VMs
+
+    Returns a list of changes {'action', 'key', 'config', 'status'}, where
+    config is the configuration the VM would have after the import: new
+    instances are ADDed with the defaults, configured ones without a value
+    for a default field get an UPDATE, and configured VMs of a listed
+    project that no longer exist are MISSING. Projects that could not be
+    listed are left out.
+    """
+    defaults = {field: value for field, value in (defaults or {}).items() if field in DEFAULT_FIELDS and value}
+    configured = {vm_key(config): config for config in configs}
+    changes = []
+    for project_id, result in discovered.items():
+        if result.get('error'):
+            continue
+        found = set()
+        for instance in result['instances']:
+            key = vm_key(instance)
+            found.add(key)
+            current = configured.get(key)
+            if current is None:
+                config = {'name': instance['name'], 'zone': instance['zone'], 'project_id': project_id}
+                config.update(defaults)
+                action = ADD
+            else:
+                config = dict(current)
+                config.update({field: value for field, value in defaults.items() if not current.get(field)})
+                action = UNCHANGED if config == current else UPDATE
+            changes.append({'action': action, 'key': key, 'config': config, 'status': instance['status']})
+        for key, config in configured.items():
+            if key[0] == project_id and key not in found:
+                changes.append({'action': MISSING, 'key': key, 'config': config, 'status': None})
+    return changes
+
+
+def apply_import(store, changes):
+    """Apply added, updated and (selected) missing entries to a settings store
+
+    MISSING changes remove the VM. The store is not saved; returns the
+    number of changes applied per action.
+    """
+    counts = {ADD: 0, UPDATE: 0, MISSING: 0}
+    for change in changes:
+        action = change['action']
+        if action in (ADD, UPDATE):
+            store.put(change['config'], change['key'] if action == UPDATE else None)
+        elif action == MISSING:
+            store.remove(change['key'])
+        else:
+            continue
+        counts[action] += 1
+    return counts
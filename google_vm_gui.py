@@ -1,130 +1,876 @@
-import sys, os, subprocess, json
+import time
+STARTUP_T0 = time.perf_counter()
+
+import sys, os, subprocess, threading, signal
+from collections import deque
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-    QPushButton, QProgressBar, QTextEdit, QMessageBox, QDialog,
+    QPushButton, QProgressBar, QMessageBox, QDialog,
     QFormLayout, QLineEdit, QComboBox, QListWidget, QListWidgetItem,
-    QDialogButtonBox, QTabWidget
+    QDialogButtonBox, QTabWidget, QTableWidget, QTableWidgetItem,
+    QSpinBox, QHeaderView, QAbstractItemView, QPlainTextEdit, QCompleter, QTableView, QCheckBox
 )
 from PyQt5.QtGui import QFont, QIcon, QColor, QPalette, QScreen
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer
+from PyQt5.QtCore import (
+    QObject, QThread, pyqtSignal, Qt, QTimer, QEvent, QFileSystemWatcher,
+    QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+)
+
+from google_vm_compute import CACHE_DIR
+from google_vm_status import (
+    FleetStatusService, StatusCache, AdaptivePollPolicy, vm_key, status_color, format_age,
+    status_from_phase
+)
+from google_vm_timeline import OperationTimeline, TimelineHistory, format_ms
+from google_vm_zones import ZoneCatalog
+from google_vm_settings import VMSettingsStore, DuplicateVMError
+from google_vm_prewarm import PrewarmPlanner, validate_prewarm
+from google_vm_metrics import registry, record_call_log, record_operation, serve_metrics
+from google_vm_runner import runner
 
 # Use relative paths for distribution
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SCRIPT_PATH = os.path.join(SCRIPT_DIR, "google_vm_manager.sh")
 SETTINGS_FILE = os.path.join(SCRIPT_DIR, "vm_settings.json")
 
+# How many VM operations a batch runs at the same time by default
+DEFAULT_MAX_PARALLEL = int(os.environ.get("GOOGLE_VM_MAX_PARALLEL", "4"))
+
+# Operation output reaches the GUI in batches: every LOG_FLUSH_MS, or as soon
+# as LOG_BATCH_LINES lines are pending. Log views keep at most LOG_MAX_LINES
+# lines; the full output of every operation goes to a file in LOG_DIR.
+LOG_FLUSH_MS = 100
+LOG_BATCH_LINES = 200
+LOG_MAX_LINES = 2000
+STATUS_LINE_INTERVAL_MS = 250
+
+# Exit code reported for a cancelled operation, and the seconds its processes
+# get to exit after SIGTERM before they are killed
+EXIT_CANCELLED = 130
+CANCEL_GRACE_S = 5
+
+# Result of a queued operation that was skipped because another operation on
+# the same VM was in progress
+EXIT_BUSY = 75
+
+# Status changes reach the fleet table at most this often
+FLEET_UPDATE_MS = 100
+
+# How often the pre-warm schedule is checked
+PREWARM_CHECK_MS = 60 * 1000
+LOG_DIR = os.path.join(CACHE_DIR, "logs")
+LOG_FILES_KEPT = 100
+
+# Phase timelines of past operations, per VM
+timeline_history = TimelineHistory()
+
+# Zones available to each project, cached on disk; the cache file is read
+# when the VM configuration dialog first needs it, not at startup
+_zone_catalog = None
+_zone_catalog_lock = threading.Lock()
+
+def get_zone_catalog():
+    global _zone_catalog
+    with _zone_catalog_lock:
+        if _zone_catalog is None:
+            _zone_catalog = ZoneCatalog()
+        return _zone_catalog
+
+# Instances of whole projects, for bulk import; created, and its cache file
+# read, when the discovery dialog first lists a project
+_fleet_discovery = None
+_fleet_discovery_lock = threading.Lock()
+
+def get_fleet_discovery():
+    global _fleet_discovery
+    with _fleet_discovery_lock:
+        if _fleet_discovery is None:
+            # google_vm_discovery pulls in concurrent.futures; it is only
+            # imported once discovery is used (here and in DiscoveryDialog)
+            from google_vm_discovery import FleetDiscovery
+            _fleet_discovery = FleetDiscovery()
+        return _fleet_discovery
+
+def create_log_view():
+    log_view = QPlainTextEdit()
+    log_view.setReadOnly(True)
+    log_view.setMaximumBlockCount(LOG_MAX_LINES)
+    log_view.setStyleSheet(
+        "background: #1e1e1e; color: #dcdcdc; font-family: monospace;"
+    )
+    return log_view
+
+# Print startup phase timings to stderr to track time-to-first-paint
+DEBUG_STARTUP = "--debug-startup" in sys.argv or bool(os.environ.get("GOOGLE_VM_DEBUG_STARTUP"))
+
+def startup_mark(phase):
+    if DEBUG_STARTUP:
+        print(f"[startup] {phase}: {(time.perf_counter() - STARTUP_T0) * 1000:.1f} ms", file=sys.stderr)
+
+startup_mark("imports done")
+
 class VMStatusWorker(QThread):
-    status_ready = pyqtSignal(str, str)  # status, color
+    statuses_ready = pyqtSignal(object)  # {vm_key: status entry}
+    retrying = pyqtSignal(str)           # message about a listing that is retried
 
-    def __init__(self, vm_config):
+    def __init__(self, status_service, vm_configs, force=False):
         super().__init__()
-        self.vm_config = vm_config
+        self.status_service = status_service
+        self.vm_configs = vm_configs
+        self.force = force
 
     def run(self):
-        try:
-            # Get both status and detailed info to better determine actual state
-            cmd = f"gcloud compute instances describe {self.vm_config['name']} --zone={self.vm_config['zone']} --project={self.vm_config['project_id']} --format='value(status,scheduling.preemptible)'"
-            result = subprocess.run(
-                ["bash", "-c", cmd],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                output_lines = result.stdout.strip().split('\n')
-                status = output_lines[0] if output_lines else 'UNKNOWN'
-                
-                # Handle Google Cloud's inconsistent status reporting
-                # Sometimes "TERMINATED" is used for stopped preemptible instances
-                if status == 'TERMINATED':
-                    # Check if this is actually a stopped instance vs truly terminated
-                    list_cmd = f"gcloud compute instances list --filter='name={self.vm_config['name']}' --zones={self.vm_config['zone']} --project={self.vm_config['project_id']} --format='value(status)'"
-                    list_result = subprocess.run(
-                        ["bash", "-c", list_cmd],
-                        capture_output=True,
-                        text=True,
-                        timeout=5
-                    )
-                    
-                    if list_result.returncode == 0 and list_result.stdout.strip():
-                        # If the instance appears in the list, it's likely STOPPED, not truly TERMINATED
-                        actual_status = list_result.stdout.strip()
-                        if actual_status in ['TERMINATED', 'STOPPING']:
-                            status = 'STOPPED'  # Treat as stopped for practical purposes
-                        else:
-                            status = actual_status
-                
-                # Map status to colors
-                color_map = {
-                    'RUNNING': '#4CAF50',      # Green
-                    'STOPPED': '#f44336',      # Red
-                    'STOPPING': '#ff9800',     # Orange
-                    'STARTING': '#2196F3',     # Blue
-                    'PROVISIONING': '#9C27B0', # Purple
-                    'REPAIRING': '#ff5722',    # Deep Orange
-                    'TERMINATED': '#607D8B'    # Blue Grey (truly terminated)
-                }
-                color = color_map.get(status, '#757575')  # Default grey
-                self.status_ready.emit(status, color)
-            else:
-                self.status_ready.emit('UNKNOWN', '#757575')
-        except Exception:
-            self.status_ready.emit('ERROR', '#f44336')
+        # One gcloud list call per project covers every configured VM
+        statuses = self.status_service.refresh(self.vm_configs, force=self.force, on_retry=self.retrying.emit)
+        self.status_service.cache.save_snapshot()
+        self.statuses_ready.emit(statuses)
+
+class ZoneLoaderWorker(QThread):
+    zones_ready = pyqtSignal(str, list)  # project ID, zones
+
+    # Loads in flight, by project; they outlive the dialog that started them
+    active = {}
+
+    def __init__(self, project_id):
+        super().__init__()
+        self.project_id = project_id
+
+    @classmethod
+    def load(cls, project_id, slot):
+        """Deliver the zones of a project to slot, sharing a load already in flight"""
+        worker = cls.active.get(project_id)
+        if worker is not None:
+            worker.zones_ready.connect(slot)
+            return
+        worker = cls.active[project_id] = cls(project_id)
+        worker.zones_ready.connect(slot)
+        worker.finished.connect(lambda: cls.active.pop(project_id, None))
+        worker.start()
+
+    def run(self):
+        self.zones_ready.emit(self.project_id, get_zone_catalog().refresh(self.project_id))
+
+class DiscoveryWorker(QThread):
+    """List all instances of some projects off the GUI thread"""
+    project_done = pyqtSignal(str, dict)  # project, result
+    discovered = pyqtSignal(dict)         # {project: result}
+
+    # Listings whose dialog was closed; kept until they finish, which also
+    # fills the discovery cache for the next time
+    detached = set()
+
+    def __init__(self, project_ids, force=False):
+        super().__init__()
+        self.project_ids = project_ids
+        self.force = force
+
+    def detach(self):
+        """Let the listing finish in the background without reporting to anyone"""
+        self.project_done.disconnect()
+        self.discovered.disconnect()
+        DiscoveryWorker.detached.add(self)
+        self.finished.connect(lambda: DiscoveryWorker.detached.discard(self))
+        self.finished.connect(self.deleteLater)
+        if self.isFinished():
+            DiscoveryWorker.detached.discard(self)
+            self.deleteLater()
+
+    def run(self):
+        self.discovered.emit(get_fleet_discovery().discover(self.project_ids, self.force, self.project_done.emit))
 
 class GoogleVMWorker(QThread):
-    output = pyqtSignal(str)
+    output = pyqtSignal(list)  # batch of lines
+    phase = pyqtSignal(str, str, str)  # start/end, phase name, result
     finished = pyqtSignal(int)
 
-    def __init__(self, action, vm_config, no_vnc=False, resolution="1920x1080"):
+    def __init__(self, action, vm_config, no_vnc=False, resolution="1920x1080", trigger="user",
+                 expect_running=False):
         super().__init__()
         self.action = action
         self.vm_config = vm_config
         self.no_vnc = no_vnc
         self.resolution = resolution
+        self.trigger = trigger
+        # The VM was last seen RUNNING, let the script check before starting it
+        self.expect_running = expect_running
+        self.timeline = OperationTimeline(action, no_vnc, trigger)
+        self.record = None
+        self.log_path = os.path.join(
+            LOG_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{vm_config['name']}-{action}.log"
+        )
+        # The script logs its external calls here, see google_vm_metrics.py
+        self.metrics_log = self.log_path + ".metrics"
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self.process = None
+        self.cancelled = False
+        self._process_lock = threading.Lock()
+        # Lives in the GUI thread and drains the lines read by run()
+        self.flush_timer = QTimer()
+        self.flush_timer.setInterval(LOG_FLUSH_MS)
+        self.flush_timer.timeout.connect(self.flush_output)
+
+    def start(self):
+        self.flush_timer.start()
+        super().start()
+
+    def emit_line(self, line):
+        with self._pending_lock:
+            self._pending.append(line)
+            full = len(self._pending) >= LOG_BATCH_LINES
+        if full:
+            self.flush_output()
+
+    def flush_output(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self.output.emit(batch)
+
+    def cancel(self):
+        """Stop the operation: terminate the script and everything it started"""
+        with self._process_lock:
+            self.cancelled = True
+            process = self.process
+        if process is None or process.poll() is not None:
+            return
+        self.emit_line("⛔ Cancelling...")
+        self._signal_group(process, signal.SIGTERM)
+        # Whatever ignores SIGTERM is killed after a grace period
+        timer = threading.Timer(CANCEL_GRACE_S, self._signal_group, (process, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _signal_group(process, sig):
+        if process.poll() is None:
+            try:
+                os.killpg(process.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def open_log_file(self):
+        """Open the per-operation log file, dropping the oldest ones"""
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            old_logs = sorted(f for f in os.listdir(LOG_DIR) if f.endswith(".log"))
+            for name in old_logs[:max(0, len(old_logs) - LOG_FILES_KEPT + 1)]:
+                os.remove(os.path.join(LOG_DIR, name))
+            return open(self.log_path, 'w', buffering=1)
+        except OSError as e:
+            self.emit_line(f"Warning: Could not write operation log: {e}")
+            return None
 
     def run(self):
+        log_file = self.open_log_file()
+
         # Ensure script has execute permissions
         try:
             import stat
             st = os.stat(SCRIPT_PATH)
             if not bool(st.st_mode & stat.S_IEXEC):
                 os.chmod(SCRIPT_PATH, st.st_mode | stat.S_IEXEC)
-                self.output.emit(f"Fixed permissions for {SCRIPT_PATH}")
+                self.emit_line(f"Fixed permissions for {SCRIPT_PATH}")
         except Exception as e:
-            self.output.emit(f"Warning: Could not check/fix script permissions: {e}")
+            self.emit_line(f"Warning: Could not check/fix script permissions: {e}")
 
         # Get SSH key path and username from config
         ssh_key_path = self.vm_config.get('ssh_key_path', '')
         ssh_username = self.vm_config.get('ssh_username', '')
         
-        cmd = f"{SCRIPT_PATH} {self.action} {self.vm_config['name']} {self.vm_config['zone']} {self.vm_config['project_id']} {self.resolution} {ssh_key_path}"
-        # Add username parameter if available
-        if ssh_username:
-            cmd += f" {ssh_username}"
-            
+        cmd = [SCRIPT_PATH, self.action, self.vm_config['name'], self.vm_config['zone'],
+               self.vm_config['project_id'], self.resolution, ssh_key_path, ssh_username]
         if self.no_vnc:
-            cmd += " --no-vnc"
+            cmd.append("--no-vnc")
         
-        process = subprocess.Popen(
-            ["bash", "-lc", cmd],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True
-        )
+        with self._process_lock:
+            if not self.cancelled:
+                # A process group of its own, so cancel() reaches every child
+                env = {'GOOGLE_VM_METRICS_LOG': self.metrics_log}
+                if self.expect_running:
+                    env['GOOGLE_VM_EXPECT_RUNNING'] = "true"
+                self.process = runner.popen(
+                    cmd,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                    text=True,
+                    start_new_session=True
+                )
+        process = self.process
+        if process is None:
+            self.emit_line("⛔ Cancelled")
+            if log_file:
+                log_file.close()
+            self.flush_output()
+            self.finished.emit(EXIT_CANCELLED)
+            return
         
         for line in process.stdout:
-            self.output.emit(line.strip())
+            if log_file:
+                log_file.write(line)
+            # Phase events feed the timeline instead of the log view
+            event = self.timeline.feed(line.strip())
+            if event:
+                kind, name, _, result = event
+                self.phase.emit(kind, name, result or '')
+            else:
+                self.emit_line(line.strip())
         
         exit_code = process.wait()
+        if self.cancelled and exit_code != 0:
+            exit_code = EXIT_CANCELLED
+            self.emit_line("⛔ Cancelled")
+        self.record = self.timeline.finish(exit_code)
+        timeline_history.append(self.vm_config, self.record)
+        record_call_log(self.metrics_log, "/".join(vm_key(self.vm_config)))
+        record_operation(self.action, self.trigger, exit_code, self.record['total_ms'] / 1000)
+        if self.timeline.phases:
+            self.emit_line(f"⏱ {self.timeline.summary()}")
+        if log_file:
+            log_file.write(f"exit code: {exit_code}\n")
+            log_file.close()
+        self.flush_output()
         self.finished.emit(exit_code)
 
+class OperationScheduler(QObject):
+    """Run queued VM operations with at most max_parallel at a time
+
+    Only one operation per VM runs at a time: a VM that is queued or running
+    here, or for which in_progress(vm_key) is true (e.g. an operation of the
+    main window), is refused.
+    """
+    operation_started = pyqtSignal(object)        # vm_key
+    operation_output = pyqtSignal(object, list)   # vm_key, batch of lines
+    operation_phase = pyqtSignal(object, str, str, str, str)  # vm_key, action, start/end, phase, result
+    operation_finished = pyqtSignal(object, int)  # vm_key, exit code
+    operation_refused = pyqtSignal(object)        # vm_key, busy when it was due to start
+    all_finished = pyqtSignal(object)             # {vm_key: exit code}
+
+    def __init__(self, max_parallel=DEFAULT_MAX_PARALLEL, parent=None, in_progress=None):
+        super().__init__(parent)
+        self.max_parallel = max_parallel
+        self.in_progress = in_progress or (lambda key: False)
+        self.pending = deque()
+        self.running = {}
+        self.results = {}
+
+    def is_queued(self, key):
+        return key in self.running or any(vm_key(item[1]) == key for item in self.pending)
+
+    def submit(self, action, vm_config, no_vnc=False, resolution="1920x1080", **worker_options):
+        """Queue an operation; worker_options are passed on to GoogleVMWorker
+
+        Returns False, without queueing it, if the VM is busy.
+        """
+        key = vm_key(vm_config)
+        if self.is_queued(key) or self.in_progress(key):
+            return False
+        self.pending.append((action, vm_config, no_vnc, resolution, worker_options))
+        self._start_next()
+        return True
+
+    def is_busy(self):
+        return bool(self.pending or self.running)
+
+    def cancel_all(self):
+        """Drop the queued operations and cancel the running ones"""
+        while self.pending:
+            vm_config = self.pending.popleft()[1]
+            key = vm_key(vm_config)
+            self.results[key] = EXIT_CANCELLED
+            self.operation_finished.emit(key, EXIT_CANCELLED)
+        for worker in self.running.values():
+            worker.cancel()
+        self._report_if_done()
+
+    def _start_next(self):
+        while self.pending and len(self.running) < self.max_parallel:
+            action, vm_config, no_vnc, resolution, worker_options = self.pending.popleft()
+            key = vm_key(vm_config)
+            # Something else may have started on the VM while this one was queued
+            if self.in_progress(key):
+                self.results[key] = EXIT_BUSY
+                self.operation_refused.emit(key)
+                continue
+            worker = GoogleVMWorker(action, vm_config, no_vnc, resolution, **worker_options)
+            worker.output.connect(lambda lines, key=key: self.operation_output.emit(key, lines))
+            worker.phase.connect(
+                lambda kind, name, result, key=key, action=action:
+                self.operation_phase.emit(key, action, kind, name, result)
+            )
+            worker.finished.connect(worker.flush_timer.stop)
+            worker.finished.connect(lambda code, key=key: self._on_finished(key, code))
+            self.running[key] = worker
+            self.operation_started.emit(key)
+            worker.start()
+
+    def _on_finished(self, key, exit_code):
+        worker = self.running.pop(key, None)
+        if worker:
+            worker.wait()
+        self.results[key] = exit_code
+        self.operation_finished.emit(key, exit_code)
+        self._start_next()
+        self._report_if_done()
+
+    def _report_if_done(self):
+        if not self.is_busy() and self.results:
+            results, self.results = self.results, {}
+            self.all_finished.emit(results)
+
+class BatchOperationDialog(QDialog):
+    """Start or stop several VMs at once with a bounded number in parallel"""
+
+    def __init__(self, vm_configs, resolution, parent=None, busy_operations=None):
+        super().__init__(parent)
+        self.setWindowTitle("Batch VM Operations")
+        self.resize(700, 550)
+        self.vm_configs = vm_configs
+        self.resolution = resolution
+        # vm_key -> action of the operations running outside the batch
+        self.busy_operations = busy_operations if busy_operations is not None else {}
+        self.rows = {}
+        self.logs = {}
+        self.own_keys = set()
+        self.scheduler = OperationScheduler(parent=self, in_progress=self.busy_elsewhere)
+        self.scheduler.operation_started.connect(self.on_operation_started)
+        self.scheduler.operation_output.connect(self.on_operation_output)
+        self.scheduler.operation_finished.connect(self.on_operation_finished)
+        self.scheduler.operation_refused.connect(self.on_operation_refused)
+        self.scheduler.all_finished.connect(self.on_all_finished)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Select the VMs to operate on:"))
+
+        self.vm_table = QTableWidget(len(self.vm_configs), 3)
+        self.vm_table.setHorizontalHeaderLabels(["VM", "State", "Last output"])
+        self.vm_table.verticalHeader().setVisible(False)
+        self.vm_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.vm_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.vm_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.vm_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        for row, vm in enumerate(self.vm_configs):
+            item = QTableWidgetItem(f"{vm['name']} ({vm['zone']})")
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            self.vm_table.setItem(row, 0, item)
+            self.vm_table.setItem(row, 1, QTableWidgetItem(""))
+            self.vm_table.setItem(row, 2, QTableWidgetItem(""))
+            self.rows[vm_key(vm)] = row
+        self.update_busy_rows()
+        self.vm_table.resizeColumnToContents(0)
+        self.vm_table.currentCellChanged.connect(self.show_selected_log)
+        layout.addWidget(self.vm_table)
+
+        options_layout = QHBoxLayout()
+        self.select_all_btn = QPushButton("Select All")
+        self.select_all_btn.clicked.connect(self.toggle_select_all)
+        options_layout.addWidget(self.select_all_btn)
+        options_layout.addStretch()
+        options_layout.addWidget(QLabel("Run in parallel:"))
+        self.parallel_spin = QSpinBox()
+        self.parallel_spin.setRange(1, 32)
+        self.parallel_spin.setValue(DEFAULT_MAX_PARALLEL)
+        options_layout.addWidget(self.parallel_spin)
+        layout.addLayout(options_layout)
+
+        self.log_output = create_log_view()
+        layout.addWidget(self.log_output)
+
+        self.summary_label = QLabel("Select a row to see the log of that VM.")
+        layout.addWidget(self.summary_label)
+
+        btn_layout = QHBoxLayout()
+        self.start_vnc_btn = QPushButton("Start with VNC")
+        self.start_no_vnc_btn = QPushButton("Start without VNC")
+        self.stop_btn = QPushButton("Stop VMs")
+        self.cancel_btn = QPushButton("Cancel All")
+        self.cancel_btn.setDisabled(True)
+        self.close_btn = QPushButton("Close")
+        self.start_vnc_btn.clicked.connect(lambda: self.run_batch("start", False))
+        self.start_no_vnc_btn.clicked.connect(lambda: self.run_batch("start", True))
+        self.stop_btn.clicked.connect(lambda: self.run_batch("stop", False))
+        self.cancel_btn.clicked.connect(self.cancel_batch)
+        self.close_btn.clicked.connect(self.reject)
+        for btn in (self.start_vnc_btn, self.start_no_vnc_btn, self.stop_btn, self.cancel_btn, self.close_btn):
+            btn_layout.addWidget(btn)
+        layout.addLayout(btn_layout)
+
+    def busy_elsewhere(self, key):
+        """An operation outside this batch runs on the VM, e.g. a pre-warm start"""
+        return key in self.busy_operations and key not in self.own_keys
+
+    def update_busy_rows(self):
+        """Make the VMs busy elsewhere uncheckable"""
+        for vm in self.vm_configs:
+            key = vm_key(vm)
+            item = self.vm_table.item(self.rows[key], 0)
+            if self.busy_elsewhere(key):
+                item.setCheckState(Qt.Unchecked)
+                item.setFlags(item.flags() & ~Qt.ItemIsEnabled)
+                self.set_row(key, f"Busy ({self.busy_operations[key]})")
+            elif not item.flags() & Qt.ItemIsEnabled:
+                item.setFlags(item.flags() | Qt.ItemIsEnabled)
+                self.set_row(key, "")
+
+    def checked_vms(self):
+        return [
+            vm for row, vm in enumerate(self.vm_configs)
+            if self.vm_table.item(row, 0).checkState() == Qt.Checked
+        ]
+
+    def toggle_select_all(self):
+        self.update_busy_rows()
+        selectable = [row for row in range(self.vm_table.rowCount())
+                      if self.vm_table.item(row, 0).flags() & Qt.ItemIsEnabled]
+        state = Qt.Unchecked if len(self.checked_vms()) == len(selectable) else Qt.Checked
+        for row in selectable:
+            self.vm_table.item(row, 0).setCheckState(state)
+
+    def set_busy(self, busy):
+        for btn in (self.start_vnc_btn, self.start_no_vnc_btn, self.stop_btn,
+                    self.select_all_btn, self.parallel_spin, self.close_btn):
+            btn.setDisabled(busy)
+        self.cancel_btn.setDisabled(not busy)
+
+    def cancel_batch(self):
+        self.cancel_btn.setDisabled(True)
+        self.summary_label.setText(f"Cancelling {self.action_label}...")
+        self.scheduler.cancel_all()
+
+    def set_row(self, key, state=None, last_output=None):
+        row = self.rows[key]
+        if state is not None:
+            self.vm_table.item(row, 1).setText(state)
+        if last_output is not None:
+            self.vm_table.item(row, 2).setText(last_output)
+
+    def run_batch(self, action, no_vnc):
+        self.update_busy_rows()
+        vms = self.checked_vms()
+        if not vms:
+            QMessageBox.warning(self, "No VMs Selected", "Please check at least one VM.")
+            return
+
+        self.action_label = f"{action}{' (no VNC)' if no_vnc else ''}"
+        self.scheduler.max_parallel = self.parallel_spin.value()
+        self.set_busy(True)
+        self.summary_label.setText(f"Performing: {self.action_label} on {len(vms)} VMs...")
+        for vm in vms:
+            key = vm_key(vm)
+            self.logs[key] = deque(maxlen=LOG_MAX_LINES)
+            self.set_row(key, "Queued", "")
+        for vm in vms:
+            self.scheduler.submit(action, vm, no_vnc, self.resolution)
+
+    def on_operation_started(self, key):
+        self.own_keys.add(key)
+        self.set_row(key, "Running")
+
+    def on_operation_refused(self, key):
+        self.set_row(key, f"Skipped, busy ({self.busy_operations.get(key, 'operation')})")
+
+    def on_operation_output(self, key, lines):
+        self.logs[key].extend(lines)
+        self.set_row(key, last_output=lines[-1])
+        if self.vm_table.currentRow() == self.rows[key]:
+            self.log_output.appendPlainText("\n".join(lines))
+
+    def on_operation_finished(self, key, exit_code):
+        self.own_keys.discard(key)
+        if exit_code == 0:
+            self.set_row(key, "Done")
+        elif exit_code == EXIT_CANCELLED:
+            self.set_row(key, "Cancelled")
+        else:
+            self.set_row(key, f"Failed ({exit_code})")
+
+    def show_selected_log(self, row, *_):
+        self.log_output.clear()
+        for key, key_row in self.rows.items():
+            if key_row == row:
+                self.log_output.setPlainText("\n".join(self.logs.get(key, [])))
+                break
+
+    def on_all_finished(self, results):
+        self.set_busy(False)
+        self.update_busy_rows()
+        failed = [name for (_, _, name), code in results.items() if code not in (0, EXIT_CANCELLED, EXIT_BUSY)]
+        cancelled = [name for (_, _, name), code in results.items() if code == EXIT_CANCELLED]
+        skipped = [name for (_, _, name), code in results.items() if code == EXIT_BUSY]
+        succeeded = len(results) - len(failed) - len(cancelled) - len(skipped)
+        summary = f"{self.action_label}: {succeeded}/{len(results)} succeeded"
+        if failed:
+            summary += f"; failed: {', '.join(sorted(failed))}"
+        if cancelled:
+            summary += f"; cancelled: {len(cancelled)}"
+        if skipped:
+            summary += f"; skipped (busy): {', '.join(sorted(skipped))}"
+        self.summary_label.setText(summary)
+        if failed:
+            QMessageBox.critical(self, "Batch Finished", summary + ". See the per-VM logs for details.")
+        else:
+            QMessageBox.information(self, "Batch Finished", summary + ".")
+
+    def reject(self):
+        # Keep the dialog open while operations are still running
+        if self.scheduler.is_busy():
+            return
+        super().reject()
+
+class VMTimelineDialog(QDialog):
+    """Per-phase latency of the last start and over the recent starts of a VM"""
+
+    def __init__(self, vm_config, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Start Timeline: {vm_config['name']}")
+        self.resize(480, 360)
+        self.vm_config = vm_config
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        runs = [r for r in timeline_history.load(self.vm_config) if r.get('action') == "start"]
+        stats = timeline_history.stats(self.vm_config)
+        last = runs[-1] if runs else None
+        last_phases = {p['name']: p for p in last['phases']} if last else {}
+
+        ttd = stats['time_to_desktop']
+        summary = QLabel(
+            f"Time to desktop: last {format_ms(last and last.get('time_to_desktop_ms'))}, "
+            f"p50 {format_ms(ttd['p50'])}, p95 {format_ms(ttd['p95'])} "
+            f"over {ttd['runs']} runs"
+        )
+        summary.setFont(QFont("Arial", 11, QFont.Bold))
+        layout.addWidget(summary)
+
+        phase_names = [p['name'] for p in stats['phases']]
+        phase_names += [name for name in last_phases if name not in phase_names]
+        table = QTableWidget(len(phase_names), 4)
+        table.setHorizontalHeaderLabels(["Phase", "Last start", "p50", "p95"])
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        by_name = {p['name']: p for p in stats['phases']}
+        for row, name in enumerate(phase_names):
+            phase_stats = by_name.get(name, {})
+            last_phase = last_phases.get(name)
+            last_text = format_ms(last_phase['ms']) if last_phase else "-"
+            if last_phase and last_phase['result'] != 'ok':
+                last_text += " (failed)"
+            cells = [phase_stats.get('label', name), last_text,
+                     format_ms(phase_stats.get('p50')), format_ms(phase_stats.get('p95'))]
+            for col, text in enumerate(cells):
+                table.setItem(row, col, QTableWidgetItem(text))
+        layout.addWidget(table)
+
+        if not runs:
+            layout.addWidget(QLabel("No starts recorded for this VM yet."))
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+class FleetTableModel(QAbstractTableModel):
+    """Status of every configured VM, one row per VM, fed by the status cache
+
+    The cache reports changed VMs from whichever thread stored them; the
+    changes are collected and only the affected rows are refreshed, at most
+    every FLEET_UPDATE_MS.
+    """
+
+    COLUMNS = ["Name", "Zone", "Project", "Status", "IP", "Last transition"]
+    STATUS_COLUMN = 3
+    CHANGED_COLUMN = 5
+    SORT_ROLE = Qt.UserRole + 1
+
+    status_changed = pyqtSignal(object)  # vm_key
+
+    def __init__(self, status_cache, parent=None):
+        super().__init__(parent)
+        self.status_cache = status_cache
+        self.vms = []
+        self.rows = {}
+        self.pending = set()
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(FLEET_UPDATE_MS)
+        self.update_timer.timeout.connect(self.flush_updates)
+        # Ages in the last column grow while nothing changes
+        self.age_timer = QTimer(self)
+        self.age_timer.setInterval(30000)
+        self.age_timer.timeout.connect(self.refresh_ages)
+        self.age_timer.start()
+        self.status_changed.connect(self.queue_update)
+        status_cache.add_listener(lambda key, _: self.status_changed.emit(key))
+
+    def set_vms(self, vm_configs):
+        self.beginResetModel()
+        self.vms = list(vm_configs)
+        self.rows = {vm_key(vm): row for row, vm in enumerate(self.vms)}
+        self.pending.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.vms)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        vm = self.vms[index.row()]
+        col = index.column()
+        if role == Qt.UserRole:
+            return vm
+        if col < self.STATUS_COLUMN:
+            if role in (Qt.DisplayRole, self.SORT_ROLE):
+                return (vm['name'], vm['zone'], vm['project_id'])[col]
+            return None
+
+        entry = self.status_cache.get_stale(vm_key(vm))
+        status = entry['status'] if entry else "UNKNOWN"
+        changed = entry.get('changed') if entry else None
+        if role == Qt.DisplayRole:
+            if col == self.STATUS_COLUMN:
+                return status if entry else "-"
+            if col == self.CHANGED_COLUMN:
+                return format_age(time.time() - changed) if changed else ""
+            return entry.get('ip', '') if entry else ""
+        if role == self.SORT_ROLE:
+            if col == self.STATUS_COLUMN:
+                return status
+            if col == self.CHANGED_COLUMN:
+                return changed or 0.0
+            return entry.get('ip', '') if entry else ""
+        if role == Qt.ForegroundRole and col == self.STATUS_COLUMN and entry:
+            return QColor(status_color(status))
+        if role == Qt.FontRole and entry and entry.get('stale'):
+            font = QFont()
+            font.setItalic(True)
+            return font
+        if role == Qt.ToolTipRole and entry:
+            tip = "Last checked " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['updated']))
+            if entry.get('stale'):
+                tip = "Last known status, " + tip[0].lower() + tip[1:]
+            if changed:
+                tip += "\nIn this state since " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(changed))
+            return tip
+        return None
+
+    def queue_update(self, key):
+        if key in self.rows:
+            self.pending.add(key)
+            if not self.update_timer.isActive():
+                self.update_timer.start()
+
+    def flush_updates(self):
+        rows = sorted(self.rows[key] for key in self.pending if key in self.rows)
+        self.pending.clear()
+        # One dataChanged per run of adjacent rows
+        start = prev = None
+        for row in rows + [None]:
+            if start is not None and row != prev + 1:
+                self.dataChanged.emit(self.index(start, self.STATUS_COLUMN),
+                                      self.index(prev, self.CHANGED_COLUMN))
+                start = None
+            if start is None:
+                start = row
+            prev = row
+
+    def refresh_ages(self):
+        if self.vms:
+            self.dataChanged.emit(self.index(0, self.CHANGED_COLUMN),
+                                  self.index(len(self.vms) - 1, self.CHANGED_COLUMN), [Qt.DisplayRole])
+
+class FleetDashboardDialog(QDialog):
+    """Sortable, filterable table with the status of the whole fleet"""
+
+    vm_activated = pyqtSignal(object)  # vm_config
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Fleet Status")
+        self.resize(820, 560)
+        self.model = model
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter by name, zone, project, status or IP...")
+        self.filter_edit.setClearButtonEnabled(True)
+        layout.addWidget(self.filter_edit)
+
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setSortRole(FleetTableModel.SORT_ROLE)
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.proxy.setFilterKeyColumn(-1)
+        self.proxy.setDynamicSortFilter(True)
+        self.filter_edit.textChanged.connect(self.proxy.setFilterFixedString)
+
+        # Fixed row heights and no ResizeToContents keep the view from
+        # measuring rows that are not on screen
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, Qt.AscendingOrder)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(self.table.fontMetrics().height() + 8)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setStretchLastSection(True)
+        for col, width in enumerate((180, 140, 160, 100, 120)):
+            header.resizeSection(col, width)
+        self.table.doubleClicked.connect(self.on_double_clicked)
+        layout.addWidget(self.table)
+
+        bottom = QHBoxLayout()
+        self.count_label = QLabel()
+        bottom.addWidget(self.count_label)
+        bottom.addStretch()
+        bottom.addWidget(QLabel("Double-click a VM to select it."))
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        bottom.addWidget(buttons)
+        layout.addLayout(bottom)
+
+        for notifier in (self.proxy.rowsInserted, self.proxy.rowsRemoved,
+                       self.proxy.modelReset, self.proxy.layoutChanged):
+            notifier.connect(self.update_count)
+        self.update_count()
+
+    def update_count(self, *_):
+        self.count_label.setText(f"{self.proxy.rowCount()} of {self.model.rowCount()} VMs")
+
+    def on_double_clicked(self, index):
+        self.vm_activated.emit(self.proxy.data(index, Qt.UserRole))
+
 class VMSettingsDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, settings, parent=None):
         super().__init__(parent)
         self.setWindowTitle("VM Settings")
         self.setFixedSize(600, 500)
-        self.vm_configs = self.load_settings()
+        self.settings = settings
+        # Edits go to a working copy that is only saved on OK
+        self.vm_configs = settings.copy()
         self.setup_ui()
 
     def setup_ui(self):
@@ -133,6 +879,12 @@ class VMSettingsDialog(QDialog):
         # VM List
         list_layout = QVBoxLayout()
         list_layout.addWidget(QLabel("Configured VMs:"))
+        if self.vm_configs.duplicates:
+            names = ", ".join(sorted({config['name'] for config in self.vm_configs.duplicates}))
+            warning = QLabel(f"⚠️ vm_settings.json configures {names} more than once. Only the first entry "
+                             f"is used; the others are kept in the file unchanged.")
+            warning.setWordWrap(True)
+            list_layout.addWidget(warning)
         
         self.vm_list = QListWidget()
         self.refresh_vm_list()
@@ -143,14 +895,18 @@ class VMSettingsDialog(QDialog):
         self.add_btn = QPushButton("Add VM")
         self.edit_btn = QPushButton("Edit VM")
         self.delete_btn = QPushButton("Delete VM")
+        self.discover_btn = QPushButton("Discover...")
+        self.discover_btn.setToolTip("Import the instances of whole projects")
         
         self.add_btn.clicked.connect(self.add_vm)
         self.edit_btn.clicked.connect(self.edit_vm)
         self.delete_btn.clicked.connect(self.delete_vm)
+        self.discover_btn.clicked.connect(self.discover_vms)
         
         vm_btn_layout.addWidget(self.add_btn)
         vm_btn_layout.addWidget(self.edit_btn)
         vm_btn_layout.addWidget(self.delete_btn)
+        vm_btn_layout.addWidget(self.discover_btn)
         
         list_layout.addLayout(vm_btn_layout)
         layout.addLayout(list_layout)
@@ -161,54 +917,241 @@ class VMSettingsDialog(QDialog):
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
 
-    def load_settings(self):
-        try:
-            with open(SETTINGS_FILE, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
     def save_settings(self):
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(self.vm_configs, f, indent=2)
+        self.settings.replace_all(self.vm_configs.all())
+        self.settings.save()
 
     def refresh_vm_list(self):
+        self.vm_list.setUpdatesEnabled(False)
         self.vm_list.clear()
-        for vm in self.vm_configs:
+        for vm in self.vm_configs.all():
             item = QListWidgetItem(f"{vm['name']} ({vm['zone']}, {vm['project_id']})")
-            item.setData(Qt.UserRole, vm)
+            item.setData(Qt.UserRole, vm_key(vm))
             self.vm_list.addItem(item)
+        self.vm_list.setUpdatesEnabled(True)
+
+    def store_vm(self, config, old_key=None):
+        try:
+            self.vm_configs.put(config, old_key)
+        except DuplicateVMError as e:
+            QMessageBox.warning(self, "Duplicate VM", str(e))
+            return
+        self.refresh_vm_list()
 
     def add_vm(self):
         dialog = VMConfigDialog(self)
         if dialog.exec_() == QDialog.Accepted:
-            self.vm_configs.append(dialog.get_config())
-            self.refresh_vm_list()
+            self.store_vm(dialog.get_config())
 
     def edit_vm(self):
         current_item = self.vm_list.currentItem()
         if current_item:
-            vm_config = current_item.data(Qt.UserRole)
-            dialog = VMConfigDialog(self, vm_config)
+            key = tuple(current_item.data(Qt.UserRole))
+            dialog = VMConfigDialog(self, self.vm_configs.get(key))
             if dialog.exec_() == QDialog.Accepted:
-                index = self.vm_configs.index(vm_config)
-                self.vm_configs[index] = dialog.get_config()
-                self.refresh_vm_list()
+                self.store_vm(dialog.get_config(), key)
 
     def delete_vm(self):
         current_item = self.vm_list.currentItem()
         if current_item:
-            vm_config = current_item.data(Qt.UserRole)
+            key = tuple(current_item.data(Qt.UserRole))
             reply = QMessageBox.question(self, "Delete VM", 
-                                       f"Delete VM '{vm_config['name']}'?")
+                                       f"Delete VM '{key[2]}'?")
             if reply == QMessageBox.Yes:
-                self.vm_configs.remove(vm_config)
+                self.vm_configs.remove(key)
                 self.refresh_vm_list()
 
+    def discover_vms(self):
+        dialog = DiscoveryDialog(self.vm_configs, self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.refresh_vm_list()
+
     def accept(self):
-        self.save_settings()
+        try:
+            self.save_settings()
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Could not save settings: {e}")
+            return
         super().accept()
 
+class DiscoveryDialog(QDialog):
+    """List the instances of projects and import the chosen ones into a settings store"""
+
+    COLUMNS = ["Change", "VM", "Zone", "Project", "Status"]
+
+    def __init__(self, vm_configs, parent=None):
+        super().__init__(parent)
+        from google_vm_discovery import ADD, UPDATE, UNCHANGED, MISSING
+        self.action_labels = {ADD: "New", UPDATE: "Update", UNCHANGED: "Unchanged", MISSING: "Missing"}
+        self.setWindowTitle("Discover VMs")
+        self.resize(750, 550)
+        self.vm_configs = vm_configs
+        self.discovered = {}
+        self.changes = []
+        self.worker = None
+        self.setup_ui()
+
+    @staticmethod
+    def most_common(values):
+        values = [value for value in values if value]
+        return max(set(values), key=values.count) if values else ""
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        configs = self.vm_configs.all()
+
+        form = QFormLayout()
+        self.projects_edit = QLineEdit(" ".join(sorted({vm['project_id'] for vm in configs})))
+        self.projects_edit.setPlaceholderText("project-a project-b ...")
+        form.addRow("Projects:", self.projects_edit)
+        # Defaults for imported VMs, taken from the VMs configured so far
+        self.ssh_key_edit = QLineEdit(self.most_common([vm.get('ssh_key_path') for vm in configs]))
+        self.ssh_key_edit.setPlaceholderText("Path to SSH private key")
+        form.addRow("SSH Key:", self.ssh_key_edit)
+        self.ssh_user_edit = QLineEdit(self.most_common([vm.get('ssh_username') for vm in configs]))
+        self.ssh_user_edit.setPlaceholderText("SSH username")
+        form.addRow("SSH User:", self.ssh_user_edit)
+        layout.addLayout(form)
+
+        discover_layout = QHBoxLayout()
+        self.discover_btn = QPushButton("Discover")
+        self.discover_btn.clicked.connect(self.run_discovery)
+        discover_layout.addWidget(self.discover_btn)
+        self.force_check = QCheckBox("Ignore cached lists")
+        discover_layout.addWidget(self.force_check)
+        self.show_unchanged_check = QCheckBox("Show unchanged")
+        self.show_unchanged_check.toggled.connect(lambda _: self.fill_table())
+        discover_layout.addWidget(self.show_unchanged_check)
+        discover_layout.addStretch()
+        layout.addLayout(discover_layout)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.summary_label = QLabel("Enter the projects to list and click Discover.")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        btn_layout = QHBoxLayout()
+        self.select_all_btn = QPushButton("Select All")
+        self.select_all_btn.clicked.connect(self.toggle_select_all)
+        btn_layout.addWidget(self.select_all_btn)
+        btn_layout.addStretch()
+        self.import_btn = QPushButton("Import Selected")
+        self.import_btn.setDisabled(True)
+        self.import_btn.clicked.connect(self.import_selected)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(self.import_btn)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+    def run_discovery(self):
+        project_ids = self.projects_edit.text().replace(",", " ").split()
+        if not project_ids:
+            QMessageBox.warning(self, "No Projects", "Please enter at least one project ID.")
+            return
+        self.discover_btn.setDisabled(True)
+        self.import_btn.setDisabled(True)
+        self.discovered = {}
+        self.project_count = len(set(project_ids))
+        self.summary_label.setText(f"Listing the instances of {self.project_count} projects...")
+        self.worker = DiscoveryWorker(project_ids, self.force_check.isChecked())
+        self.worker.project_done.connect(self.on_project_done)
+        self.worker.discovered.connect(self.on_discovered)
+        self.worker.start()
+
+    def on_project_done(self, project_id, result):
+        if self.worker is None:
+            return
+        self.discovered[project_id] = result
+        self.summary_label.setText(f"Listed {len(self.discovered)} of {self.project_count} projects...")
+
+    def on_discovered(self, discovered):
+        if self.worker is None:
+            return
+        self.worker.wait()
+        from google_vm_discovery import plan_import
+        self.discovered = discovered
+        self.changes = plan_import(discovered, self.vm_configs.all(), {
+            'ssh_key_path': self.ssh_key_edit.text().strip(),
+            'ssh_username': self.ssh_user_edit.text().strip(),
+        })
+        self.discover_btn.setDisabled(False)
+        self.import_btn.setDisabled(False)
+        self.fill_table()
+
+    def visible_changes(self):
+        from google_vm_discovery import UNCHANGED
+        show_unchanged = self.show_unchanged_check.isChecked()
+        return [c for c in self.changes if show_unchanged or c['action'] != UNCHANGED]
+
+    def fill_table(self):
+        from google_vm_discovery import ADD, UPDATE, UNCHANGED, MISSING
+        changes = self.visible_changes()
+        self.table.setUpdatesEnabled(False)
+        self.table.setRowCount(len(changes))
+        for row, change in enumerate(changes):
+            project_id, zone, name = change['key']
+            item = QTableWidgetItem(self.action_labels[change['action']])
+            if change['action'] != UNCHANGED:
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                # VMs that no longer exist are only removed when asked for
+                item.setCheckState(Qt.Checked if change['action'] in (ADD, UPDATE) else Qt.Unchecked)
+            self.table.setItem(row, 0, item)
+            for column, text in enumerate((name, zone, project_id, change['status'] or "-"), 1):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+        self.table.resizeColumnToContents(0)
+        self.table.setUpdatesEnabled(True)
+
+        counts = {action: sum(1 for c in self.changes if c['action'] == action) for action in self.action_labels}
+        summary = (f"{counts[ADD]} new, {counts[UPDATE]} to update, {counts[UNCHANGED]} unchanged, "
+                   f"{counts[MISSING]} configured but not found")
+        errors = [f"{project_id}: {result['error']}" for project_id, result in self.discovered.items() if result['error']]
+        if errors:
+            summary += "\nCould not list " + "; ".join(errors)
+        self.summary_label.setText(summary)
+
+    def checked_changes(self):
+        changes = self.visible_changes()
+        return [
+            changes[row] for row in range(self.table.rowCount())
+            if self.table.item(row, 0).checkState() == Qt.Checked
+        ]
+
+    def toggle_select_all(self):
+        rows = [row for row in range(self.table.rowCount())
+                if self.table.item(row, 0).flags() & Qt.ItemIsUserCheckable]
+        checked = [row for row in rows if self.table.item(row, 0).checkState() == Qt.Checked]
+        state = Qt.Unchecked if len(checked) == len(rows) else Qt.Checked
+        for row in rows:
+            self.table.item(row, 0).setCheckState(state)
+
+    def import_selected(self):
+        changes = self.checked_changes()
+        if not changes:
+            QMessageBox.warning(self, "Nothing Selected", "Please check at least one VM.")
+            return
+        from google_vm_discovery import apply_import
+        try:
+            apply_import(self.vm_configs, changes)
+        except DuplicateVMError as e:
+            QMessageBox.warning(self, "Duplicate VM", str(e))
+            return
+        self.accept()
+
+    def reject(self):
+        # Close right away; a listing still running finishes in the background
+        if self.worker and self.worker.isRunning():
+            self.worker.detach()
+            self.worker = None
+        super().reject()
+
 class VMConfigDialog(QDialog):
     def __init__(self, parent=None, vm_config=None):
         super().__init__(parent)
@@ -217,56 +1160,48 @@ class VMConfigDialog(QDialog):
         self.setup_ui()
 
     def get_google_zones(self):
-        """Return list of Google Cloud zones"""
-        return [
-            "us-central1-a", "us-central1-b", "us-central1-c", "us-central1-f",
-            "us-east1-a", "us-east1-b", "us-east1-c", "us-east1-d",
-            "us-east4-a", "us-east4-b", "us-east4-c",
-            "us-west1-a", "us-west1-b", "us-west1-c",
-            "us-west2-a", "us-west2-b", "us-west2-c",
-            "us-west3-a", "us-west3-b", "us-west3-c",
-            "us-west4-a", "us-west4-b", "us-west4-c",
-            "europe-central2-a", "europe-central2-b", "europe-central2-c",
-            "europe-north1-a", "europe-north1-b", "europe-north1-c",
-            "europe-west1-b", "europe-west1-c", "europe-west1-d",
-            "europe-west2-a", "europe-west2-b", "europe-west2-c",
-            "europe-west3-a", "europe-west3-b", "europe-west3-c",
-            "europe-west4-a", "europe-west4-b", "europe-west4-c",
-            "europe-west6-a", "europe-west6-b", "europe-west6-c",
-            "europe-west8-a", "europe-west8-b", "europe-west8-c",
-            "europe-west9-a", "europe-west9-b", "europe-west9-c",
-            "asia-east1-a", "asia-east1-b", "asia-east1-c",
-            "asia-east2-a", "asia-east2-b", "asia-east2-c",
-            "asia-northeast1-a", "asia-northeast1-b", "asia-northeast1-c",
-            "asia-northeast2-a", "asia-northeast2-b", "asia-northeast2-c",
-            "asia-northeast3-a", "asia-northeast3-b", "asia-northeast3-c",
-            "asia-south1-a", "asia-south1-b", "asia-south1-c",
-            "asia-south2-a", "asia-south2-b", "asia-south2-c",
-            "asia-southeast1-a", "asia-southeast1-b", "asia-southeast1-c",
-            "asia-southeast2-a", "asia-southeast2-b", "asia-southeast2-c",
-            "australia-southeast1-a", "australia-southeast1-b", "australia-southeast1-c",
-            "australia-southeast2-a", "australia-southeast2-b", "australia-southeast2-c",
-            "southamerica-east1-a", "southamerica-east1-b", "southamerica-east1-c",
-            "southamerica-west1-a", "southamerica-west1-b", "southamerica-west1-c",
-            "northamerica-northeast1-a", "northamerica-northeast1-b", "northamerica-northeast1-c",
-            "northamerica-northeast2-a", "northamerica-northeast2-b", "northamerica-northeast2-c"
-        ]
+        """Return the cached zone list for the project being edited"""
+        return get_zone_catalog().zones(self.project_edit.text().strip() or None)
+
+    def load_zones(self):
+        """Refresh the zone list in the background unless the cache is fresh"""
+        project_id = self.project_edit.text().strip()
+        if not project_id:
+            return
+        self.update_zone_combo(self.get_google_zones())
+        if not get_zone_catalog().is_fresh(project_id):
+            ZoneLoaderWorker.load(project_id, self.on_zones_ready)
+
+    def on_zones_ready(self, project_id, zones):
+        if project_id == self.project_edit.text().strip():
+            self.update_zone_combo(zones)
+
+    def update_zone_combo(self, zones):
+        """Replace the zone choices in place, keeping what the user typed"""
+        current = self.zone_combo.currentText()
+        self.zone_combo.blockSignals(True)
+        self.zone_combo.clear()
+        self.zone_combo.addItems(zones)
+        self.zone_combo.setCurrentText(current)
+        self.zone_combo.blockSignals(False)
 
     def setup_ui(self):
         layout = QFormLayout(self)
         
         self.name_edit = QLineEdit(self.vm_config.get('name', ''))
         
+        self.project_edit = QLineEdit(self.vm_config.get('project_id', ''))
+        # Zones are listed per project, so reload them once the project is entered
+        self.project_edit.editingFinished.connect(self.load_zones)
+
+        # Open from the cached zone list; load_zones() refreshes it in the background
         self.zone_combo = QComboBox()
-        zones = self.get_google_zones()
-        self.zone_combo.addItems(zones)
+        self.zone_combo.addItems(self.get_google_zones())
+        self.zone_combo.setEditable(True)  # Allow custom zones
         # Set current zone if editing existing VM
         current_zone = self.vm_config.get('zone', '')
-        if current_zone in zones:
+        if current_zone:
             self.zone_combo.setCurrentText(current_zone)
-        self.zone_combo.setEditable(True)  # Allow custom zones
-        
-        self.project_edit = QLineEdit(self.vm_config.get('project_id', ''))
         
         # Add SSH key selection
         ssh_key_layout = QHBoxLayout()
@@ -281,12 +1216,24 @@ class VMConfigDialog(QDialog):
         layout.addRow("Zone:", self.zone_combo)
         layout.addRow("Project ID:", self.project_edit)
         layout.addRow("SSH Key:", ssh_key_layout)
+
+        # Start the VM ahead of time: on a schedule, or when it is usually used
+        self.prewarm_edit = QLineEdit(self.vm_config.get('prewarm', ''))
+        self.prewarm_edit.setPlaceholderText("off, auto, or e.g. Mon-Fri 08:30")
+        self.prewarm_edit.setToolTip(
+            "Start the VM before it is needed, without VNC.\n"
+            "auto: at the time it is usually first started on workdays or weekends\n"
+            "Mon-Fri 08:30: on the given days and time"
+        )
+        layout.addRow("Pre-warm:", self.prewarm_edit)
         
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
 
+        self.load_zones()
+
     def browse_ssh_key(self):
         from PyQt5.QtWidgets import QFileDialog
         
@@ -342,9 +1289,15 @@ class VMConfigDialog(QDialog):
             'project_id': self.project_edit.text(),
             'ssh_key_path': self.ssh_key_edit.text(),
         }
+        prewarm = self.prewarm_edit.text().strip()
+        if prewarm and prewarm.lower() != 'off':
+            config['prewarm'] = prewarm
         
-        # Try to extract username from key
-        username = self.extract_username_from_key(self.ssh_key_edit.text())
+        # Try to extract username from key; a username stored with the
+        # settings (e.g. by discovery) only belongs to the key it came with
+        username = self.extract_username_from_key(config['ssh_key_path'])
+        if not username and config['ssh_key_path'] == self.vm_config.get('ssh_key_path', ''):
+            username = self.vm_config.get('ssh_username')
         if username:
             config['ssh_username'] = username
             
@@ -354,22 +1307,105 @@ class VMConfigDialog(QDialog):
         if not all([self.name_edit.text(), self.zone_combo.currentText(), self.project_edit.text()]):
             QMessageBox.warning(self, "Error", "VM name, zone, and project ID are required!")
             return
+        try:
+            validate_prewarm(self.prewarm_edit.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
         super().accept()
 
 class GoogleVMControlApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.vm_configs = self.load_vm_configs()
+        # One settings store for the whole app, reloaded when the file changes
+        self.settings = VMSettingsStore(SETTINGS_FILE)
+        self.vm_configs = self.settings.all()
+        self.settings_watcher = QFileSystemWatcher(self)
+        self.settings_watcher.addPath(SCRIPT_DIR)
+        if os.path.exists(SETTINGS_FILE):
+            self.settings_watcher.addPath(SETTINGS_FILE)
+        self.settings_watcher.fileChanged.connect(self.on_settings_file_changed)
+        self.settings_watcher.directoryChanged.connect(self.on_settings_file_changed)
+        startup_mark("settings loaded")
         self.status_worker = None
+        self.worker = None
+        self.live_refresh = False
+        self.poll_policy = AdaptivePollPolicy()
+        # vm_key -> action of every operation in progress; their status comes
+        # from the operation itself instead of the fleet poll
+        self.busy_operations = {}
+        self.first_paint_done = False
+        self.first_status_done = False
+        # Show the last known state right away, live refresh starts after the first frame
+        status_cache = StatusCache()
+        status_cache.load_snapshot()
+        self.status_service = FleetStatusService(status_cache)
+        self.fleet_model = FleetTableModel(status_cache, self)
+        self.fleet_dialog = None
+        # Pre-warm starts and stops run in the background, one VM at a time
+        self.prewarm_planner = PrewarmPlanner(timeline_history)
+        self.prewarm_scheduler = OperationScheduler(
+            max_parallel=1, parent=self, in_progress=lambda key: key in self.busy_operations
+        )
+        self.prewarm_scheduler.operation_started.connect(
+            lambda key: self.operation_started(key, self.prewarm_scheduler.running[key].action)
+        )
+        self.prewarm_scheduler.operation_phase.connect(self.on_operation_phase)
+        self.prewarm_scheduler.operation_finished.connect(self.on_prewarm_finished)
+        self.prewarm_scheduler.operation_refused.connect(lambda key: self.prewarm_expected.pop(key, None))
+        self.prewarm_expected = {}  # vm_key -> expected use of a pre-warm start
         self.setup_ui()
+        startup_mark("widgets built")
+
+    def start_live_refresh(self):
+        """Begin fetching live status once the window is on screen"""
+        self.live_refresh = True
         self.setup_status_timer()
+        self.refresh_vm_status(force=True)
+        self.prewarm_timer = QTimer(self)
+        self.prewarm_timer.setInterval(PREWARM_CHECK_MS)
+        self.prewarm_timer.timeout.connect(self.check_prewarm)
+        self.prewarm_timer.start()
+        QTimer.singleShot(0, self.check_prewarm)
 
-    def load_vm_configs(self):
-        try:
-            with open(SETTINGS_FILE, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+    def check_prewarm(self):
+        """Start VMs due to be pre-warmed and stop those nobody used"""
+        vms = [vm for vm in self.vm_configs if vm.get('prewarm') and vm_key(vm) not in self.busy_operations]
+        if not vms:
+            return
+
+        def status_of(vm):
+            entry = self.status_service.cache.get_stale(vm_key(vm))
+            return entry['status'] if entry and not entry.get('stale') else None
+
+        for vm, expected in self.prewarm_planner.due_starts(vms, status_of):
+            if self.prewarm_scheduler.submit("start", vm, True, trigger="prewarm"):
+                self.prewarm_expected[vm_key(vm)] = expected
+        for vm, expected in self.prewarm_planner.due_stops(vms):
+            if not self.prewarm_scheduler.submit("stop", vm, trigger="prewarm"):
+                self.prewarm_planner.stop_refused(vm, expected)
+
+    def on_prewarm_finished(self, key, exit_code):
+        self.operation_finished(key)
+        expected = self.prewarm_expected.pop(key, None)
+        vm = self.settings.get(key)
+        if expected is not None and vm:
+            self.prewarm_planner.finish_start(vm, expected, exit_code)
+        self.status_service.cache.invalidate(key)
+        QTimer.singleShot(0, lambda: self.refresh_vm_status(force=True))
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            startup_mark("first paint")
+
+    def on_settings_file_changed(self, _path=None):
+        # An atomic replace drops the file from the watcher, so watch it again
+        if os.path.exists(SETTINGS_FILE) and SETTINGS_FILE not in self.settings_watcher.files():
+            self.settings_watcher.addPath(SETTINGS_FILE)
+        if self.settings.reload():
+            self.refresh_vm_combo()
 
     def get_screen_resolution(self):
         screen = QApplication.primaryScreen()
@@ -400,14 +1436,25 @@ class GoogleVMControlApp(QWidget):
         # VM Selection with Status
         vm_layout = QHBoxLayout()
         vm_layout.addWidget(QLabel("Select VM:"))
+        # Type to search: the popup lists every VM whose name or zone contains the text
         self.vm_combo = QComboBox()
-        self.vm_combo.currentTextChanged.connect(self.on_vm_selection_changed)
-        self.refresh_vm_combo()
-        vm_layout.addWidget(self.vm_combo)
+        self.vm_combo.setEditable(True)
+        self.vm_combo.setInsertPolicy(QComboBox.NoInsert)
+        self.vm_combo.lineEdit().setPlaceholderText("Search VMs...")
+        self.vm_combo.completer().setFilterMode(Qt.MatchContains)
+        self.vm_combo.completer().setCompletionMode(QCompleter.PopupCompletion)
+        self.vm_combo.lineEdit().editingFinished.connect(self.restore_vm_combo_text)
+        self.vm_combo.currentIndexChanged.connect(self.on_vm_selection_changed)
+        vm_layout.addWidget(self.vm_combo, 1)
         
         self.settings_btn = QPushButton("Settings")
         self.settings_btn.clicked.connect(self.open_settings)
         vm_layout.addWidget(self.settings_btn)
+
+        self.batch_btn = QPushButton("Batch...")
+        self.batch_btn.setToolTip("Start or stop several VMs at once")
+        self.batch_btn.clicked.connect(self.open_batch)
+        vm_layout.addWidget(self.batch_btn)
         main_layout.addLayout(vm_layout)
 
         # VM Status Display
@@ -422,10 +1469,24 @@ class GoogleVMControlApp(QWidget):
         self.refresh_status_btn = QPushButton("🔄")
         self.refresh_status_btn.setFixedSize(30, 30)
         self.refresh_status_btn.setToolTip("Refresh Status")
-        self.refresh_status_btn.clicked.connect(self.refresh_vm_status)
+        self.refresh_status_btn.clicked.connect(lambda: self.refresh_vm_status(force=True))
         status_layout.addWidget(self.refresh_status_btn)
+
+        self.timeline_btn = QPushButton("📊")
+        self.timeline_btn.setFixedSize(30, 30)
+        self.timeline_btn.setToolTip("Start Timeline")
+        self.timeline_btn.clicked.connect(self.open_timeline)
+        status_layout.addWidget(self.timeline_btn)
+
+        self.fleet_btn = QPushButton("Fleet...")
+        self.fleet_btn.setToolTip("Status of all VMs")
+        self.fleet_btn.clicked.connect(self.open_fleet)
+        status_layout.addWidget(self.fleet_btn)
         main_layout.addLayout(status_layout)
 
+        # Populate the selector once the status display exists
+        self.refresh_vm_combo()
+
         self.status_label = QLabel("Ready.")
         self.status_label.setFont(QFont("Arial", 12))
         main_layout.addWidget(self.status_label)
@@ -434,13 +1495,16 @@ class GoogleVMControlApp(QWidget):
         self.progress_bar.setTextVisible(False)
         main_layout.addWidget(self.progress_bar)
 
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        self.log_output.setStyleSheet(
-            "background: #1e1e1e; color: #dcdcdc; font-family: monospace;"
-        )
+        self.log_output = create_log_view()
         main_layout.addWidget(self.log_output)
 
+        # The status line follows the operation output at a throttled rate
+        self.pending_status_text = None
+        self.status_line_timer = QTimer(self)
+        self.status_line_timer.setSingleShot(True)
+        self.status_line_timer.setInterval(STATUS_LINE_INTERVAL_MS)
+        self.status_line_timer.timeout.connect(self.apply_status_line)
+
         btn_layout = QHBoxLayout()
         btn_layout.setSpacing(20)
 
@@ -459,6 +1523,20 @@ class GoogleVMControlApp(QWidget):
             )
             btn_layout.addWidget(btn)
 
+        # Only shown while an operation is running
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_btn.setFixedHeight(40)
+        self.cancel_btn.setFont(QFont("Arial", 11))
+        self.cancel_btn.setStyleSheet(
+            "QPushButton { background-color: #f44336; color: white; border:none; border-radius:5px;}"
+            "QPushButton:hover { background-color: #e53935;}"
+            "QPushButton:pressed { background-color: #c62828;}"
+        )
+        self.cancel_btn.clicked.connect(self.cancel_operation)
+        self.cancel_btn.hide()
+        btn_layout.addWidget(self.cancel_btn)
+
         main_layout.addLayout(btn_layout)
 
         self.start_vnc_btn.clicked.connect(lambda: self.handle_google_vm_action("start", False))
@@ -466,53 +1544,221 @@ class GoogleVMControlApp(QWidget):
         self.stop_btn.clicked.connect(lambda: self.handle_google_vm_action("stop", False))
 
     def setup_status_timer(self):
-        """Setup timer for automatic status refresh"""
-        self.status_timer = QTimer()
-        self.status_timer.timeout.connect(self.refresh_vm_status)
-        self.status_timer.start(30000)  # Refresh every 30 seconds
+        """Setup timer for automatic status refresh
+
+        The timer is re-armed after every poll with an interval picked by the
+        adaptive poll policy, and paused while the window is hidden.
+        """
+        self.status_timer = QTimer(self)
+        self.status_timer.setSingleShot(True)
+        self.status_timer.timeout.connect(lambda: self.refresh_vm_status(force=True))
+
+    def polling_paused(self):
+        return not self.isVisible() or self.isMinimized()
+
+    def schedule_next_poll(self):
+        if not self.live_refresh or self.polling_paused():
+            return
+        statuses = []
+        for vm in self.vm_configs:
+            entry = self.status_service.cache.get_stale(vm_key(vm))
+            if entry:
+                statuses.append(entry['status'])
+        if self.busy_operations:
+            statuses.append('STARTING')  # keep polling quickly until operations settle
+        self.status_timer.start(int(self.poll_policy.next_interval(statuses) * 1000))
+
+    def resume_polling(self):
+        if self.live_refresh and not self.polling_paused() and not self.status_timer.isActive():
+            self.refresh_vm_status(force=True)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.resume_polling()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if self.live_refresh:
+            self.status_timer.stop()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange and self.live_refresh:
+            if self.isMinimized():
+                self.status_timer.stop()
+            else:
+                self.resume_polling()
 
     def on_vm_selection_changed(self):
         """Called when VM selection changes"""
         self.refresh_vm_status()
 
-    def refresh_vm_status(self):
-        """Refresh the status of the currently selected VM"""
+    def refresh_vm_status(self, force=False):
+        """Refresh the status of the currently selected VM
+
+        The whole fleet is refreshed in one go; the selected VM is shown from
+        the shared status cache when a fresh entry is available.
+        """
         current_vm = self.vm_combo.currentData()
         if not current_vm:
             self.vm_status_label.setText("No VM Selected")
             self.vm_status_label.setStyleSheet("padding: 5px; border-radius: 3px; background-color: #757575; color: white;")
+            self.schedule_next_poll()
             return
 
-        # Don't refresh if an operation is in progress
-        if hasattr(self, 'worker') and self.worker and self.worker.isRunning():
+        cached = self.status_service.cache.get(vm_key(current_vm))
+        if cached:
+            self.update_vm_status(cached['status'], status_color(cached['status']))
+            if not force:
+                return
+        else:
+            last_known = self.status_service.cache.get_stale(vm_key(current_vm))
+            if last_known:
+                self.show_last_known_status(last_known)
+                cached = last_known
+
+        if not self.live_refresh:
+            # start_live_refresh() fetches it right after the first frame
+            if not cached:
+                self.vm_status_label.setText("Checking...")
             return
 
         if self.status_worker and self.status_worker.isRunning():
+            registry.inc('google_vm_status_refresh_skipped_total')
             return
 
-        self.vm_status_label.setText("Checking...")
-        self.vm_status_label.setStyleSheet("padding: 5px; border-radius: 3px; background-color: #757575; color: white;")
+        # VMs with an operation in progress get their status from it
+        idle_vms = [vm for vm in self.vm_configs if vm_key(vm) not in self.busy_operations]
+        if not idle_vms:
+            self.schedule_next_poll()
+            return
+
+        if not cached:
+            self.vm_status_label.setText("Checking...")
+            self.vm_status_label.setStyleSheet("padding: 5px; border-radius: 3px; background-color: #757575; color: white;")
 
-        self.status_worker = VMStatusWorker(current_vm)
-        self.status_worker.status_ready.connect(self.update_vm_status)
+        self.status_timer.stop()
+        self.status_worker = VMStatusWorker(self.status_service, idle_vms, force)
+        self.status_worker.statuses_ready.connect(self.on_statuses_ready)
+        self.status_worker.retrying.connect(self.log_output.appendPlainText)
         self.status_worker.start()
 
+    def on_statuses_ready(self, statuses):
+        """Show the freshly fetched status of the selected VM"""
+        current_vm = self.vm_combo.currentData()
+        if not current_vm:
+            self.schedule_next_poll()
+            return
+        if not self.first_status_done:
+            self.first_status_done = True
+            startup_mark("first live status")
+        self.schedule_next_poll()
+        entry = statuses.get(vm_key(current_vm)) or self.status_service.cache.get(vm_key(current_vm))
+        if entry:
+            self.update_vm_status(entry['status'], status_color(entry['status']))
+
+    def operation_started(self, key, action):
+        self.busy_operations[key] = action
+        self.poll_policy.reset()
+
+    def operation_finished(self, key):
+        self.busy_operations.pop(key, None)
+
+    def on_operation_phase(self, key, action, kind, phase, result):
+        """Feed the status of a VM from the progress of its running operation"""
+        status = status_from_phase(action, kind, phase, result)
+        if not status:
+            return
+        last_known = self.status_service.cache.get_stale(key)
+        self.status_service.cache.put(key, status, last_known.get('ip', '') if last_known else '')
+        current_vm = self.vm_combo.currentData()
+        if current_vm and vm_key(current_vm) == key:
+            self.update_vm_status(status, status_color(status))
+
     def update_vm_status(self, status, color):
         """Update the VM status display"""
         self.vm_status_label.setText(status)
+        self.vm_status_label.setToolTip("")
         self.vm_status_label.setStyleSheet(f"padding: 5px; border-radius: 3px; background-color: {color}; color: white;")
 
+    def show_last_known_status(self, entry):
+        """Show a status from the snapshot, marked as stale until live data arrives"""
+        age = format_age(time.time() - entry['updated'])
+        self.vm_status_label.setText(f"{entry['status']} (last seen {age})")
+        self.vm_status_label.setToolTip(
+            "Last known status from " + time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['updated']))
+            + ", refreshing..."
+        )
+        self.vm_status_label.setStyleSheet(
+            f"padding: 5px; border-radius: 3px; border: 1px dashed white; "
+            f"background-color: {status_color(entry['status'])}; color: #e0e0e0; font-style: italic;"
+        )
+
     def refresh_vm_combo(self):
+        """Fill the VM selector from the settings store, keeping the selection"""
+        current_vm = self.vm_combo.currentData()
+        self.vm_configs = self.settings.all()
+        self.fleet_model.set_vms(self.vm_configs)
+        self.vm_combo.blockSignals(True)
         self.vm_combo.clear()
-        self.vm_configs = self.load_vm_configs()
         for vm in self.vm_configs:
             self.vm_combo.addItem(f"{vm['name']} ({vm['zone']})", vm)
+        if current_vm:
+            keys = [vm_key(vm) for vm in self.vm_configs]
+            if vm_key(current_vm) in keys:
+                self.vm_combo.setCurrentIndex(keys.index(vm_key(current_vm)))
+        self.vm_combo.blockSignals(False)
+        if self.vm_combo.currentData() != current_vm:
+            self.on_vm_selection_changed()
+
+    def restore_vm_combo_text(self):
+        """Drop a search that matched nothing and show the selected VM again"""
+        self.vm_combo.setEditText(self.vm_combo.itemText(self.vm_combo.currentIndex()))
 
     def open_settings(self):
-        dialog = VMSettingsDialog(self)
+        dialog = VMSettingsDialog(self.settings, self)
         if dialog.exec_() == QDialog.Accepted:
             self.refresh_vm_combo()
 
+    def open_fleet(self):
+        if self.fleet_dialog is None:
+            self.fleet_dialog = FleetDashboardDialog(self.fleet_model, self)
+            self.fleet_dialog.vm_activated.connect(self.select_vm)
+        self.fleet_dialog.show()
+        self.fleet_dialog.raise_()
+        self.fleet_dialog.activateWindow()
+
+    def select_vm(self, vm_config):
+        for index in range(self.vm_combo.count()):
+            if vm_key(self.vm_combo.itemData(index)) == vm_key(vm_config):
+                self.vm_combo.setCurrentIndex(index)
+                break
+
+    def open_timeline(self):
+        current_vm = self.vm_combo.currentData()
+        if not current_vm:
+            QMessageBox.warning(self, "No VM Selected", "Please select a VM.")
+            return
+        VMTimelineDialog(current_vm, self).exec_()
+
+    def open_batch(self):
+        if not self.vm_configs:
+            QMessageBox.warning(self, "No VMs", "No VMs configured. Please add VMs in settings.")
+            return
+
+        dialog = BatchOperationDialog(self.vm_configs, self.get_screen_resolution(), self, self.busy_operations)
+        scheduler = dialog.scheduler
+        scheduler.operation_started.connect(
+            lambda key: self.operation_started(key, scheduler.running[key].action)
+        )
+        scheduler.operation_started.connect(self.prewarm_planner.note_use)
+        scheduler.operation_phase.connect(self.on_operation_phase)
+        scheduler.operation_finished.connect(lambda key, _: self.operation_finished(key))
+        dialog.exec_()
+        # Statuses of the batch VMs are out of date now
+        self.status_service.cache.invalidate()
+        QTimer.singleShot(2000, lambda: self.refresh_vm_status(force=True))
+
     def handle_google_vm_action(self, action, no_vnc):
         if not self.vm_configs:
             QMessageBox.warning(self, "No VMs", "No VMs configured. Please add VMs in settings.")
@@ -522,6 +1768,10 @@ class GoogleVMControlApp(QWidget):
         if not current_vm:
             QMessageBox.warning(self, "No VM Selected", "Please select a VM.")
             return
+        # E.g. a pre-warm start running in the background
+        if vm_key(current_vm) in self.busy_operations:
+            QMessageBox.warning(self, "Busy", f"An operation on {current_vm['name']} is already running.")
+            return
 
         self.log_output.clear()
         self.status_label.setText(f"Performing: {action}{' (no VNC)' if no_vnc else ''}...")
@@ -531,27 +1781,61 @@ class GoogleVMControlApp(QWidget):
             btn.setDisabled(True)
 
         resolution = self.get_screen_resolution()
-        self.worker = GoogleVMWorker(action, current_vm, no_vnc, resolution)
+        key = vm_key(current_vm)
+        self.prewarm_planner.note_use(key)
+        last_known = self.status_service.cache.get_stale(key)
+        expect_running = bool(last_known and last_known['status'] == 'RUNNING')
+        self.operation_started(key, action)
+        self.worker = GoogleVMWorker(action, current_vm, no_vnc, resolution, expect_running=expect_running)
+        self.worker.phase.connect(
+            lambda kind, name, result: self.on_operation_phase(key, action, kind, name, result)
+        )
+        self.worker.finished.connect(lambda _: self.operation_finished(key))
         self.worker.output.connect(self.append_output)
+        self.worker.finished.connect(self.worker.flush_timer.stop)
         self.worker.finished.connect(self.on_finished)
+        self.cancel_btn.setDisabled(False)
+        self.cancel_btn.show()
         self.worker.start()
 
-    def append_output(self, text):
-        self.log_output.append(text)
-        self.status_label.setText(text)
+    def cancel_operation(self):
+        if self.worker and self.worker.isRunning():
+            self.cancel_btn.setDisabled(True)
+            self.status_label.setText("Cancelling...")
+            self.worker.cancel()
+
+    def append_output(self, lines):
+        self.log_output.appendPlainText("\n".join(lines))
+        self.pending_status_text = lines[-1]
+        if not self.status_line_timer.isActive():
+            self.apply_status_line()
+            self.status_line_timer.start()
+
+    def apply_status_line(self):
+        if self.pending_status_text is not None:
+            self.status_label.setText(self.pending_status_text)
+            self.pending_status_text = None
 
     def on_finished(self, exit_code):
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(100)
+        self.status_line_timer.stop()
+        self.pending_status_text = None
+        self.log_output.appendPlainText(f"Full log: {self.worker.log_path}")
 
         for btn in (self.start_vnc_btn, self.start_no_vnc_btn, self.stop_btn):
             btn.setDisabled(False)
+        self.cancel_btn.hide()
 
             # Refresh status after successful operation
-        if exit_code == 0:
+        if self.worker.cancelled and exit_code == EXIT_CANCELLED:
+            self.status_label.setText("Cancelled.")
+            self.status_service.cache.invalidate(vm_key(self.worker.vm_config))
+            QTimer.singleShot(0, lambda: self.refresh_vm_status(force=True))
+        elif exit_code == 0:
             QMessageBox.information(self, "Done", "Operation completed successfully.")
             self.status_label.setText("Ready.")
-            QTimer.singleShot(2000, self.refresh_vm_status)  # Wait 2 seconds before refreshing
+            QTimer.singleShot(2000, lambda: self.refresh_vm_status(force=True))  # Wait 2 seconds before refreshing
         else:
             QMessageBox.critical(
                 self, "Error",
@@ -561,7 +1845,10 @@ class GoogleVMControlApp(QWidget):
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    serve_metrics()
     gui = GoogleVMControlApp()
     gui.show()
+    startup_mark("window shown")
+    QTimer.singleShot(0, gui.start_live_refresh)
     sys.exit(app.exec_())
 
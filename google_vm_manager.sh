@@ -49,6 +49,532 @@ VNC_DISPLAY=":1"
 SCRIPT_DIR="$(dirname "$(readlink -f "$0")")"
 REMOTECONFIG="${SCRIPT_DIR}/${VM_NAME}_dynamic.remmina"
 
+# Compute Engine calls go through gcloud, or with GOOGLE_VM_BACKEND=rest
+# through the pooled REST client in google_vm_compute.py
+COMPUTE_BACKEND="${GOOGLE_VM_BACKEND:-gcloud}"
+
+# gcloud as resolved by the GUI or CLI (see google_vm_runner.py), with its
+# prompts, update checks, surveys and usage reporting off unless set otherwise
+GCLOUD_BIN="${GOOGLE_VM_GCLOUD:-gcloud}"
+export CLOUDSDK_CORE_DISABLE_PROMPTS="${CLOUDSDK_CORE_DISABLE_PROMPTS:-1}"
+export CLOUDSDK_COMPONENT_MANAGER_DISABLE_UPDATE_CHECK="${CLOUDSDK_COMPONENT_MANAGER_DISABLE_UPDATE_CHECK:-1}"
+export CLOUDSDK_SURVEY_DISABLE_PROMPTS="${CLOUDSDK_SURVEY_DISABLE_PROMPTS:-1}"
+export CLOUDSDK_CORE_DISABLE_USAGE_REPORTING="${CLOUDSDK_CORE_DISABLE_USAGE_REPORTING:-1}"
+
+# With the REST backend one `google_vm_compute.py serve` process answers all
+# calls of this run, so that they share its keep-alive connections and access
+# token instead of paying interpreter startup and a TLS handshake each. Its
+# pipes are duplicated to plain descriptors, which subshells (deadlines,
+# command substitutions) inherit. Requests carry an ID, so the answer of a
+# request abandoned at its deadline is skipped by the next one.
+REST_SERVER_PID=""
+rest_server_start() {
+  # Sets REST_SERVER_PID
+  coproc REST_SERVER { exec python3 "$SCRIPT_DIR/google_vm_compute.py" serve 2>/dev/null; }
+  exec {REST_IN}>&"${REST_SERVER[1]}" {REST_OUT}<&"${REST_SERVER[0]}"
+}
+
+rest_server_stop() {
+  [[ -n "$REST_SERVER_PID" ]] || return 0
+  exec {REST_IN}>&- {REST_OUT}<&-
+  kill "$REST_SERVER_PID" 2>/dev/null
+  REST_SERVER_PID=""
+}
+
+# rest_call ACTION OP: run ACTION on the VM, recorded in the metrics as OP
+rest_call() {
+  local id="$BASHPID.$RANDOM" start rc=1 line kind
+  start=$(now_ms)
+  if [[ -n "$REST_SERVER_PID" ]] && { echo "$id $1 $VM_NAME $ZONE $PROJECT_ID" >&"$REST_IN"; } 2>/dev/null; then
+    while IFS= read -r line <&"$REST_OUT"; do
+      [[ "${line%% *}" == "$id" ]] || continue
+      line="${line#* }"
+      kind="${line%% *}"
+      line="${line#* }"
+      case "$kind" in
+        O) printf '%s\n' "$line" ;;
+        E) printf '%s\n' "$line" >&2 ;;
+        =) rc="$line"; break ;;
+      esac
+    done
+  else
+    python3 "$SCRIPT_DIR/google_vm_compute.py" "$1" "$VM_NAME" "$ZONE" "$PROJECT_ID"
+    rc=$?
+  fi
+  metric_record rest "$2" "$rc" $(( $(now_ms) - start ))
+  return "$rc"
+}
+
+compute_instance_action() {
+  if [[ "$COMPUTE_BACKEND" == "rest" ]]; then
+    rest_call "$1" "instances.$1" 2>&1
+  else
+    gcloud compute instances "$1" "$VM_NAME" \
+      --zone="$ZONE" \
+      --project="$PROJECT_ID" \
+      --quiet 2>&1
+  fi
+}
+
+# Print "STATUS<TAB>EXTERNAL_IP" for the instance
+compute_describe() {
+  if [[ "$COMPUTE_BACKEND" == "rest" ]]; then
+    rest_call describe instances.get 2>/dev/null
+  else
+    gcloud compute instances describe "$VM_NAME" \
+      --zone="$ZONE" \
+      --project="$PROJECT_ID" \
+      --format='value(status,networkInterfaces[0].accessConfigs[0].natIP)' 2>/dev/null
+  fi
+}
+
+# Readiness probing: every milestone is polled with a short, backed-off probe
+# until it passes or its deadline (in seconds) runs out
+PROBE_INITIAL_MS="${GOOGLE_VM_PROBE_INITIAL_MS:-250}"
+PROBE_MAX_MS="${GOOGLE_VM_PROBE_MAX_MS:-2000}"
+DEADLINE_RUNNING="${GOOGLE_VM_DEADLINE_RUNNING:-120}"
+DEADLINE_IP="${GOOGLE_VM_DEADLINE_IP:-60}"
+DEADLINE_SSH="${GOOGLE_VM_DEADLINE_SSH:-120}"
+DEADLINE_VNC="${GOOGLE_VM_DEADLINE_VNC:-60}"
+
+# Deadlines (in seconds) of single commands: the start/stop call, and each
+# probe or remote command, so that a hung gcloud or ssh cannot stall a step
+DEADLINE_ACTION="${GOOGLE_VM_DEADLINE_ACTION:-300}"
+DEADLINE_COMMAND="${GOOGLE_VM_DEADLINE_COMMAND:-30}"
+
+# Set by the callers when the VM was last seen RUNNING, e.g. after it was
+# pre-warmed: a start then checks the instance first and skips the start call
+# if it is up, so only the session has to be attached
+EXPECT_RUNNING="${GOOGLE_VM_EXPECT_RUNNING:-false}"
+
+# Failures that are worth retrying: rate limits, exhausted zone resources,
+# server errors, dropped connections and deadlines (exit code 124), and ssh
+# connection failures (exit code 255)
+RETRY_ATTEMPTS="${GOOGLE_VM_RETRIES:-3}"
+RETRY_BACKOFF_MS="${GOOGLE_VM_RETRY_BACKOFF_MS:-2000}"
+# The error patterns of google_vm_compute.py, matched case-insensitively;
+# fetched on the first failure, so runs without one do not pay for it
+TRANSIENT_ERRORS=""
+
+now_ms() {
+  if [[ -n "$EPOCHREALTIME" ]]; then
+    local t="${EPOCHREALTIME/[.,]/}"
+    echo $(( t / 1000 ))
+  else
+    date +%s%3N
+  fi
+}
+
+format_ms() {
+  printf '%d.%03d' $(( $1 / 1000 )) $(( $1 % 1000 ))
+}
+
+# With GOOGLE_VM_METRICS_LOG set, every gcloud, ssh, nc and remmina call is
+# logged there as "TOOL<TAB>OP<TAB>EXIT_CODE<TAB>MS"; the GUI and the CLI turn
+# the lines into metrics (see google_vm_metrics.py). The tools are wrapped by
+# shell functions of the same name, so every call site is covered.
+METRICS_LOG="${GOOGLE_VM_METRICS_LOG:-}"
+
+metric_record() {
+  [[ -n "$METRICS_LOG" ]] && { printf '%s\t%s\t%d\t%d\n' "$1" "$2" "$3" "$4" >> "$METRICS_LOG"; } 2>/dev/null
+  return 0
+}
+
+# metered TOOL OP COMMAND...
+metered() {
+  local tool="$1" op="$2" start rc
+  shift 2
+  start=$(now_ms)
+  command "$@"
+  rc=$?
+  metric_record "$tool" "$op" "$rc" $(( $(now_ms) - start ))
+  return $rc
+}
+
+gcloud() {
+  metered gcloud "$1 $2 $3" "$GCLOUD_BIN" "$@"
+}
+
+ssh() {
+  local op=command
+  case " $* " in
+    *" -O "*) op=control ;;
+    *" -fN "*) op=master ;;
+    *" -L "*) op=tunnel ;;
+  esac
+  metered ssh "$op" ssh "$@"
+}
+
+nc() {
+  metered nc probe nc "$@"
+}
+
+# Milliseconds on a monotonic clock (time since boot)
+mono_ms() {
+  local up
+  read -r up _ < /proc/uptime
+  echo $(( ${up/./} * 10 ))
+}
+
+# Structured phase events, parsed by the GUI into a per-operation timeline:
+#   @@PHASE start NAME MONO_MS
+#   @@PHASE end NAME MONO_MS ok|fail
+CURRENT_PHASE=""
+
+phase_start() {
+  CURRENT_PHASE="$1"
+  echo "@@PHASE start $1 $(mono_ms)"
+}
+
+phase_end() {
+  echo "@@PHASE end $CURRENT_PHASE $(mono_ms) ${1:-ok}"
+  CURRENT_PHASE=""
+}
+
+# A phase still open when the script exits has failed
+trap '[[ -n "$CURRENT_PHASE" ]] && phase_end fail; rest_server_stop' EXIT
+
+# Cancelling an operation sends SIGTERM to the whole process group; exit
+# through the EXIT trap so that the open phase is reported as failed
+trap 'exit 143' TERM
+trap 'exit 130' INT
+
+kill_tree() {
+  local child
+  for child in $(pgrep -P "$1"); do
+    kill_tree "$child"
+  done
+  kill -TERM "$1" 2>/dev/null
+}
+
+# run_with_deadline SECONDS COMMAND...
+# Run COMMAND (a shell function is fine) and kill it with everything it
+# started once it has run for SECONDS. Returns 124 if the deadline was hit.
+run_with_deadline() {
+  local deadline_s="$1" pid watchdog rc
+  shift
+  "$@" &
+  pid=$!
+  (
+    trap 'kill "$sleeper" 2>/dev/null; exit 0' TERM
+    sleep "$deadline_s" & sleeper=$!
+    wait "$sleeper"
+    kill_tree "$pid"
+  ) >/dev/null 2>&1 &
+  watchdog=$!
+  wait "$pid"
+  rc=$?
+  if kill -0 "$watchdog" 2>/dev/null; then
+    kill -TERM "$watchdog" 2>/dev/null
+    wait "$watchdog" 2>/dev/null
+    return $rc
+  fi
+  return 124
+}
+
+# retry_transient LABEL COMMAND...
+# Run COMMAND and run it again with exponential backoff while it fails with
+# a transient error, reporting every retry. Its output ends up in
+# RETRY_OUTPUT; the return code is that of the last attempt.
+RETRY_OUTPUT=""
+retry_transient() {
+  local label="$1" attempt=1 delay=$RETRY_BACKOFF_MS rc reason
+  shift
+  while true; do
+    RETRY_OUTPUT=$("$@" 2>&1)
+    rc=$?
+    (( rc == 0 )) && return 0
+    if (( rc == 124 )); then
+      reason="deadline exceeded"
+    elif (( rc == 255 )); then
+      reason="SSH connection failed"
+    else
+      reason=""
+      [[ -z "$TRANSIENT_ERRORS" ]] && TRANSIENT_ERRORS="$(python3 "$SCRIPT_DIR/google_vm_compute.py" transient-pattern 2>/dev/null)"
+      [[ -n "$TRANSIENT_ERRORS" ]] && reason=$(grep -oiE "$TRANSIENT_ERRORS" <<< "$RETRY_OUTPUT" | head -1)
+    fi
+    if [[ -z "$reason" ]] || (( attempt > RETRY_ATTEMPTS )); then
+      return $rc
+    fi
+    echo "🔁 $label: $reason, retry $attempt/$RETRY_ATTEMPTS in $(format_ms $delay)s"
+    sleep "$(format_ms $delay)"
+    attempt=$(( attempt + 1 ))
+    delay=$(( delay * 2 ))
+  done
+}
+
+# wait_for LABEL DEADLINE_SECONDS PROBE_COMMAND...
+wait_for() {
+  local label="$1" deadline_s="$2"
+  local deadline_ms=$(( deadline_s * 1000 ))
+  shift 2
+  local start delay=$PROBE_INITIAL_MS elapsed
+  start=$(now_ms)
+  while true; do
+    if "$@" >/dev/null 2>&1; then
+      elapsed=$(( $(now_ms) - start ))
+      echo "✅ $label after $(format_ms $elapsed)s"
+      return 0
+    fi
+    elapsed=$(( $(now_ms) - start ))
+    if (( elapsed >= deadline_ms )); then
+      echo "❌ $label: not reached within ${deadline_s}s"
+      return 1
+    fi
+    (( delay > deadline_ms - elapsed )) && delay=$(( deadline_ms - elapsed ))
+    sleep "$(format_ms $delay)"
+    delay=$(( delay * 2 ))
+    (( delay > PROBE_MAX_MS )) && delay=$PROBE_MAX_MS
+  done
+}
+
+# All remote commands share one multiplexed SSH connection per VM. The
+# master stays up for GOOGLE_VM_SSH_PERSIST after the last use, so later
+# reconnects to the same VM skip the key exchange and authentication.
+SSH_PERSIST="${GOOGLE_VM_SSH_PERSIST:-10m}"
+SSH_CONTROL_DIR="$HOME/.ssh/google-vm-manager"
+SSH_OPTS=(-i "$SSH_KEY_PATH" -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR
+  -o ConnectTimeout=5 -o ControlPath="$SSH_CONTROL_DIR/%C")
+
+# The control path depends on the IP, which is gone once the VM is stopped,
+# so the destination of the master is remembered per VM
+SSH_MASTER_DEST="$SSH_CONTROL_DIR/$PROJECT_ID.$ZONE.$VM_NAME.dest"
+
+# Make sure a master connection to the VM is up
+ssh_master_open() {
+  mkdir -p -m 700 "$SSH_CONTROL_DIR"
+  echo "$SSH_USERNAME@$VM_IP" > "$SSH_MASTER_DEST"
+  ssh "${SSH_OPTS[@]}" -O check "$SSH_USERNAME@$VM_IP" >/dev/null 2>&1 && return 0
+  ssh "${SSH_OPTS[@]}" -o ControlMaster=yes -o ControlPersist="$SSH_PERSIST" -o ServerAliveInterval=15 \
+      -fN "$SSH_USERNAME@$VM_IP" </dev/null >/dev/null 2>&1
+}
+
+# Close the master connection of the last start (best effort), so that a
+# quick restart does not try a dead one first
+ssh_master_close() {
+  local dest
+  dest="$(cat "$SSH_MASTER_DEST" 2>/dev/null)" || return 0
+  rm -f "$SSH_MASTER_DEST"
+  [[ -n "$dest" ]] || return 0
+  run_with_deadline 5 ssh "${SSH_OPTS[@]}" -O exit "$dest" >/dev/null 2>&1 || true
+}
+
+# Run a command on the VM over the master connection
+remote() {
+  ssh "${SSH_OPTS[@]}" -o ControlMaster=no "$SSH_USERNAME@$VM_IP" "$@"
+}
+
+# The manager keeps its Host entries in a fragment of its own, included from
+# ~/.ssh/config. Each VM has one entry, found by its marker comment; a start
+# only rewrites that fragment, under a lock, when the VM's entry changed.
+SSH_MANAGED_CONFIG="${GOOGLE_VM_SSH_CONFIG:-$HOME/.ssh/config.d/google-vm-manager}"
+SSH_ENTRY_MARKER="# google-vm-manager: $PROJECT_ID/$ZONE/$VM_NAME"
+
+ssh_config_entry() {
+  printf '%s\nHost %s\n    HostName %s\n    User %s\n    IdentityFile %s\n    StrictHostKeyChecking no\n' \
+    "$SSH_ENTRY_MARKER" "$VM_NAME" "$VM_IP" "$SSH_USERNAME" "$SSH_KEY_PATH"
+}
+
+# Print the VM's current entry in the managed fragment
+ssh_config_current() {
+  awk -v marker="$SSH_ENTRY_MARKER" '
+    $0 == marker { in_entry=1 }
+    in_entry && /^$/ { exit }
+    in_entry { print }
+  ' "$SSH_MANAGED_CONFIG" 2>/dev/null
+}
+
+ssh_config_included() {
+  grep -qxF "Include $SSH_MANAGED_CONFIG" "$HOME/.ssh/config" 2>/dev/null
+}
+
+# Add the Include line at the top of ~/.ssh/config, so the managed entries
+# take precedence over older Host blocks further down
+# Prepend the Include to ~/.ssh/config, creating it (mode 600) on first use
+ssh_config_add_include() {
+  local main tmp
+  ssh_config_included && return 0
+  mkdir -p -m 700 "$HOME/.ssh" || return 1
+  main="$(readlink -f "$HOME/.ssh/config")"
+  tmp="$main.tmp.$$"
+  if ( umask 077
+       { echo "Include $SSH_MANAGED_CONFIG"; echo; if [[ -f "$main" ]]; then cat "$main"; fi; } > "$tmp" ); then
+    mv -f "$tmp" "$main"
+  else
+    rm -f "$tmp"
+    return 1
+  fi
+}
+
+ssh_config_update() {
+  local entry
+  entry="$(ssh_config_entry)"
+  if [[ "$(ssh_config_current)" == "$entry" ]] && ssh_config_included; then
+    echo "✅ SSH config up to date"
+    return 0
+  fi
+
+  mkdir -p -m 700 "$(dirname "$SSH_MANAGED_CONFIG")" || return 1
+  (
+    if command -v flock >/dev/null; then
+      flock -w 10 9 || exit 1
+    fi
+    ssh_config_add_include || exit 1
+    # Another start may have written the same entry while we waited
+    [[ "$(ssh_config_current)" == "$entry" ]] && exit 0
+    tmp="$SSH_MANAGED_CONFIG.tmp.$$"
+    {
+      awk -v marker="$SSH_ENTRY_MARKER" '
+        $0 == marker { skip=1; next }
+        skip { if (/^$/) skip=0; next }
+        { print }
+      ' "$SSH_MANAGED_CONFIG" 2>/dev/null
+      printf '%s\n\n' "$entry"
+    } > "$tmp" && mv -f "$tmp" "$SSH_MANAGED_CONFIG"
+  ) 9>"$SSH_MANAGED_CONFIG.lock" || return 1
+  echo "✅ SSH config updated for $VM_NAME ($VM_IP)"
+}
+
+# VNC settings follow the measured link to the VM. GOOGLE_VM_VNC_PRESET
+# forces a preset (lan|good|medium|poor) instead of measuring;
+# GOOGLE_VM_VNC_TRANSPORT=ssh routes VNC through a compressed SSH tunnel
+# bound to localhost, auto does so on medium and poor links.
+VNC_PRESET="${GOOGLE_VM_VNC_PRESET:-auto}"
+VNC_TRANSPORT="${GOOGLE_VM_VNC_TRANSPORT:-direct}"
+LINK_PROBE_BYTES="${GOOGLE_VM_LINK_PROBE_BYTES:-262144}"
+LINK_PROBE_DEADLINE="${GOOGLE_VM_LINK_PROBE_DEADLINE:-5}"
+
+LINK_RTT_MS=""
+LINK_KBPS=""
+
+# Round trip over the master connection (best of three) and the rate of a
+# random, incompressible download of LINK_PROBE_BYTES
+measure_link() {
+  local i t0 elapsed best="" received
+  for i in 1 2 3; do
+    t0=$(now_ms)
+    run_with_deadline "$LINK_PROBE_DEADLINE" remote true >/dev/null 2>&1 || return 1
+    elapsed=$(( $(now_ms) - t0 ))
+    [[ -z "$best" ]] || (( elapsed < best )) && best=$elapsed
+  done
+  LINK_RTT_MS=$best
+
+  t0=$(now_ms)
+  received=$(run_with_deadline "$LINK_PROBE_DEADLINE" remote "head -c $LINK_PROBE_BYTES /dev/urandom" 2>/dev/null | wc -c)
+  elapsed=$(( $(now_ms) - t0 - LINK_RTT_MS ))
+  (( received > 0 )) || return 1
+  (( elapsed < 1 )) && elapsed=1
+  LINK_KBPS=$(( received * 8 / elapsed ))
+}
+
+# Pick the preset for the measured link; thresholds are RTT in ms and
+# throughput in kbit/s
+link_preset() {
+  if (( LINK_RTT_MS <= 20 && LINK_KBPS >= 50000 )); then
+    echo lan
+  elif (( LINK_RTT_MS <= 60 && LINK_KBPS >= 10000 )); then
+    echo good
+  elif (( LINK_RTT_MS <= 150 && LINK_KBPS >= 2000 )); then
+    echo medium
+  else
+    echo poor
+  fi
+}
+
+# Remmina's VNC quality setting selects the encodings: 9 is raw/hextile/zlib
+# for fast links, 2, 1 and 0 are tight/zrle with increasing compression
+# and decreasing JPEG quality
+apply_vnc_preset() {
+  case "$1" in
+    lan)    VNC_QUALITY=9; VNC_COLORDEPTH=32; VNC_ENCODING="raw/hextile/zlib" ;;
+    good)   VNC_QUALITY=2; VNC_COLORDEPTH=24; VNC_ENCODING="tight/zrle, light compression" ;;
+    medium) VNC_QUALITY=1; VNC_COLORDEPTH=16; VNC_ENCODING="tight/zrle, medium compression" ;;
+    poor)   VNC_QUALITY=0; VNC_COLORDEPTH=8;  VNC_ENCODING="tight/zrle, maximum compression" ;;
+    *)      VNC_QUALITY=2; VNC_COLORDEPTH=32; VNC_ENCODING="tight/zrle (default)" ;;
+  esac
+  VNC_PRESET_CHOSEN="$1"
+}
+
+# Find the user's running VNC server, preferring VNC_DISPLAY, and set
+# EXISTING_DISPLAY and EXISTING_GEOMETRY (taken from the server's
+# arguments, or from xdpyinfo when it was started without -geometry)
+detect_vnc_session() {
+  local sessions line
+  sessions=$(run_with_deadline "$DEADLINE_COMMAND" remote 'ps -u "$(id -u)" -o args=' 2>/dev/null \
+    | grep -E '^[^ ]*X(tiger|tight)?vnc :[0-9]+( |$)')
+  [[ -n "$sessions" ]] || return 1
+  line=$(grep -E "vnc $VNC_DISPLAY( |$)" <<< "$sessions" | head -1)
+  [[ -n "$line" ]] || line=$(head -1 <<< "$sessions")
+  EXISTING_DISPLAY=$(grep -oE ' :[0-9]+' <<< "$line" | head -1 | tr -d ' ')
+  EXISTING_GEOMETRY=$(grep -oE -- '-geometry[= ][0-9]+x[0-9]+' <<< "$line" | grep -oE '[0-9]+x[0-9]+$')
+  if [[ -z "$EXISTING_GEOMETRY" ]]; then
+    EXISTING_GEOMETRY=$(run_with_deadline "$DEADLINE_COMMAND" \
+      remote "DISPLAY=$EXISTING_DISPLAY xdpyinfo 2>/dev/null | awk '/dimensions:/ {print \$2; exit}'" 2>/dev/null)
+  fi
+  return 0
+}
+
+# Forward a free local port to the VNC port over a compressed SSH connection
+# of its own (-C), bound to localhost. The tunnel stays up while the VNC
+# client is connected and closes once it disconnects.
+open_vnc_tunnel() {
+  local port
+  for port in $(seq $(( 15900 + DISPLAY_NUM )) $(( 15919 + DISPLAY_NUM ))); do
+    nc -z -w1 127.0.0.1 "$port" >/dev/null 2>&1 && continue
+    if ssh -i "$SSH_KEY_PATH" -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR \
+        -o ConnectTimeout=5 -o ControlPath=none -o ExitOnForwardFailure=yes -C \
+        -f -L "127.0.0.1:$port:localhost:$VNC_PORT" "$SSH_USERNAME@$VM_IP" "sleep 30" </dev/null >/dev/null 2>&1; then
+      TUNNEL_PORT=$port
+      return 0
+    fi
+  done
+  return 1
+}
+
+VM_STATUS=""
+VM_IP=""
+
+# One describe call feeds both the RUNNING and the external IP milestone
+probe_instance() {
+  local fields
+  fields=$(run_with_deadline "$DEADLINE_COMMAND" compute_describe) || return 1
+  VM_STATUS="${fields%%$'\t'*}"
+  VM_IP=""
+  [[ "$fields" == *$'\t'* ]] && VM_IP="${fields#*$'\t'}"
+  return 0
+}
+
+probe_running() {
+  probe_instance && [[ "$VM_STATUS" == "RUNNING" ]]
+}
+
+probe_external_ip() {
+  [[ -n "$VM_IP" ]] || { probe_instance && [[ -n "$VM_IP" ]]; }
+}
+
+probe_port_open() {
+  nc -z -w2 "$1" "$2"
+}
+
+probe_port_closed() {
+  ! nc -z -w1 "$1" "$2"
+}
+
+# With the SSH transport the VNC server only listens on the loopback
+# interface of the VM, so its port is probed on the VM, over the master
+# connection: the local end of a tunnel accepts connections either way
+probe_vnc_open() {
+  if [[ "$USE_TUNNEL" == true ]]; then
+    run_with_deadline "$DEADLINE_COMMAND" remote "timeout 2 bash -c 'exec 3<>/dev/tcp/127.0.0.1/$1'" >/dev/null 2>&1
+  else
+    probe_port_open "$VM_IP" "$1"
+  fi
+}
+
+probe_vnc_closed() {
+  ! probe_vnc_open "$1"
+}
+
 echo "▶ $MODE VM: $VM_NAME in zone $ZONE (project: $PROJECT_ID)"
 echo "▶ Using SSH username: $SSH_USERNAME"
 
@@ -59,128 +585,204 @@ else
   echo "🛑 Stopping VM..."
 fi
 
-gcloud compute instances "$MODE" "$VM_NAME" \
-  --zone="$ZONE" \
-  --project="$PROJECT_ID" \
-  --quiet 2>/dev/null | grep -E "(done|Updated|ERROR|FAILED)" || echo "✅ VM operation completed"
+[[ "$COMPUTE_BACKEND" == "rest" ]] && rest_server_start
+
+phase_start vm_action
+ALREADY_RUNNING=false
+if [[ "$MODE" == "start" && "$EXPECT_RUNNING" == true ]] && probe_running; then
+  ALREADY_RUNNING=true
+  echo "✅ VM already running"
+elif ! retry_transient "VM $MODE" run_with_deadline "$DEADLINE_ACTION" compute_instance_action "$MODE"; then
+  echo "❌ VM $MODE failed"
+  grep -E "(ERROR|FAILED|rror)" <<< "$RETRY_OUTPUT" | head -5
+  exit 1
+else
+  grep -E "(done|Updated)" <<< "$RETRY_OUTPUT" || echo "✅ VM operation completed"
+fi
+phase_end
 
 if [[ "$MODE" == "stop" ]]; then
+  ssh_master_close
   echo "✅ VM stopped successfully"
   exit 0
 fi
 
-echo "⏳ Getting VM IP address..."
-sleep 3
-VM_IP=$(gcloud compute instances describe "$VM_NAME" \
-  --zone="$ZONE" \
-  --project="$PROJECT_ID" \
-  --format='get(networkInterfaces[0].accessConfigs[0].natIP)' 2>/dev/null)
+echo "⏳ Waiting for VM to be ready..."
+phase_start instance_running
+if [[ "$ALREADY_RUNNING" != true ]]; then
+  wait_for "Instance RUNNING" "$DEADLINE_RUNNING" probe_running || exit 1
+fi
+phase_end
 
-if [[ -z "$VM_IP" ]]; then
+phase_start external_ip
+if ! wait_for "External IP assigned" "$DEADLINE_IP" probe_external_ip; then
   echo "❌ Could not retrieve external IP."
   exit 1
 fi
+phase_end
 
 echo "✅ VM external IP: $VM_IP"
+# No further Compute Engine calls from here on
+rest_server_stop
 
-# Update SSH config silently
-SSH_CONFIG_FILE=~/.ssh/config
-SSH_HOST_ENTRY="Host $VM_NAME"
-
-if grep -q "$SSH_HOST_ENTRY" "$SSH_CONFIG_FILE" 2>/dev/null; then
-    awk -v vm="$VM_NAME" -v ip="$VM_IP" -v key="$SSH_KEY_PATH" -v username="$SSH_USERNAME" '
-        $1 == "Host" && $2 == vm { print; in_block=1; next }
-        in_block && $1 == "HostName" { print "    HostName " ip; next }
-        in_block && $1 == "User" { print "    User " username; next }
-        in_block && $1 == "IdentityFile" { print "    IdentityFile " key; next }
-        in_block && $1 == "Host" && $2 != vm { in_block=0 }
-        { print }
-    ' "$SSH_CONFIG_FILE" > "${SSH_CONFIG_FILE}.tmp" && mv "${SSH_CONFIG_FILE}.tmp" "$SSH_CONFIG_FILE"
-else
-    echo -e "\nHost $VM_NAME\n    HostName $VM_IP\n    User $SSH_USERNAME\n    IdentityFile $SSH_KEY_PATH\n    StrictHostKeyChecking no" >> "$SSH_CONFIG_FILE"
-fi
+# Point the VM's SSH host alias at its current IP
+phase_start ssh_config
+ssh_config_update || echo "⚠️ Could not update SSH config"
+phase_end
 
 if [ "$NO_VNC" = true ]; then
   echo "✅ VM started without VNC"
   exit 0
 fi
 
-echo "🖥️ Setting up VNC server ($VNC_RESOLUTION)..."
-
-# Kill existing VNC sessions silently
-ssh -i "$SSH_KEY_PATH" -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR \
-    $SSH_USERNAME@$VM_IP "vncserver -kill $VNC_DISPLAY" >/dev/null 2>&1
-
-sleep 5
-
-# Start VNC server and capture only essential output
-VNC_OUTPUT=$(ssh -i "$SSH_KEY_PATH" -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR \
-    $SSH_USERNAME@$VM_IP "vncserver $VNC_DISPLAY -geometry $VNC_RESOLUTION -depth 24 -localhost no" 2>&1)
+phase_start ssh_ready
+wait_for "SSH accepting connections" "$DEADLINE_SSH" probe_port_open "$VM_IP" 22 || exit 1
+wait_for "SSH session established" "$DEADLINE_SSH" run_with_deadline "$DEADLINE_COMMAND" ssh_master_open || exit 1
+phase_end
+
+phase_start link_probe
+if [[ "$VNC_PRESET" == "auto" ]]; then
+  if measure_link; then
+    apply_vnc_preset "$(link_preset)"
+    echo "📶 Link: RTT ${LINK_RTT_MS} ms, $(format_ms "$LINK_KBPS") Mbit/s -> VNC preset $VNC_PRESET_CHOSEN (quality=$VNC_QUALITY, colordepth=$VNC_COLORDEPTH, $VNC_ENCODING)"
+  else
+    apply_vnc_preset default
+    echo "📶 Link measurement failed -> default VNC settings (quality=$VNC_QUALITY, colordepth=$VNC_COLORDEPTH)"
+  fi
+else
+  apply_vnc_preset "$VNC_PRESET"
+  echo "📶 VNC preset $VNC_PRESET_CHOSEN set by GOOGLE_VM_VNC_PRESET (quality=$VNC_QUALITY, colordepth=$VNC_COLORDEPTH, $VNC_ENCODING)"
+fi
+phase_end
+
+# Decided before the server starts: behind the tunnel it only accepts local
+# connections, so its port is never reachable from outside
+USE_TUNNEL=false
+if [[ "$VNC_TRANSPORT" == "ssh" ]]; then
+  USE_TUNNEL=true
+elif [[ "$VNC_TRANSPORT" == "auto" && ( "$VNC_PRESET_CHOSEN" == "medium" || "$VNC_PRESET_CHOSEN" == "poor" ) ]]; then
+  USE_TUNNEL=true
+fi
+VNC_LOCALHOST=no
+[[ "$USE_TUNNEL" == true ]] && VNC_LOCALHOST=yes
 
-if echo "$VNC_OUTPUT" | grep -q "desktop"; then
-    echo "✅ VNC server started successfully"
-    # Extract the actual display number from output
-    ACTUAL_DISPLAY=$(echo "$VNC_OUTPUT" | grep -o ":[0-9]\+" | head -1)
-    if [[ -n "$ACTUAL_DISPLAY" ]]; then
-        VNC_DISPLAY="$ACTUAL_DISPLAY"
-        echo "▶ VNC running on display $VNC_DISPLAY"
-    fi
+echo "🖥️ Setting up VNC server ($VNC_RESOLUTION)..."
+phase_start vnc_server
+
+# A running session with the requested geometry that answers on its port is
+# kept, together with the desktop the user left open
+VNC_REUSED=false
+if detect_vnc_session; then
+  EXISTING_PORT=$((5900 + ${EXISTING_DISPLAY#:}))
+  if [[ "$EXISTING_GEOMETRY" != "$VNC_RESOLUTION" ]]; then
+    RESTART_REASON="geometry ${EXISTING_GEOMETRY:-unknown}, requested $VNC_RESOLUTION"
+  elif ! probe_vnc_open "$EXISTING_PORT"; then
+    RESTART_REASON="not answering on port $EXISTING_PORT"
+  elif [[ "$USE_TUNNEL" == true ]] && probe_port_open "$VM_IP" "$EXISTING_PORT"; then
+    RESTART_REASON="port $EXISTING_PORT reachable from outside, SSH transport requested"
+  else
+    RESTART_REASON=""
+  fi
+  VNC_DISPLAY="$EXISTING_DISPLAY"
+  if [[ -z "$RESTART_REASON" ]]; then
+    VNC_REUSED=true
+    echo "♻️ Reusing VNC session on display $VNC_DISPLAY ($EXISTING_GEOMETRY)"
+  else
+    echo "🔄 Restarting VNC session on display $VNC_DISPLAY: $RESTART_REASON"
+    run_with_deadline "$DEADLINE_COMMAND" remote "vncserver -kill $VNC_DISPLAY" >/dev/null 2>&1
+    wait_for "Previous VNC session released" "$DEADLINE_VNC" probe_vnc_closed "$EXISTING_PORT" >/dev/null
+  fi
 else
-    echo "❌ VNC server failed to start"
-    echo "$VNC_OUTPUT" | grep -E "(ERROR|FAILED|refused|Permission denied)"
-    exit 1
+  # No server process; clear lock files a crashed server may have left
+  run_with_deadline "$DEADLINE_COMMAND" remote "vncserver -kill $VNC_DISPLAY" >/dev/null 2>&1
 fi
 
-echo "⏳ Waiting for VNC to be ready..."
-sleep 8
+if [[ "$VNC_REUSED" != true ]]; then
+  # Start VNC server and capture only essential output
+  retry_transient "VNC server start" run_with_deadline "$DEADLINE_COMMAND" \
+    remote "vncserver $VNC_DISPLAY -geometry $VNC_RESOLUTION -depth 24 -localhost $VNC_LOCALHOST"
+  VNC_OUTPUT="$RETRY_OUTPUT"
+
+  if echo "$VNC_OUTPUT" | grep -q "desktop"; then
+      echo "✅ VNC server started successfully"
+      # Extract the actual display number from output
+      ACTUAL_DISPLAY=$(echo "$VNC_OUTPUT" | grep -o ":[0-9]\+" | head -1)
+      if [[ -n "$ACTUAL_DISPLAY" ]]; then
+          VNC_DISPLAY="$ACTUAL_DISPLAY"
+          echo "▶ VNC running on display $VNC_DISPLAY"
+      fi
+  else
+      echo "❌ VNC server failed to start"
+      echo "$VNC_OUTPUT" | grep -E "(ERROR|FAILED|refused|Permission denied)"
+      exit 1
+  fi
+fi
+phase_end
 
 # Calculate VNC port (display :1 = port 5901, :2 = port 5902, etc.)
 DISPLAY_NUM=${VNC_DISPLAY#:}
 VNC_PORT=$((5900 + DISPLAY_NUM))
 
-echo "▶ Testing VNC connection on port $VNC_PORT..."
-
-# Test connection silently with multiple attempts
 VNC_READY=false
-for i in {1..3}; do
-    if nc -z -w5 $VM_IP $VNC_PORT >/dev/null 2>&1; then
+if [[ "$VNC_REUSED" == true ]]; then
+    # Its port was just checked
+    VNC_READY=true
+    phase_start vnc_port
+else
+    echo "▶ Waiting for VNC on port $VNC_PORT..."
+    phase_start vnc_port
+    if wait_for "VNC port $VNC_PORT open" "$DEADLINE_VNC" probe_vnc_open "$VNC_PORT"; then
         VNC_READY=true
-        break
     fi
-    echo "▶ Attempt $i failed, retrying..."
-    sleep 3
-done
+fi
 
 if [ "$VNC_READY" = true ]; then
+    phase_end
     echo "✅ VNC connection ready on port $VNC_PORT"
 else
     echo "❌ VNC server not responding on port $VNC_PORT"
     # Try to get more info about what's running
     echo "▶ Checking VNC processes on remote server..."
-    ssh -i "$SSH_KEY_PATH" -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR \
-        $SSH_USERNAME@$VM_IP "ps aux | grep vnc | grep -v grep" 2>/dev/null || echo "No VNC processes found"
+    run_with_deadline "$DEADLINE_COMMAND" remote "ps aux | grep vnc | grep -v grep" 2>/dev/null || echo "No VNC processes found"
     exit 1
 fi
 
 # Generate Remmina config
+phase_start vnc_client
+VNC_SERVER="$VM_IP:$VNC_PORT"
+if [[ "$USE_TUNNEL" == true ]]; then
+  if ! open_vnc_tunnel; then
+    echo "❌ Could not open SSH tunnel to VNC port $VNC_PORT, which only accepts local connections"
+    exit 1
+  fi
+  VNC_SERVER="127.0.0.1:$TUNNEL_PORT"
+  echo "🔒 VNC over compressed SSH tunnel: $VNC_SERVER -> localhost:$VNC_PORT on $VM_IP (transport=$VNC_TRANSPORT)"
+else
+  echo "▶ VNC direct to $VNC_SERVER (transport=$VNC_TRANSPORT)"
+fi
+
 mkdir -p "$(dirname "$REMOTECONFIG")"
 cat > "$REMOTECONFIG" <<EOL
 [remmina]
 protocol=VNC
-server=$VM_IP:$VNC_PORT
+server=$VNC_SERVER
 name=${VM_NAME}_dynamic
 group=
 password=
-quality=2
-colordepth=32
+quality=$VNC_QUALITY
+colordepth=$VNC_COLORDEPTH
 disableencryption=1
 EOL
 
 echo "🚀 Launching VNC client..."
 
-# Launch Remmina silently in background
-G_MESSAGES_DEBUG="" remmina -c "$REMOTECONFIG" >/dev/null 2>&1 &
+# Launch Remmina silently in background, in a session of its own so that
+# cancelling the operation does not close it
+G_MESSAGES_DEBUG="" setsid remmina -c "$REMOTECONFIG" >/dev/null 2>&1 &
+# The client runs on its own, so only the launch itself is counted
+metric_record remmina launch 0 0
+phase_end
 
 sleep 2
 echo "✅ Setup complete! VNC client should be starting..."
-echo "💡 Manual connection: $VM_IP:$VNC_PORT"
+echo "💡 Manual connection: $VNC_SERVER"
@@ -0,0 +1,206 @@
+"""Counters and latency histograms of the external calls the manager makes.
+
+Every gcloud, REST API, ssh, nc and remmina call is recorded by tool, kind
+of call (op) and target (the VM, or the project of fleet-wide calls):
+
+    google_vm_external_calls_total{tool,op,target,result}
+    google_vm_external_call_duration_seconds{tool,op,target}
+
+together with status cache hits and misses, status refreshes skipped while
+one was still running, and the operations run. The GUI and the daemon serve
+them in the Prometheus text format on 127.0.0.1:GOOGLE_VM_METRICS_PORT and/or
+rewrite GOOGLE_VM_METRICS_TEXTFILE every METRICS_TEXTFILE_INTERVAL seconds,
+e.g. for the textfile collector of node_exporter.
+
+google_vm_manager.sh runs as a process of its own; with GOOGLE_VM_METRICS_LOG
+set it appends one "TOOL<TAB>OP<TAB>EXIT_CODE<TAB>MS" line per call to that
+file, and record_call_log() adds them to the registry.
+"""
+import os, threading, time
+from contextlib import contextmanager
+
+METRICS_PORT = os.environ.get("GOOGLE_VM_METRICS_PORT")
+METRICS_TEXTFILE = os.environ.get("GOOGLE_VM_METRICS_TEXTFILE")
+METRICS_TEXTFILE_INTERVAL = 15
+
+# Upper bounds in seconds, from a local nc probe to a VM start
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRICS = {
+    'google_vm_external_calls_total': ('counter', "External commands and API calls, by result"),
+    'google_vm_external_call_duration_seconds': ('histogram', "Duration of external commands and API calls"),
+    'google_vm_status_cache_requests_total': ('counter', "Status lookups answered from the cache (hit), or fetched (miss, or bypass when forced)"),
+    'google_vm_status_refresh_skipped_total': ('counter', "Status refreshes skipped because one was still running"),
+    'google_vm_status_refresh_duration_seconds': ('histogram', "Duration of fleet status refreshes"),
+    'google_vm_operations_total': ('counter', "Start and stop operations, by trigger and result"),
+    'google_vm_operation_duration_seconds': ('histogram', "Duration of start and stop operations"),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}    # name -> {labels: value}
+        self._histograms = {}  # name -> {labels: [count per bucket..., sum, count]}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def value(self, name, **labels):
+        """Current value of a counter, or the observation count of a histogram"""
+        key = tuple(labels.items())
+        with self._lock:
+            if name in self._histograms:
+                values = self._histograms[name].get(key)
+                return values[-1] if values else 0
+            return self._counters.get(name, {}).get(key, 0)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == 'counter':
+                    for labels, value in sorted(self._counters.get(name, {}).items()):
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                for labels, values in sorted(self._histograms.get(name, {}).items()):
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the metrics to path atomically"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+# Shared by everything in the process
+registry = MetricsRegistry()
+
+
+def record_call(tool, op, target, seconds, ok):
+    registry.inc('google_vm_external_calls_total', tool=tool, op=op, target=target,
+                 result="ok" if ok else "error")
+    registry.observe('google_vm_external_call_duration_seconds', seconds, tool=tool, op=op, target=target)
+
+
+@contextmanager
+def timed_call(tool, op, target=""):
+    """Record the enclosed call; it failed if it raised
+
+    The yielded dict can be used to mark a failure that did not raise,
+    e.g. a non-zero exit code: call['ok'] = False.
+    """
+    call = {'ok': True}
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call['ok'] = False
+        raise
+    finally:
+        record_call(tool, op, target, time.perf_counter() - started, call['ok'])
+
+
+def record_call_log(path, target):
+    """Add the calls logged by google_vm_manager.sh to the registry and remove the log"""
+    try:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+        os.remove(path)
+    except OSError:
+        return
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) != 4:
+            continue
+        tool, op, exit_code, ms = fields
+        try:
+            record_call(tool, op, target, int(ms) / 1000, int(exit_code) == 0)
+        except ValueError:
+            continue
+
+
+def record_operation(action, trigger, exit_code, seconds):
+    result = "ok" if exit_code == 0 else "error"
+    registry.inc('google_vm_operations_total', action=action, trigger=trigger, result=result)
+    registry.observe('google_vm_operation_duration_seconds', seconds, action=action)
+
+
+def serve_metrics(port=METRICS_PORT, textfile=METRICS_TEXTFILE, interval=METRICS_TEXTFILE_INTERVAL):
+    """Export the registry as configured; returns the HTTP server, if any
+
+    Both run in daemon threads: the HTTP endpoint on 127.0.0.1:port, and a
+    rewrite of textfile every interval seconds.
+    """
+    server = None
+    if port:
+        # Imported here: http.server pulls in http.client, which the app
+        # otherwise only loads when the REST backend is used
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", int(port)), MetricsRequestHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    if textfile:
+        def write_periodically():
+            while True:
+                try:
+                    registry.write_textfile(textfile)
+                except OSError:
+                    pass
+                time.sleep(interval)
+        threading.Thread(target=write_periodically, daemon=True).start()
+    return server
@@ -0,0 +1,232 @@
+"""Start VMs ahead of their expected use and stop them if nobody came.
+
+A VM opts in with a 'prewarm' entry in its settings: a schedule such as
+"Mon-Fri 08:30" (or just "08:30" for every day), or "auto" to use the time it
+is usually first started on that kind of day (workday or weekend), learned
+from its start history. PREWARM_LEAD_MIN minutes before that time it is
+started without VNC, so that the instance is RUNNING and its IP is known
+when the user starts a session. A pre-warmed VM that no operation of the
+user touched by PREWARM_GRACE_MIN minutes after the expected time is stopped
+again.
+
+Which VMs were pre-warmed on which day is kept in PREWARM_STATE_FILE under a
+lock, so the GUI and the daemon never both act on the same VM.
+"""
+import os, json, fcntl, datetime, threading, time
+
+from google_vm_compute import CACHE_DIR
+from google_vm_status import vm_key
+
+PREWARM_STATE_FILE = os.path.join(CACHE_DIR, "prewarm.json")
+
+# Minutes a VM is started before its expected use, and minutes after that
+# time an unused pre-warmed VM is stopped (0 keeps it running)
+PREWARM_LEAD_MIN = int(os.environ.get("GOOGLE_VM_PREWARM_LEAD", "10"))
+PREWARM_GRACE_MIN = int(os.environ.get("GOOGLE_VM_PREWARM_GRACE", "30"))
+
+# "auto" needs first starts on this many days of the same kind within the
+# last PREDICT_WINDOW_DAYS days before it predicts anything
+PREDICT_MIN_DAYS = 3
+PREDICT_WINDOW_DAYS = 28
+
+# Only a VM in one of these states is started by the scheduler
+# (a SUSPENDED VM is resumed, not started, and keeps its memory: left alone)
+STARTABLE_STATUSES = {'STOPPED', 'TERMINATED'}
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def parse_schedule(text):
+    """Parse "Mon-Fri 08:30", "Sat,Sun 10:00" or "08:30"
+
+    Returns (set of weekday numbers, minute of the day); raises ValueError.
+    """
+    fields = text.split()
+    if len(fields) not in (1, 2):
+        raise ValueError(f"Invalid pre-warm schedule '{text}', expected e.g. 'Mon-Fri 08:30'")
+    days = set(range(7))
+    if len(fields) == 2:
+        days = set()
+        for part in fields[0].lower().split(','):
+            first, _, last = part.partition('-')
+            try:
+                start = WEEKDAYS.index(first[:3])
+                end = WEEKDAYS.index(last[:3]) if last else start
+            except ValueError:
+                raise ValueError(f"Invalid day '{part}' in pre-warm schedule '{text}'") from None
+            day = start
+            days.add(day)
+            while day != end:
+                day = (day + 1) % 7
+                days.add(day)
+    try:
+        hour, minute = (int(value) for value in fields[-1].split(':'))
+    except ValueError:
+        raise ValueError(f"Invalid time '{fields[-1]}' in pre-warm schedule '{text}'") from None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid time '{fields[-1]}' in pre-warm schedule '{text}'")
+    return days, hour * 60 + minute
+
+
+def validate_prewarm(value):
+    """Check a 'prewarm' setting; empty, "off" and "auto" are always valid"""
+    if value and value.strip().lower() not in ("off", "auto"):
+        parse_schedule(value)
+
+
+def predict_first_use(runs, day, window_days=PREDICT_WINDOW_DAYS, min_days=PREDICT_MIN_DAYS):
+    """Usual minute of the day of the first start on days like `day`, or None
+
+    Only starts the user asked for count, not those of the scheduler itself.
+    """
+    workday = day.weekday() < 5
+    first_starts = {}
+    for run in runs:
+        if run.get('action') != 'start' or run.get('trigger', 'user') != 'user':
+            continue
+        started = datetime.datetime.fromtimestamp(run['started_at'])
+        date = started.date()
+        if not 0 < (day - date).days <= window_days or (date.weekday() < 5) != workday:
+            continue
+        minute = started.hour * 60 + started.minute
+        first_starts[date] = min(minute, first_starts.get(date, minute))
+    if len(first_starts) < min_days:
+        return None
+    return sorted(first_starts.values())[len(first_starts) // 2]
+
+
+class PrewarmState:
+    """Pre-warm bookkeeping shared between processes through a locked file"""
+
+    def __init__(self, path=PREWARM_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _update(self, change):
+        """Apply change(state) under the file lock and return its result"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".lock", 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with open(self.path, 'r') as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    state = {}
+                state.setdefault('fired', {})
+                state.setdefault('warmed', {})
+                result = change(state)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_path, self.path)
+        return result
+
+    def claim(self, key, date):
+        """Record that the VM is handled for date; False if it already was"""
+        def change(state):
+            name = "/".join(key)
+            if state['fired'].get(name) == date:
+                return False
+            state['fired'][name] = date
+            return True
+        return self._update(change)
+
+    def mark_warmed(self, key, expected):
+        self._update(lambda state: state['warmed'].__setitem__("/".join(key), expected))
+
+    def release(self, key):
+        """Forget a pre-warmed VM; True if it was one"""
+        return self._update(lambda state: state['warmed'].pop("/".join(key), None) is not None)
+
+    def take_expired(self, keys, deadline):
+        """Forget the VMs among keys whose expected use was before deadline
+
+        Returns {key: expected use} of the forgotten VMs; entries of other
+        VMs are kept.
+        """
+        def change(state):
+            taken = {}
+            for key in keys:
+                name = "/".join(key)
+                expected = state['warmed'].get(name)
+                if expected is not None and expected < deadline:
+                    taken[key] = state['warmed'].pop(name)
+            return taken
+        return self._update(change)
+
+
+class PrewarmPlanner:
+    """Decide which VMs to start ahead of time and which to stop again"""
+
+    def __init__(self, history, state=None, lead_min=PREWARM_LEAD_MIN, grace_min=PREWARM_GRACE_MIN):
+        self.history = history
+        self.state = state or PrewarmState()
+        self.lead = lead_min * 60
+        self.grace = grace_min * 60
+
+    def expected_use(self, vm_config, day):
+        """Expected time of first use of the VM on day, as a timestamp, or None"""
+        setting = (vm_config.get('prewarm') or '').strip()
+        if not setting or setting.lower() == 'off':
+            return None
+        if setting.lower() == 'auto':
+            minute = predict_first_use(self.history.load(vm_config), day)
+        else:
+            try:
+                days, minute = parse_schedule(setting)
+            except ValueError:
+                return None
+            if day.weekday() not in days:
+                minute = None
+        if minute is None:
+            return None
+        start_of_day = datetime.datetime.combine(day, datetime.time())
+        return (start_of_day + datetime.timedelta(minutes=minute)).timestamp()
+
+    def due_starts(self, vm_configs, status_of, now=None):
+        """Claim and return [(vm_config, expected)] of the VMs to start now
+
+        status_of(vm_config) returns the current status of a VM. A VM that is
+        already up is claimed for the day without being started, so it is
+        not stopped later either; one whose status is unknown is retried.
+        """
+        now = now or time.time()
+        today = datetime.date.fromtimestamp(now)
+        due = []
+        for vm in vm_configs:
+            expected = self.expected_use(vm, today)
+            if expected is None or not expected - self.lead <= now < expected:
+                continue
+            status = status_of(vm)
+            if status in (None, 'UNKNOWN', 'ERROR'):
+                continue
+            if self.state.claim(vm_key(vm), today.isoformat()) and status in STARTABLE_STATUSES:
+                due.append((vm, expected))
+        return due
+
+    def finish_start(self, vm_config, expected, exit_code):
+        if exit_code == 0:
+            self.state.mark_warmed(vm_key(vm_config), expected)
+
+    def note_use(self, key):
+        """An operation of the user on the VM: it is no longer only pre-warmed"""
+        self.state.release(key)
+
+    def due_stops(self, vm_configs, now=None):
+        """Take and return [(vm_config, expected)] of the VMs to stop now
+
+        Those are the pre-warmed VMs among vm_configs that nobody used within
+        the grace period; pre-warmed VMs not in vm_configs, e.g. because an
+        operation is running on them, stay recorded. A stop that cannot be
+        queued is handed back with stop_refused.
+        """
+        if self.grace <= 0:
+            return []
+        by_key = {vm_key(vm): vm for vm in vm_configs}
+        expired = self.state.take_expired(list(by_key), (now or time.time()) - self.grace)
+        return [(by_key[key], expected) for key, expected in expired.items()]
+
+    def stop_refused(self, vm_config, expected):
+        """A due stop could not be queued: try again on the next check"""
+        self.state.mark_warmed(vm_key(vm_config), expected)
@@ -0,0 +1,110 @@
+"""One place to run the external commands of the manager.
+
+Commands are run from argument vectors, never through a shell. The gcloud
+binary is looked up once per process (on PATH, in the usual install
+locations, and as a last resort through a login shell, which is how the
+desktop launcher used to find it), and every command gets the same prepared
+environment: gcloud's prompts, update checks, surveys and usage reporting
+are turned off, and PATH and GOOGLE_VM_GCLOUD point at the resolved gcloud
+so that google_vm_manager.sh uses it too. At most GCLOUD_MAX_PROCS gcloud
+processes of one manager process run at the same time; further calls wait.
+"""
+import os, shutil, subprocess, threading
+
+# gcloud settings that cost time on every call or could block on a prompt
+GCLOUD_ENV = {
+    'CLOUDSDK_CORE_DISABLE_PROMPTS': "1",
+    'CLOUDSDK_COMPONENT_MANAGER_DISABLE_UPDATE_CHECK': "1",
+    'CLOUDSDK_SURVEY_DISABLE_PROMPTS': "1",
+    'CLOUDSDK_CORE_DISABLE_USAGE_REPORTING': "1",
+}
+
+GCLOUD_MAX_PROCS = int(os.environ.get("GOOGLE_VM_GCLOUD_MAX_PROCS", "8"))
+
+# Where the Cloud SDK installers put gcloud, for when it is not on PATH
+GCLOUD_LOCATIONS = [
+    os.path.expanduser("~/google-cloud-sdk/bin/gcloud"),
+    "/usr/lib/google-cloud-sdk/bin/gcloud",
+    "/usr/local/google-cloud-sdk/bin/gcloud",
+    "/snap/bin/gcloud",
+]
+
+
+def find_gcloud():
+    """Full path of the gcloud binary, or None if it cannot be found"""
+    configured = os.environ.get("GOOGLE_VM_GCLOUD")
+    if configured and os.access(configured, os.X_OK):
+        return configured
+    found = shutil.which("gcloud")
+    if found:
+        return found
+    for path in GCLOUD_LOCATIONS:
+        if os.access(path, os.X_OK):
+            return path
+    try:
+        result = subprocess.run(["bash", "-lc", "command -v gcloud"], capture_output=True, text=True,
+                                timeout=10, stdin=subprocess.DEVNULL)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    path = result.stdout.strip()
+    return path if result.returncode == 0 and os.path.isabs(path) else None
+
+
+class CommandRunner:
+    """Run commands with the prepared environment, gcloud with a concurrency cap"""
+
+    def __init__(self, max_gcloud=GCLOUD_MAX_PROCS):
+        self._gcloud_slots = threading.BoundedSemaphore(max_gcloud)
+        self._env = None
+        self._gcloud = None
+        self._lock = threading.Lock()
+
+    def _prepare(self):
+        with self._lock:
+            if self._env is None:
+                self._gcloud = find_gcloud() or "gcloud"
+                env = dict(os.environ, **GCLOUD_ENV)
+                if os.path.isabs(self._gcloud):
+                    env['GOOGLE_VM_GCLOUD'] = self._gcloud
+                    gcloud_dir = os.path.dirname(self._gcloud)
+                    if gcloud_dir not in env.get('PATH', '').split(os.pathsep):
+                        env['PATH'] = os.pathsep.join(filter(None, [gcloud_dir, env.get('PATH')]))
+                self._env = env
+        return self._env
+
+    def env(self, **extra):
+        """The prepared environment, with extra variables added"""
+        env = self._prepare()
+        return dict(env, **extra) if extra else env
+
+    def argv(self, args):
+        """args with gcloud replaced by the resolved binary"""
+        self._prepare()
+        if args and args[0] == "gcloud":
+            return [self._gcloud] + list(args[1:])
+        return list(args)
+
+    def run(self, args, timeout=None, env=None):
+        """Run a command to completion and capture its output as text"""
+        argv = self.argv(args)
+        slots = self._gcloud_slots if args[0] == "gcloud" else None
+        if slots:
+            slots.acquire()
+        try:
+            return subprocess.run(argv, capture_output=True, text=True, timeout=timeout,
+                                  env=self.env(**(env or {})), stdin=subprocess.DEVNULL)
+        finally:
+            if slots:
+                slots.release()
+
+    def popen(self, args, env=None, **kwargs):
+        """Start a long-running command, e.g. google_vm_manager.sh
+
+        Not counted against the gcloud cap; the script's own gcloud calls are
+        bounded by the number of operations run in parallel.
+        """
+        return subprocess.Popen(self.argv(args), env=self.env(**(env or {})), **kwargs)
+
+
+# Shared by everything in the process
+runner = CommandRunner()
@@ -0,0 +1,127 @@
+"""Store for the configured VMs in vm_settings.json.
+
+The file keeps its format: a JSON list of VM configurations. The store
+holds them in memory, in file order, indexed by (project, zone, name), and
+only re-reads the file when it changed on disk. Writes go to a temporary
+file that is renamed over the original.
+
+Older versions allowed several entries for the same VM. Only the first one
+is managed; the others are kept in `duplicates` and written back after the
+managed entries, so that no configuration is lost without notice.
+"""
+import sys, os, json, threading
+
+from google_vm_status import vm_key
+
+
+class DuplicateVMError(ValueError):
+    pass
+
+
+class VMSettingsStore:
+    """Thread-safe, indexed view of a VM settings file"""
+
+    def __init__(self, path, configs=None, duplicates=None):
+        self.path = path
+        self._configs = {}  # vm_key -> config, in file order
+        self.duplicates = list(duplicates or [])
+        self._signature = None
+        self._lock = threading.Lock()
+        if configs is None:
+            self.reload()
+        else:
+            self.replace_all(configs)
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def reload(self):
+        """Re-read the file if it changed since the last load or save
+
+        Returns True when the configurations were re-read.
+        """
+        signature = self._file_signature()
+        if signature == self._signature and (signature is not None or not self._configs):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = []
+        except (OSError, ValueError):
+            # Half-written or broken file, keep what we have
+            return False
+        configs, duplicates = {}, []
+        for config in data if isinstance(data, list) else []:
+            try:
+                key = vm_key(config)
+            except (KeyError, TypeError):
+                continue
+            if key in configs:
+                duplicates.append(config)
+            else:
+                configs[key] = config
+        if duplicates:
+            names = ", ".join(sorted({"/".join(vm_key(config)) for config in duplicates}))
+            print(f"Warning: {self.path} configures these VMs more than once, only the first entry is used: {names}",
+                  file=sys.stderr)
+        with self._lock:
+            self._configs = configs
+            self.duplicates = duplicates
+            self._signature = signature
+        return True
+
+    def copy(self):
+        """Detached working copy, e.g. for a dialog that may be cancelled"""
+        return VMSettingsStore(self.path, self.all(), self.duplicates)
+
+    def all(self):
+        with self._lock:
+            return list(self._configs.values())
+
+    def get(self, key):
+        with self._lock:
+            return self._configs.get(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._configs)
+
+    def put(self, config, old_key=None):
+        """Add a VM, or replace the one stored under old_key in place
+
+        Raises DuplicateVMError if another entry already has the new key.
+        """
+        key = vm_key(config)
+        with self._lock:
+            if key != old_key and key in self._configs:
+                raise DuplicateVMError(f"VM '{config['name']}' in {config['zone']} ({config['project_id']}) is already configured")
+            if old_key is not None and old_key in self._configs and old_key != key:
+                self._configs = {
+                    (key if k == old_key else k): (config if k == old_key else v)
+                    for k, v in self._configs.items()
+                }
+            else:
+                self._configs[key] = config
+
+    def remove(self, key):
+        with self._lock:
+            return self._configs.pop(key, None)
+
+    def replace_all(self, configs):
+        with self._lock:
+            self._configs = {vm_key(config): config for config in configs}
+
+    def save(self):
+        """Write all configurations back, atomically, followed by the duplicates"""
+        configs = self.all() + self.duplicates
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(configs, f, indent=2)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._signature = self._file_signature()
@@ -0,0 +1,298 @@
+import os, json, subprocess, threading, time
+
+from google_vm_compute import CACHE_DIR, ComputeError, get_backend, call_with_retries
+from google_vm_metrics import registry
+
+# Seconds a fleet status entry stays valid before it has to be fetched again
+STATUS_TTL = 20
+
+# Last known status of every VM, shown on startup until live data arrives
+SNAPSHOT_FILE = os.path.join(CACHE_DIR, "status_snapshot.json")
+
+# Map status to colors
+STATUS_COLORS = {
+    'RUNNING': '#4CAF50',      # Green
+    'STOPPED': '#f44336',      # Red
+    'STOPPING': '#ff9800',     # Orange
+    'STARTING': '#2196F3',     # Blue
+    'STAGING': '#2196F3',      # Blue
+    'PROVISIONING': '#9C27B0', # Purple
+    'REPAIRING': '#ff5722',    # Deep Orange
+    'TERMINATED': '#607D8B'    # Blue Grey (truly terminated)
+}
+DEFAULT_COLOR = '#757575'  # Default grey
+
+# States a VM only passes through; while any VM is in one, poll quickly
+TRANSITIONAL_STATUSES = {'STARTING', 'STAGING', 'PROVISIONING', 'STOPPING', 'SUSPENDING', 'REPAIRING'}
+
+# Attempts per project listing when it fails with a transient error, and the
+# delay before the first retry in seconds (doubled for every further one)
+STATUS_ATTEMPTS = 3
+STATUS_RETRY_BACKOFF = 1.0
+
+# Placeholders for a status that could not be fetched
+UNRESOLVED_STATUSES = {'UNKNOWN', 'ERROR'}
+
+# Polling intervals in seconds
+FAST_POLL_INTERVAL = 2
+FAST_POLL_MAX_INTERVAL = 15
+STABLE_POLL_INTERVAL = 60
+
+
+def vm_key(vm_config):
+    """Identity of a configured VM: (project, zone, name)"""
+    return (vm_config['project_id'], vm_config['zone'], vm_config['name'])
+
+
+def format_age(seconds):
+    """Short human readable age, e.g. '3m ago'"""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s ago"
+    if seconds < 3600:
+        return f"{seconds // 60}m ago"
+    if seconds < 86400:
+        return f"{seconds // 3600}h ago"
+    return f"{seconds // 86400}d ago"
+
+
+def status_color(status):
+    return STATUS_COLORS.get(status, DEFAULT_COLOR)
+
+
+def normalize_status(status):
+    """Handle Google Cloud's inconsistent status reporting
+
+    A listed instance reported as TERMINATED is a stopped instance for all
+    practical purposes, so treat it as STOPPED.
+    """
+    if status == 'TERMINATED':
+        return 'STOPPED'
+    return status or 'UNKNOWN'
+
+
+def status_from_phase(action, kind, phase, result):
+    """Status implied by a phase event of a running operation, or None"""
+    if phase == 'vm_action':
+        if kind == 'start':
+            return 'STARTING' if action == 'start' else 'STOPPING'
+        if action == 'stop' and result == 'ok':
+            return 'STOPPED'
+    elif phase == 'instance_running' and kind == 'end' and result == 'ok':
+        return 'RUNNING'
+    return None
+
+
+class AdaptivePollPolicy:
+    """Pick the delay until the next fleet poll from the current statuses
+
+    While any VM is in a transitional state the fleet is polled quickly,
+    backing off from FAST_POLL_INTERVAL up to FAST_POLL_MAX_INTERVAL; once
+    everything is stable it drops to STABLE_POLL_INTERVAL.
+    """
+
+    def __init__(self, fast=FAST_POLL_INTERVAL, fast_max=FAST_POLL_MAX_INTERVAL,
+                 stable=STABLE_POLL_INTERVAL, backoff=2):
+        self.fast = fast
+        self.fast_max = fast_max
+        self.stable = stable
+        self.backoff = backoff
+        self._fast_polls = 0
+
+    def next_interval(self, statuses):
+        if any(status in TRANSITIONAL_STATUSES for status in statuses):
+            interval = min(self.fast * self.backoff ** self._fast_polls, self.fast_max)
+            self._fast_polls += 1
+            return interval
+        self._fast_polls = 0
+        return self.stable
+
+    def reset(self):
+        """Start over at the fast interval, e.g. when an operation begins"""
+        self._fast_polls = 0
+
+
+class StatusCache:
+    """Thread-safe, TTL-bounded status store shared by every view
+
+    Listeners added with add_listener() are called as listener(key, entry)
+    whenever the status or IP of a VM changes, or a VM gets its first live
+    entry. They run on the thread that stored the entry. Every entry carries
+    the time of its last observed status transition in 'changed' (None until
+    one has been seen).
+    """
+
+    def __init__(self, ttl=STATUS_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._snapshot = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def get(self, key):
+        """Return the entry for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.time() - entry['updated'] <= self.ttl:
+            return entry
+        return None
+
+    def get_stale(self, key):
+        """Return the newest known entry for key regardless of its age
+
+        Entries that only come from the on-disk snapshot are marked stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and key in self._snapshot:
+                entry = dict(self._snapshot[key], stale=True)
+        return entry
+
+    def put(self, key, status, ip=''):
+        now = time.time()
+        with self._lock:
+            current = self._entries.get(key)
+            previous = current or self._snapshot.get(key)
+            if previous is None:
+                changed = None
+            elif previous['status'] == status or UNRESOLVED_STATUSES & {previous['status'], status}:
+                # A failed lookup is not a transition of the VM itself
+                changed = previous.get('changed')
+            else:
+                changed = now
+            entry = {'status': status, 'ip': ip, 'updated': now, 'changed': changed}
+            self._entries[key] = entry
+        if current is None or current['status'] != status or current.get('ip', '') != ip:
+            for listener in list(self._listeners):
+                listener(key, entry)
+        return entry
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def load_snapshot(self, path=SNAPSHOT_FILE):
+        """Load the last known state written by save_snapshot"""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        snapshot = {}
+        for entry in data.get('vms', []):
+            try:
+                key = (entry['project_id'], entry['zone'], entry['name'])
+                snapshot[key] = {'status': entry['status'], 'ip': entry.get('ip', ''), 'updated': entry['updated'],
+                                 'changed': entry.get('changed')}
+            except KeyError:
+                continue
+        with self._lock:
+            self._snapshot = snapshot
+
+    def save_snapshot(self, path=SNAPSHOT_FILE):
+        """Persist the newest known state of every VM, atomically"""
+        with self._lock:
+            merged = dict(self._snapshot)
+            merged.update(self._entries)
+            self._snapshot = merged
+        vms = [
+            {'project_id': project_id, 'zone': zone, 'name': name,
+             'status': entry['status'], 'ip': entry.get('ip', ''), 'updated': entry['updated'],
+             'changed': entry.get('changed')}
+            for (project_id, zone, name), entry in merged.items()
+        ]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'vms': vms}, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+class FleetStatusService:
+    """Fetch the status of many VMs with one `instances list` call per project"""
+
+    def __init__(self, cache=None, backend=None, attempts=STATUS_ATTEMPTS, backoff=STATUS_RETRY_BACKOFF):
+        self.cache = cache or StatusCache()
+        self.backend = backend or get_backend()
+        self.attempts = attempts
+        self.backoff = backoff
+
+    def _refresh_project(self, project_id, vms, results, on_retry):
+        zones = {vm['zone'] for vm in vms}
+        names = {vm['name'] for vm in vms}
+
+        def report_retry(attempt, error, delay):
+            if on_retry:
+                on_retry(f"Status of project {project_id} failed ({error}), "
+                         f"retry {attempt}/{self.attempts - 1} in {delay:.0f}s")
+
+        try:
+            instances = call_with_retries(
+                self.backend.list_instances, project_id, zones, names,
+                attempts=self.attempts, backoff=self.backoff, on_retry=report_retry
+            )
+        except (ComputeError, subprocess.TimeoutExpired):
+            instances = None
+            fallback = 'UNKNOWN'
+        except Exception:
+            instances = None
+            fallback = 'ERROR'
+
+        for vm in vms:
+            key = vm_key(vm)
+            if instances is None:
+                # Reported for this refresh only: the cache keeps the last
+                # good entry, which the next refresh tries to replace
+                previous = self.cache.get_stale(key)
+                results[key] = {'status': fallback, 'ip': '', 'updated': time.time(),
+                                'changed': previous.get('changed') if previous else None}
+                continue
+            status, ip = instances.get((vm['zone'], vm['name']), ('UNKNOWN', ''))
+            results[key] = self.cache.put(key, normalize_status(status), ip)
+
+    def refresh(self, vm_configs, force=False, on_retry=None):
+        """Refresh the status of all given VMs and return {vm_key: entry}
+
+        Entries still fresh in the cache are reused unless force is set. The
+        remaining VMs are grouped by project and each project is listed once,
+        with the projects queried in parallel. on_retry(message) is called,
+        from the thread of the project, before a failed listing is retried.
+        """
+        started = time.perf_counter()
+        results = {}
+        by_project = {}
+        for vm in vm_configs:
+            key = vm_key(vm)
+            entry = None if force else self.cache.get(key)
+            if entry:
+                results[key] = entry
+            else:
+                by_project.setdefault(vm['project_id'], []).append(vm)
+        misses = sum(len(vms) for vms in by_project.values())
+        registry.inc('google_vm_status_cache_requests_total', len(results), result="hit")
+        registry.inc('google_vm_status_cache_requests_total', misses, result="bypass" if force else "miss")
+
+        threads = [
+            threading.Thread(target=self._refresh_project, args=(project_id, vms, results, on_retry), daemon=True)
+            for project_id, vms in by_project.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if threads:
+            registry.observe('google_vm_status_refresh_duration_seconds', time.perf_counter() - started)
+        return results
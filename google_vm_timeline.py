@@ -0,0 +1,168 @@
+"""Per-operation phase timelines and their per-VM history.
+
+google_vm_manager.sh reports the phases of an operation as structured lines
+(`@@PHASE start NAME MONO_MS` / `@@PHASE end NAME MONO_MS ok|fail`).
+OperationTimeline turns them into a timeline, and TimelineHistory keeps the
+recent timelines of every VM to derive latency percentiles.
+"""
+import os, json, threading, time
+
+from google_vm_compute import CACHE_DIR
+
+PHASE_PREFIX = "@@PHASE "
+HISTORY_DIR = os.path.join(CACHE_DIR, "history")
+HISTORY_MAX_RUNS = 50
+
+# Phases in the order the start flow runs them
+PHASE_LABELS = {
+    'vm_action': "Start/stop call",
+    'instance_running': "Instance RUNNING",
+    'external_ip': "External IP",
+    'ssh_config': "SSH config update",
+    'ssh_ready': "SSH ready",
+    'link_probe': "Link measurement",
+    'vnc_server': "VNC server",
+    'vnc_port': "VNC port open",
+    'vnc_client': "VNC client launch",
+}
+
+
+def parse_phase_event(line):
+    """Return (kind, phase, mono_ms, result) for a phase line, else None"""
+    if not line.startswith(PHASE_PREFIX):
+        return None
+    fields = line[len(PHASE_PREFIX):].split()
+    if len(fields) < 3 or fields[0] not in ("start", "end"):
+        return None
+    try:
+        mono_ms = int(fields[2])
+    except ValueError:
+        return None
+    result = fields[3] if len(fields) > 3 else None
+    return fields[0], fields[1], mono_ms, result
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def format_ms(ms):
+    return "-" if ms is None else f"{ms / 1000:.1f}s"
+
+
+class OperationTimeline:
+    """Collect the phase events of one operation"""
+
+    def __init__(self, action, no_vnc=False, trigger="user"):
+        self.action = action
+        self.no_vnc = no_vnc
+        self.trigger = trigger  # "user", or "prewarm" for scheduled operations
+        self.started_at = time.time()
+        self.started_mono = time.monotonic()
+        self.phases = []
+        self._open = {}
+        self._first_ms = None
+
+    def feed(self, line):
+        """Consume a phase line and return its event; None for ordinary output"""
+        event = parse_phase_event(line)
+        if not event:
+            return None
+        kind, phase, mono_ms, result = event
+        if self._first_ms is None:
+            self._first_ms = mono_ms
+        if kind == "start":
+            self._open[phase] = mono_ms
+        else:
+            start_ms = self._open.pop(phase, mono_ms)
+            self.phases.append({
+                'name': phase,
+                'offset_ms': start_ms - self._first_ms,
+                'ms': mono_ms - start_ms,
+                'result': result or 'ok',
+            })
+        return event
+
+    def finish(self, exit_code):
+        """Return the record stored in the history"""
+        time_to_desktop = None
+        if exit_code == 0 and self.action == "start" and not self.no_vnc:
+            for phase in self.phases:
+                if phase['name'] == 'vnc_client':
+                    time_to_desktop = phase['offset_ms'] + phase['ms']
+        return {
+            'action': self.action,
+            'vnc': not self.no_vnc,
+            'trigger': self.trigger,
+            'started_at': self.started_at,
+            'exit_code': exit_code,
+            'total_ms': int((time.monotonic() - self.started_mono) * 1000),
+            'time_to_desktop_ms': time_to_desktop,
+            'phases': self.phases,
+        }
+
+    def summary(self):
+        return ", ".join(
+            f"{PHASE_LABELS.get(p['name'], p['name'])} {format_ms(p['ms'])}"
+            + ("" if p['result'] == 'ok' else " (failed)")
+            for p in self.phases
+        )
+
+
+class TimelineHistory:
+    """Recent operation timelines, one JSON file per VM"""
+
+    def __init__(self, directory=HISTORY_DIR, max_runs=HISTORY_MAX_RUNS):
+        self.directory = directory
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+
+    def _path(self, vm_config):
+        name = f"{vm_config['project_id']}__{vm_config['zone']}__{vm_config['name']}.json"
+        return os.path.join(self.directory, name)
+
+    def load(self, vm_config):
+        try:
+            with open(self._path(vm_config), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def append(self, vm_config, record):
+        with self._lock:
+            runs = (self.load(vm_config) + [record])[-self.max_runs:]
+            path = self._path(vm_config)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path + ".tmp", 'w') as f:
+                    json.dump(runs, f)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                pass
+
+    def stats(self, vm_config, action="start"):
+        """p50/p95 per phase and for time-to-desktop over the recent successful runs"""
+        runs = [r for r in self.load(vm_config) if r.get('action') == action and r.get('exit_code') == 0]
+        by_phase = {}
+        for run in runs:
+            for phase in run.get('phases', []):
+                by_phase.setdefault(phase['name'], []).append(phase['ms'])
+        ordered = [name for name in PHASE_LABELS if name in by_phase]
+        ordered += sorted(name for name in by_phase if name not in PHASE_LABELS)
+        desktop = [r['time_to_desktop_ms'] for r in runs if r.get('time_to_desktop_ms') is not None]
+        return {
+            'runs': len(runs),
+            'phases': [
+                {'name': name, 'label': PHASE_LABELS.get(name, name),
+                 'p50': percentile(by_phase[name], 50), 'p95': percentile(by_phase[name], 95)}
+                for name in ordered
+            ],
+            'time_to_desktop': {
+                'runs': len(desktop), 'p50': percentile(desktop, 50), 'p95': percentile(desktop, 95)
+            },
+        }
@@ -0,0 +1,128 @@
+"""Catalog of Compute Engine zones, cached on disk per project.
+
+Listing zones takes seconds, so the catalog answers from CACHE_DIR/zones.json
+and only asks the backend again once a project's entry is older than
+ZONE_CACHE_TTL. Until a project has been listed, the built-in DEFAULT_ZONES
+list is used.
+"""
+import os, json, subprocess, threading, time
+
+from google_vm_compute import CACHE_DIR, ComputeError, get_backend
+
+ZONE_CACHE_FILE = os.path.join(CACHE_DIR, "zones.json")
+
+# Zones rarely change, so a day-old list is good enough
+ZONE_CACHE_TTL = 24 * 3600
+
+# Used until the live list of a project has been fetched
+DEFAULT_ZONES = [
+    "us-central1-a", "us-central1-b", "us-central1-c", "us-central1-f",
+    "us-east1-a", "us-east1-b", "us-east1-c", "us-east1-d",
+    "us-east4-a", "us-east4-b", "us-east4-c",
+    "us-west1-a", "us-west1-b", "us-west1-c",
+    "us-west2-a", "us-west2-b", "us-west2-c",
+    "us-west3-a", "us-west3-b", "us-west3-c",
+    "us-west4-a", "us-west4-b", "us-west4-c",
+    "europe-central2-a", "europe-central2-b", "europe-central2-c",
+    "europe-north1-a", "europe-north1-b", "europe-north1-c",
+    "europe-west1-b", "europe-west1-c", "europe-west1-d",
+    "europe-west2-a", "europe-west2-b", "europe-west2-c",
+    "europe-west3-a", "europe-west3-b", "europe-west3-c",
+    "europe-west4-a", "europe-west4-b", "europe-west4-c",
+    "europe-west6-a", "europe-west6-b", "europe-west6-c",
+    "europe-west8-a", "europe-west8-b", "europe-west8-c",
+    "europe-west9-a", "europe-west9-b", "europe-west9-c",
+    "asia-east1-a", "asia-east1-b", "asia-east1-c",
+    "asia-east2-a", "asia-east2-b", "asia-east2-c",
+    "asia-northeast1-a", "asia-northeast1-b", "asia-northeast1-c",
+    "asia-northeast2-a", "asia-northeast2-b", "asia-northeast2-c",
+    "asia-northeast3-a", "asia-northeast3-b", "asia-northeast3-c",
+    "asia-south1-a", "asia-south1-b", "asia-south1-c",
+    "asia-south2-a", "asia-south2-b", "asia-south2-c",
+    "asia-southeast1-a", "asia-southeast1-b", "asia-southeast1-c",
+    "asia-southeast2-a", "asia-southeast2-b", "asia-southeast2-c",
+    "australia-southeast1-a", "australia-southeast1-b", "australia-southeast1-c",
+    "australia-southeast2-a", "australia-southeast2-b", "australia-southeast2-c",
+    "southamerica-east1-a", "southamerica-east1-b", "southamerica-east1-c",
+    "southamerica-west1-a", "southamerica-west1-b", "southamerica-west1-c",
+    "northamerica-northeast1-a", "northamerica-northeast1-b", "northamerica-northeast1-c",
+    "northamerica-northeast2-a", "northamerica-northeast2-b", "northamerica-northeast2-c"
+]
+
+
+class ZoneCatalog:
+    """Thread-safe store of the zones available to each project"""
+
+    def __init__(self, path=ZONE_CACHE_FILE, ttl=ZONE_CACHE_TTL, backend=None):
+        self.path = path
+        self.ttl = ttl
+        self.backend = backend
+        self._projects = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        projects = {}
+        for project_id, entry in data.get('projects', {}).items():
+            if isinstance(entry, dict) and isinstance(entry.get('zones'), list):
+                projects[project_id] = {'zones': entry['zones'], 'updated': entry.get('updated', 0)}
+        with self._lock:
+            self._projects = projects
+
+    def _save(self):
+        with self._lock:
+            data = {'projects': dict(self._projects)}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def zones(self, project_id=None):
+        """Return the best known zone list, without touching the network
+
+        With a project, that project's cached zones are returned. Without
+        one, or for a project that was never listed, the union of every
+        cached project's zones is returned, falling back to DEFAULT_ZONES.
+        """
+        with self._lock:
+            entry = self._projects.get(project_id) if project_id else None
+            if entry:
+                return list(entry['zones'])
+            known = set()
+            for cached in self._projects.values():
+                known.update(cached['zones'])
+        return sorted(known) if known else list(DEFAULT_ZONES)
+
+    def is_fresh(self, project_id):
+        with self._lock:
+            entry = self._projects.get(project_id)
+        return bool(entry) and time.time() - entry['updated'] <= self.ttl
+
+    def refresh(self, project_id, force=False):
+        """Fetch the zones of a project unless the cached list is still fresh
+
+        Returns the zone list. On a failed lookup the cached or default list
+        is returned and the cache is left as it was.
+        """
+        if not force and self.is_fresh(project_id):
+            return self.zones(project_id)
+        backend = self.backend or get_backend()
+        try:
+            zones = backend.list_zones(project_id)
+        except (ComputeError, OSError, subprocess.TimeoutExpired):
+            return self.zones(project_id)
+        if not zones:
+            return self.zones(project_id)
+        with self._lock:
+            self._projects[project_id] = {'zones': zones, 'updated': time.time()}
+        self._save()
+        return list(zones)
@@ -0,0 +1,38 @@
+import os, sys, json, shutil
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+FAKE_TOOLS = os.path.join(REPO_DIR, "benchmarks", "fake_tools.py")
+
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    """A copy of the app with the simulated tools of the benchmarks on PATH
+
+    The fleet holds one stopped VM, bench-vm (project bench-project, zone
+    europe-west1-b). Returns a dict with the app and home directories and
+    the environment to run google_vm_manager.sh with.
+    """
+    bin_dir, state_dir, home_dir, app_dir = (tmp_path / d for d in ("bin", "state", "home", "app"))
+    for directory in (bin_dir, state_dir, home_dir, app_dir):
+        directory.mkdir()
+    for tool in ("gcloud", "ssh", "nc", "remmina"):
+        path = bin_dir / tool
+        path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOLS}" {tool} "$@"\n')
+        path.chmod(0o755)
+    (state_dir / "fleet.json").write_text(json.dumps([{
+        'name': "bench-vm", 'project': "bench-project", 'zone': "europe-west1-b",
+        'status': "TERMINATED", 'ip': "10.0.0.1",
+    }]))
+    for name in os.listdir(REPO_DIR):
+        if name.startswith("google_vm_") and name.endswith((".py", ".sh")):
+            shutil.copy2(os.path.join(REPO_DIR, name), app_dir)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", HOME=str(home_dir),
+               XDG_CACHE_HOME=str(tmp_path / "cache"), BENCH_STATE_DIR=str(state_dir),
+               GOOGLE_VM_BACKEND="gcloud", GOOGLE_VM_RETRY_BACKOFF_MS="10")
+    env.pop("GOOGLE_VM_GCLOUD", None)
+    return {'app': app_dir, 'home': home_dir, 'env': env}
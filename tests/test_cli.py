@@ -0,0 +1,34 @@
+import os, sys, json, signal, subprocess
+
+from google_vm_cli import handle_request
+
+
+class BrokenManager:
+    def list_vms(self, text=None):
+        raise OSError("Permission denied: 'vm_settings.json'")
+
+    def status(self, refs=None, force=False, warnings=None):
+        raise RuntimeError("boom")
+
+
+def test_unexpected_errors_are_serialized():
+    assert handle_request(BrokenManager(), {'cmd': "list"}) == {
+        'ok': False, 'error': "OSError: Permission denied: 'vm_settings.json'"}
+    assert handle_request(BrokenManager(), {'cmd': "status"}) == {'ok': False, 'error': "RuntimeError: boom"}
+
+
+def test_sigterm_stops_the_daemon(sandbox, tmp_path):
+    socket_path = str(tmp_path / "run" / "daemon.sock")
+    env = dict(sandbox['env'], GOOGLE_VM_METRICS_PORT="0")
+    daemon = subprocess.Popen([sys.executable, str(sandbox['app'] / "google_vm_cli.py"), "--socket", socket_path,
+                               "daemon"], env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        started = json.loads(daemon.stdout.readline())
+        assert started['ok'] and os.path.exists(socket_path)
+        daemon.send_signal(signal.SIGTERM)
+        assert daemon.wait(timeout=10) == 0
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+            daemon.wait()
+    assert not os.path.exists(socket_path)
@@ -0,0 +1,57 @@
+from google_vm_discovery import plan_import, apply_import, ADD, UPDATE, UNCHANGED, MISSING
+from google_vm_settings import VMSettingsStore
+from google_vm_status import vm_key
+
+DEFAULTS = {'ssh_key_path': "~/.ssh/team_key", 'ssh_username': "team", 'prewarm': "08:30"}
+
+
+def vm(name, project="project", zone="europe-west1-b", **extra):
+    return dict({'name': name, 'zone': zone, 'project_id': project}, **extra)
+
+
+def instance(name, project="project", status="RUNNING"):
+    return dict(vm(name, project), status=status)
+
+
+def test_plan_import():
+    configs = [
+        vm("keyed", ssh_key_path="~/.ssh/own_key", ssh_username="me"),
+        vm("bare"),
+        vm("gone"),
+        vm("elsewhere", project="unlisted"),
+        vm("failed", project="broken"),
+    ]
+    discovered = {
+        'project': {'instances': [instance("keyed"), instance("bare"), instance("new", status="STOPPED")]},
+        'broken': {'instances': [], 'error': "permission denied"},
+    }
+
+    changes = {change['key'][2]: change for change in plan_import(discovered, configs, DEFAULTS)}
+
+    assert {name: change['action'] for name, change in changes.items()} == {
+        'keyed': UNCHANGED, 'bare': UPDATE, 'new': ADD, 'gone': MISSING,
+    }
+    # Defaults only fill fields without a value, and only the SSH settings
+    assert changes['keyed']['config'] == configs[0]
+    assert changes['bare']['config'] == vm("bare", ssh_key_path="~/.ssh/team_key", ssh_username="team")
+    assert changes['new']['config'] == vm("new", ssh_key_path="~/.ssh/team_key", ssh_username="team")
+    assert changes['new']['status'] == "STOPPED"
+    assert changes['gone']['status'] is None
+
+
+def test_apply_import(tmp_path):
+    store = VMSettingsStore(str(tmp_path / "vm_settings.json"), [vm("bare"), vm("gone"), vm("kept")])
+    discovered = {'project': {'instances': [instance("bare"), instance("kept", status="TERMINATED"),
+                                            instance("new")]}}
+    changes = plan_import(discovered, store.all(), {'ssh_username': "team"})
+
+    counts = apply_import(store, [change for change in changes if change['key'] != vm_key(vm("gone"))])
+
+    assert counts == {ADD: 1, UPDATE: 2, MISSING: 0}
+    assert [config['name'] for config in store.all()] == ["bare", "gone", "kept", "new"]
+    assert all(config.get('ssh_username') == "team" for config in store.all() if config['name'] != "gone")
+
+    counts = apply_import(store, [change for change in changes if change['action'] == MISSING])
+
+    assert counts == {ADD: 0, UPDATE: 0, MISSING: 1}
+    assert store.get(vm_key(vm("gone"))) is None
@@ -0,0 +1,106 @@
+import json, subprocess, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+from google_vm_compute import RestBackend, AccessTokenProvider
+
+
+class StubCompute(ThreadingHTTPServer):
+    """Compute Engine API stub: one instance, paged aggregated lists"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.status = "TERMINATED"
+        self.requests = []
+        self.connections = 0
+        self.page_size = 2
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/compute/v1"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        self.server.requests.append(("GET", url.path, query))
+        if url.path.endswith("/aggregated/instances"):
+            names = [f"vm-{i}" for i in range(5)]
+            page = int(query.get('pageToken', ["0"])[0])
+            chunk = names[page:page + self.server.page_size]
+            payload = {'items': {'zones/z1': {'instances': [
+                {'name': name, 'zone': ".../zones/z1", 'status': "RUNNING",
+                 'networkInterfaces': [{'accessConfigs': [{'natIP': f"10.0.0.{i}"}]}]}
+                for i, name in enumerate(chunk, page)
+            ]}}}
+            if page + self.server.page_size < len(names):
+                payload['nextPageToken'] = str(page + self.server.page_size)
+            return self.reply(payload)
+        ip = [{'accessConfigs': [{'natIP': "10.0.0.9"}]}] if self.server.status == "RUNNING" else []
+        self.reply({'name': "vm", 'status': self.server.status, 'networkInterfaces': ip})
+
+    def do_POST(self):
+        self.server.requests.append(("POST", self.path, {}))
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.endswith("/start"):
+            self.server.status = "RUNNING"
+        elif self.path.endswith("/stop"):
+            self.server.status = "TERMINATED"
+        self.reply({'name': "op-1", 'status': "DONE"})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = StubCompute()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_list_instances_pages_and_filters_locally(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_VM_ACCESS_TOKEN", "token")
+    backend = RestBackend(stub.endpoint, AccessTokenProvider(str(tmp_path / "token.json")))
+
+    instances = backend.list_instances("project", {"z1"}, {"vm-1", "vm-4"})
+
+    assert instances == {("z1", "vm-1"): ("RUNNING", "10.0.0.1"), ("z1", "vm-4"): ("RUNNING", "10.0.0.4")}
+    lists = [query for method, path, query in stub.requests if path.endswith("/aggregated/instances")]
+    assert len(lists) == 3
+    assert all('filter' not in query for query in lists)
+
+
+def test_script_uses_one_compute_process(stub, sandbox):
+    env = dict(sandbox['env'], GOOGLE_VM_BACKEND="rest", GOOGLE_VM_COMPUTE_ENDPOINT=stub.endpoint,
+               GOOGLE_VM_ACCESS_TOKEN="token", GOOGLE_VM_PROBE_INITIAL_MS="50")
+    result = subprocess.run(
+        [str(sandbox['app'] / "google_vm_manager.sh"), "start", "bench-vm", "europe-west1-b", "bench-project",
+         "1920x1080", "~/.ssh/bench_key", "bench", "--no-vnc"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "VM external IP: 10.0.0.9" in result.stdout
+    assert [path.rsplit("/", 1)[-1] for method, path, _ in stub.requests if method == "POST"] == ["start"]
+    assert len(stub.requests) >= 2
+    # All calls of the run went over the keep-alive connection of one process
+    assert stub.connections == 1
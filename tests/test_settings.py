@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from google_vm_settings import VMSettingsStore, DuplicateVMError
+from google_vm_status import vm_key
+
+
+def vm(name, zone="europe-west1-b", project="project", **extra):
+    return dict({'name': name, 'zone': zone, 'project_id': project}, **extra)
+
+
+def test_put_adds_and_replaces_in_place(tmp_path):
+    store = VMSettingsStore(str(tmp_path / "vm_settings.json"), [vm("a"), vm("b"), vm("c")])
+
+    store.put(vm("b2", ssh_username="me"), old_key=vm_key(vm("b")))
+    store.put(vm("d"))
+
+    assert [config['name'] for config in store.all()] == ["a", "b2", "c", "d"]
+    assert store.get(vm_key(vm("b2")))['ssh_username'] == "me"
+    assert store.get(vm_key(vm("b"))) is None
+
+
+def test_put_refuses_duplicates(tmp_path):
+    store = VMSettingsStore(str(tmp_path / "vm_settings.json"), [vm("a"), vm("b")])
+    with pytest.raises(DuplicateVMError):
+        store.put(vm("a"))
+    with pytest.raises(DuplicateVMError):
+        store.put(vm("a"), old_key=vm_key(vm("b")))
+    # Same name in another zone is another VM
+    store.put(vm("a", zone="us-central1-a"))
+    assert len(store) == 3
+
+
+def test_reload_only_when_the_file_changed(tmp_path):
+    path = tmp_path / "vm_settings.json"
+    path.write_text(json.dumps([vm("a")]))
+    store = VMSettingsStore(str(path))
+    assert not store.reload()
+
+    other = VMSettingsStore(str(path))
+    other.put(vm("b"))
+    other.save()
+
+    assert store.reload()
+    assert [config['name'] for config in store.all()] == ["a", "b"]
+    assert json.loads(path.read_text()) == [vm("a"), vm("b")]
+
+
+def test_duplicates_are_kept_on_save(tmp_path, capsys):
+    path = tmp_path / "vm_settings.json"
+    path.write_text(json.dumps([vm("a", ssh_username="first"), vm("b"), vm("a", ssh_username="second")]))
+
+    store = VMSettingsStore(str(path))
+    assert store.get(vm_key(vm("a")))['ssh_username'] == "first"
+    assert store.duplicates == [vm("a", ssh_username="second")]
+    assert "more than once" in capsys.readouterr().err
+
+    working_copy = store.copy()
+    working_copy.put(vm("c"))
+    working_copy.save()
+
+    assert json.loads(path.read_text()) == [
+        vm("a", ssh_username="first"), vm("b"), vm("c"), vm("a", ssh_username="second")
+    ]
@@ -0,0 +1,39 @@
+import os, stat, subprocess
+
+
+def start_without_vnc(sandbox):
+    return subprocess.run(
+        [str(sandbox['app'] / "google_vm_manager.sh"), "start", "bench-vm", "europe-west1-b", "bench-project",
+         "1920x1080", "~/.ssh/bench_key", "bench", "--no-vnc"],
+        env=sandbox['env'], capture_output=True, text=True, timeout=60,
+    )
+
+
+def test_creates_missing_ssh_config(sandbox):
+    ssh_dir = sandbox['home'] / ".ssh"
+    ssh_dir.mkdir(mode=0o700)
+
+    result = start_without_vnc(sandbox)
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Could not update SSH config" not in result.stdout
+    config = ssh_dir / "config"
+    managed = ssh_dir / "config.d" / "google-vm-manager"
+    assert config.read_text().splitlines()[0] == f"Include {managed}"
+    assert stat.S_IMODE(config.stat().st_mode) == 0o600
+    assert "Host bench-vm\n    HostName 10.0.0.1\n" in managed.read_text()
+    assert not [name for name in os.listdir(ssh_dir) if ".tmp." in name]
+
+
+def test_keeps_existing_ssh_config(sandbox):
+    ssh_dir = sandbox['home'] / ".ssh"
+    ssh_dir.mkdir(mode=0o700)
+    (ssh_dir / "config").write_text("Host other\n    HostName example.org\n")
+
+    assert start_without_vnc(sandbox).returncode == 0
+    assert start_without_vnc(sandbox).returncode == 0
+
+    lines = (ssh_dir / "config").read_text().splitlines()
+    assert lines[0].startswith("Include ")
+    assert sum(line.startswith("Include ") for line in lines) == 1
+    assert lines[2:] == ["Host other", "    HostName example.org"]
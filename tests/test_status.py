@@ -0,0 +1,106 @@
+from google_vm_compute import ComputeError
+from google_vm_status import StatusCache, FleetStatusService, AdaptivePollPolicy, vm_key
+
+VM = {'name': "vm", 'zone': "europe-west1-b", 'project_id': "project"}
+KEY = vm_key(VM)
+
+
+class FakeBackend:
+    def __init__(self, instances=None, error=None):
+        self.instances = instances or {}
+        self.error = error
+        self.calls = 0
+
+    def list_instances(self, project_id, zones, names):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.instances
+
+
+def test_put_notifies_on_change_only():
+    cache = StatusCache()
+    seen = []
+    cache.add_listener(lambda key, entry: seen.append((key, entry['status'], entry['ip'])))
+
+    cache.put(KEY, "RUNNING", "10.0.0.1")
+    cache.put(KEY, "RUNNING", "10.0.0.1")
+    cache.put(KEY, "RUNNING", "10.0.0.2")
+    cache.put(KEY, "STOPPING", "10.0.0.2")
+
+    assert seen == [(KEY, "RUNNING", "10.0.0.1"), (KEY, "RUNNING", "10.0.0.2"), (KEY, "STOPPING", "10.0.0.2")]
+
+
+def test_put_records_transitions():
+    cache = StatusCache()
+    assert cache.put(KEY, "RUNNING")['changed'] is None
+    assert cache.put(KEY, "RUNNING")['changed'] is None
+    changed = cache.put(KEY, "STOPPED")['changed']
+    assert changed is not None
+    # A failed lookup is not a transition of the VM
+    assert cache.put(KEY, "UNKNOWN")['changed'] == changed
+    assert cache.put(KEY, "STOPPED")['changed'] == changed
+
+
+def test_get_honours_ttl():
+    cache = StatusCache(ttl=0)
+    cache.put(KEY, "RUNNING")
+    cache._entries[KEY]['updated'] -= 1
+    assert cache.get(KEY) is None
+    assert cache.get_stale(KEY)['status'] == "RUNNING"
+
+
+def test_refresh_lists_each_project_once_and_uses_the_cache():
+    backend = FakeBackend({("europe-west1-b", "vm"): ("TERMINATED", "")})
+    service = FleetStatusService(StatusCache(), backend, attempts=1)
+    other = dict(VM, name="other")
+
+    results = service.refresh([VM, other])
+
+    assert backend.calls == 1
+    assert results[KEY]['status'] == "STOPPED"
+    assert results[vm_key(other)]['status'] == "UNKNOWN"
+    service.refresh([VM, other])
+    assert backend.calls == 1
+
+
+def test_failed_listing_keeps_the_last_good_entry():
+    backend = FakeBackend({("europe-west1-b", "vm"): ("RUNNING", "10.0.0.1")})
+    service = FleetStatusService(StatusCache(), backend, attempts=1)
+    service.refresh([VM])
+    backend.error = ComputeError("ERROR: (gcloud.compute.instances.list) permission denied")
+
+    results = service.refresh([VM], force=True)
+
+    assert results[KEY]['status'] == "UNKNOWN"
+    assert service.cache.get(KEY)['status'] == "RUNNING"
+    assert service.cache.get(KEY)['ip'] == "10.0.0.1"
+
+
+def test_retries_are_reported_to_the_caller():
+    backend = FakeBackend(error=ComputeError("HTTP 429: rateLimitExceeded"))
+    service = FleetStatusService(StatusCache(), backend, attempts=2, backoff=0)
+    messages = []
+
+    results = service.refresh([VM], on_retry=messages.append)
+
+    assert backend.calls == 2
+    assert results[KEY]['status'] == "UNKNOWN"
+    assert messages == ["Status of project project failed (HTTP 429: rateLimitExceeded), retry 1/1 in 0s"]
+
+
+def test_poll_policy_backs_off_while_transitional():
+    policy = AdaptivePollPolicy(fast=2, fast_max=15, stable=60, backoff=2)
+    intervals = [policy.next_interval(["RUNNING", "STAGING"]) for _ in range(5)]
+    assert intervals == [2, 4, 8, 15, 15]
+
+
+def test_poll_policy_drops_to_stable_and_resets():
+    policy = AdaptivePollPolicy(fast=2, fast_max=15, stable=60, backoff=2)
+    policy.next_interval(["STOPPING"])
+    policy.next_interval(["STOPPING"])
+    assert policy.next_interval(["STOPPED", "RUNNING"]) == 60
+    assert policy.next_interval(["STOPPING"]) == 2
+    policy.next_interval(["STOPPING"])
+    policy.reset()
+    assert policy.next_interval(["STARTING"]) == 2
@@ -0,0 +1,72 @@
+import os, sys, subprocess
+
+import pytest
+
+from conftest import REPO_DIR
+from google_vm_compute import TRANSIENT_ERROR_PATTERN, ComputeError, is_transient, call_with_retries
+
+# Errors as gcloud prints them
+TRANSIENT = [
+    "ERROR: (gcloud.compute.instances.start) Could not fetch resource:\n - Rate Limit Exceeded",
+    "ERROR: (gcloud.compute.instances.list) Some requests did not succeed:\n"
+    " - Quota exceeded for quota metric 'Read requests' and limit 'Read requests per minute'"
+    " of service 'compute.googleapis.com' for consumer 'project_number:123456'.",
+    "ERROR: (gcloud.compute.instances.start) Could not fetch resource:\n"
+    " - The zone 'projects/p/zones/us-central1-a' does not have enough resources available"
+    " to fulfill the request.  Try a different zone, or try again later.",
+    "ERROR: (gcloud.compute.instances.describe) There was a problem refreshing your current"
+    " auth tokens: ('Connection aborted.', ConnectionResetError(104, 'Connection reset by peer'))",
+    "ERROR: (gcloud.compute.instances.stop) HTTPError 503: Service Unavailable",
+    # and as the REST API reports them
+    "HTTP 429: rateLimitExceeded",
+]
+
+PERMANENT = [
+    "ERROR: (gcloud.compute.instances.start) Could not fetch resource:\n"
+    " - Quota 'CPUS' exceeded.  Limit: 8.0 in region us-central1.",
+    "ERROR: (gcloud.compute.instances.describe) Could not fetch resource:\n"
+    " - The resource 'projects/p/zones/z/instances/v' was not found",
+    "ERROR: (gcloud.compute.instances.start) Could not fetch resource:\n - Required 'compute.instances.start'"
+    " permission for 'projects/p/zones/z/instances/v'",
+]
+
+
+@pytest.mark.parametrize("message", TRANSIENT)
+def test_transient(message):
+    assert is_transient(ComputeError(message))
+
+
+@pytest.mark.parametrize("message", PERMANENT)
+def test_permanent(message):
+    assert not is_transient(ComputeError(message))
+
+
+def test_call_with_retries_retries_rate_limits():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ComputeError(TRANSIENT[0])
+        return "ok"
+
+    assert call_with_retries(flaky, attempts=3, backoff=0) == "ok"
+    assert len(calls) == 3
+
+
+def test_pattern_is_served_to_the_script():
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, "google_vm_compute.py"), "transient-pattern"],
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0
+    assert result.stdout == TRANSIENT_ERROR_PATTERN + "\n"
+
+
+def test_script_retries_rate_limits(sandbox):
+    env = dict(sandbox['env'], BENCH_FAILURE_RATE="1", GOOGLE_VM_RETRIES="2")
+    result = subprocess.run(
+        [str(sandbox['app'] / "google_vm_manager.sh"), "stop", "bench-vm", "europe-west1-b", "bench-project"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode != 0
+    assert "VM stop: Rate Limit Exceeded, retry 1/2" in result.stdout
+    assert "VM stop: Rate Limit Exceeded, retry 2/2" in result.stdout
@@ -0,0 +1,49 @@
+import os, json, subprocess
+
+import pytest
+
+
+def start_with_vnc(sandbox, transport):
+    env = dict(sandbox['env'], GOOGLE_VM_VNC_TRANSPORT=transport, GOOGLE_VM_VNC_PRESET="good")
+    return subprocess.run(
+        [str(sandbox['app'] / "google_vm_manager.sh"), "start", "bench-vm", "europe-west1-b", "bench-project",
+         "1920x1080", "~/.ssh/bench_key", "bench"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+
+
+def calls(sandbox, tool):
+    with open(os.path.join(sandbox['env']['BENCH_STATE_DIR'], "calls.log")) as f:
+        return [call['args'] for call in map(json.loads, f) if call['tool'] == tool]
+
+
+def remmina_server(sandbox):
+    with open(sandbox['app'] / "bench-vm_dynamic.remmina") as f:
+        return next(line.split("=", 1)[1].strip() for line in f if line.startswith("server="))
+
+
+def test_ssh_transport_keeps_vnc_on_localhost(sandbox):
+    result = start_with_vnc(sandbox, "ssh")
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert any("-localhost yes" in args[-1] for args in calls(sandbox, "ssh") if "vncserver :" in args[-1])
+    # Readiness is probed on the VM, never on its external address
+    assert not [args for args in calls(sandbox, "nc") if args[-2] == "10.0.0.1" and args[-1] != "22"]
+    assert remmina_server(sandbox).startswith("127.0.0.1:")
+
+
+@pytest.mark.parametrize("first, second", [("direct", "ssh"), ("ssh", "direct")])
+def test_switching_transport_restarts_the_session(sandbox, first, second):
+    assert start_with_vnc(sandbox, first).returncode == 0
+    result = start_with_vnc(sandbox, second)
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Restarting VNC session" in result.stdout
+
+
+def test_direct_transport_is_unchanged(sandbox):
+    result = start_with_vnc(sandbox, "direct")
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert any("-localhost no" in args[-1] for args in calls(sandbox, "ssh") if "vncserver :" in args[-1])
+    assert remmina_server(sandbox) == "10.0.0.1:5901"